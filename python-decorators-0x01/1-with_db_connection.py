@@ -1,11 +1,28 @@
 import sqlite3 
 import functools
 
-def with_db_connection(func):
-    """Decorator to handle opening and closing DB connection."""
+import db_pool
+
+DB_FILE = "users.db"
+
+def with_db_connection(func=None, *, pooled=False):
+    """
+    Decorator to handle opening and closing DB connection.
+
+    With @with_db_connection(pooled=True) the connection is checked out
+    of db_pool's shared pool for DB_FILE and returned to it instead,
+    which skips opening the file and warming its page cache on every
+    call.
+    """
+    if func is None:
+        return functools.partial(with_db_connection, pooled=pooled)
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = sqlite3.connect("users.db") 
+        if pooled:
+            with db_pool.get_pool(DB_FILE).connection() as conn:
+                return func(conn, *args, **kwargs)
+        conn = sqlite3.connect(DB_FILE) 
         try:
             result = func(conn, *args, **kwargs) 
         finally:
@@ -19,7 +36,8 @@ def get_user_by_id(conn, user_id):
     cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,)) 
     return cursor.fetchone() 
 
-#### Fetch user by ID with automatic connection handling 
+if __name__ == "__main__":
+    #### Fetch user by ID with automatic connection handling 
 
-user = get_user_by_id(user_id=1)
-print(user)
\ No newline at end of file
+    user = get_user_by_id(user_id=1)
+    print(user)
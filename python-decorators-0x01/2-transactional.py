@@ -1,11 +1,17 @@
 import sqlite3 
 import functools
 
+import cache_engine
+
+# Same file as 1-with_db_connection and 4-cache_query, so writes made
+# here invalidate the results cached from it
+DB_FILE = "users.db"
+
 def with_db_connection(func):
     """Decorator to handle opening and closing DB connection."""
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = sqlite3.connect("users.db") 
+        conn = sqlite3.connect(DB_FILE, factory=cache_engine.CachedConnection) 
         try:
             result = func(conn, *args, **kwargs)
         finally:
@@ -14,15 +20,32 @@ def with_db_connection(func):
     return wrapper
 
 def transactional(func):
+    """
+    Commits the call's writes, or rolls them back if it raises. Once
+    committed, cached query results that read a written table are
+    invalidated (see cache_engine).
+    """
     @functools.wraps(func)
     def wrapper(conn, *args, **kwargs):
+        track = getattr(conn, 'track_tables', None)
         try:
-            result = func(conn, *args, **kwargs)
+            if track is None:
+                result = func(conn, *args, **kwargs)
+                written = None
+            else:
+                with track() as access:
+                    result = func(conn, *args, **kwargs)
+                written = access.writes
         except Exception:
             conn.rollback()
             raise
         else:
             conn.commit()
+            if written is None:
+                # Cannot tell which tables changed: drop every result
+                cache_engine.invalidate_all()
+            elif written:
+                cache_engine.invalidate(written)
             return result
     return wrapper
 
@@ -32,5 +55,6 @@ def update_user_email(conn, user_id, new_email):
     cursor = conn.cursor() 
     cursor.execute("UPDATE users SET email = ? WHERE id = ?", (new_email, user_id)) 
 
-#### Update user's email with automatic transaction handling 
-update_user_email(user_id=1, new_email='Crawford_Cartwright@hotmail.com')
\ No newline at end of file
+if __name__ == "__main__":
+    #### Update user's email with automatic transaction handling 
+    update_user_email(user_id=1, new_email='Crawford_Cartwright@hotmail.com')
@@ -1,14 +1,28 @@
-import time
 import sqlite3 
 import functools
 
-query_cache = {}
+import db_pool
+from cache_engine import CachedConnection, QueryCache, make_key, reconnect
+
+DB_FILE = "users.db"
+
+# Shared by every @cache_query function; see cache_engine.QueryCache
+query_cache = QueryCache()
+
+def with_db_connection(func=None, *, pooled=False):
+    """
+    Decorator to handle opening and closing DB connection, or with
+    pooled=True to borrow one from db_pool's shared pool for DB_FILE.
+    """
+    if func is None:
+        return functools.partial(with_db_connection, pooled=pooled)
 
-def with_db_connection(func):
-    """Decorator to handle opening and closing DB connection."""
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = sqlite3.connect("users.db") 
+        if pooled:
+            with db_pool.get_pool(DB_FILE).connection() as conn:
+                return func(conn, *args, **kwargs)
+        conn = sqlite3.connect(DB_FILE, factory=CachedConnection) 
         try:
             result = func(conn, *args, **kwargs)
         finally:
@@ -16,21 +30,84 @@ def with_db_connection(func):
         return result
     return wrapper
 
-def cache_query(func):
-    """Decorator to cache query results based on the query string."""
+def cache_query(func=None, *, cache=None, ttl=None):
+    """
+    Decorator to cache query results based on the database file, the
+    query string and the other arguments of the call.
+
+    Use it bare (@cache_query, shared query_cache and its TTL) or as
+    @cache_query(cache=QueryCache(...), ttl=seconds). Results are
+    dropped when a table they read is written through @transactional.
+    Threads that miss the same key at once run the query only once.
+    With a QueryCache(stale_ttl=..., refresh_top=...), expired and hot
+    results are reloaded in the background over a new connection.
+    """
+    if func is None:
+        return functools.partial(cache_query, cache=cache, ttl=ttl)
+
     @functools.wraps(func)
     def wrapper(conn, *args, **kwargs):
+        store = query_cache if cache is None else cache
         # The query string is passed as a keyword argument
         sql_query = kwargs['query']
-        
-        if sql_query in query_cache:
-            return query_cache[sql_query]
-        else:
+        params = (func.__qualname__, args, tuple(sorted(
+            (name, value) for name, value in kwargs.items() if name != 'query')))
+        try:
+            key = make_key(conn, sql_query, params)
+            hash(key)
+        except TypeError:
+            # Unhashable arguments: nothing to key on, run uncached
+            return func(conn, *args, **kwargs)
+
+        def run(connection):
             # Run the original function to fetch the data
-            result = func(conn, *args, **kwargs)
-            # Store the result in the cache
-            query_cache[sql_query] = result
-            return result
+            track = getattr(connection, 'track_tables', None)
+            if track is None:
+                return func(connection, *args, **kwargs), ()
+            with track() as access:
+                result = func(connection, *args, **kwargs)
+            return result, access.reads
+
+        def reload():
+            # Runs on the cache's worker, after `conn` has been closed
+            fresh = reconnect(conn)
+            try:
+                return run(fresh)
+            finally:
+                fresh.close()
+
+        # Another connection would see another in-memory database
+        refresh = None if key[0] in ('', ':memory:') else reload
+
+        # Cached, or stored in the cache once loaded
+        return store.get_or_load(key, lambda: run(conn), ttl, refresh)
+    return wrapper
+
+def async_cache_query(func=None, *, cache=None, ttl=None):
+    """
+    cache_query for coroutine functions that open their own connection
+    (e.g. with aiosqlite). The key is the DB_FILE plus the call's
+    arguments; tasks that miss the same key at once await one query.
+    The tables read are unknown, so any @transactional write drops the
+    results.
+    """
+    if func is None:
+        return functools.partial(async_cache_query, cache=cache, ttl=ttl)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        store = query_cache if cache is None else cache
+        key = (DB_FILE, kwargs.get('query'), (func.__qualname__, args,
+               tuple(sorted(kwargs.items()))))
+        try:
+            hash(key)
+        except TypeError:
+            return await func(*args, **kwargs)
+
+        async def load():
+            return await func(*args, **kwargs), ()
+
+        return await store.get_or_load_async(key, load, ttl)
     return wrapper
 
 @with_db_connection
@@ -40,8 +117,10 @@ def fetch_users_with_cache(conn, query):
     cursor.execute(query)
     return cursor.fetchall()
 
-#### First call will cache the result
-users = fetch_users_with_cache(query="SELECT * FROM users")
+if __name__ == "__main__":
+    #### First call will cache the result
+    users = fetch_users_with_cache(query="SELECT * FROM users")
 
-#### Second call will use the cached result
-users_again = fetch_users_with_cache(query="SELECT * FROM users")
\ No newline at end of file
+    #### Second call will use the cached result
+    users_again = fetch_users_with_cache(query="SELECT * FROM users")
+    print(query_cache.stats())
@@ -0,0 +1,193 @@
+#!/usr/bin/python3
+"""
+Benchmark for request coalescing in cache_query: `callers` threads (and
+then as many asyncio tasks) ask for the same `keys` queries at the same
+moment on a cold cache, and the script counts how often each query
+actually ran against the database.
+
+Without coalescing every caller that misses runs the query itself, so
+a burst costs up to `callers` executions per key; with it, one.
+
+It then reads the same keys in a loop for a few seconds with a short
+TTL and reports the latency percentiles of the warm reads: with a
+plain TTL every expiry makes a reader wait on the database, with
+stale_ttl or refresh_top the worker reloads the keys instead. Usage:
+
+    ./bench_cache_query.py [callers] [keys] [users]
+
+The queries run against bench_users.db, created with `users` rows of
+synthetic users on first use.
+"""
+import asyncio
+import os
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+
+cache_engine = __import__('cache_engine')
+cache_query_module = __import__('4-cache_query')
+
+DB_FILE = "bench_users.db"
+QUERY = "SELECT * FROM users WHERE age >= ? ORDER BY email LIMIT 100"
+
+# Reads through expirations: how long, and the TTL of the entries
+EXPIRY_SECONDS = 3.0
+EXPIRY_TTL = 0.25
+
+executions = Counter()
+executions_lock = threading.Lock()
+
+
+def create_db(users):
+    """Fills DB_FILE with `users` users unless it already holds them."""
+    conn = sqlite3.connect(DB_FILE)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY, name TEXT, email TEXT, age INTEGER)
+    """)
+    (existing,) = conn.execute("SELECT COUNT(*) FROM users").fetchone()
+    if existing < users:
+        conn.executemany("INSERT INTO users VALUES (?, ?, ?, ?)", (
+            (i, f"User {i}", f"user.{i * 7919 % users}@example.com", 18 + i % 83)
+            for i in range(existing, users)))
+        conn.commit()
+    conn.close()
+
+
+def run_query(conn, min_age):
+    with executions_lock:
+        executions[min_age] += 1
+    return conn.execute(QUERY, (min_age,)).fetchall()
+
+
+@cache_query_module.with_db_connection
+def fetch_uncoalesced(conn, query, min_age, cache):
+    """What cache_query did before: check, run on a miss, store."""
+    key = cache_engine.make_key(conn, query, (min_age,))
+    result = cache.get(key)
+    if result is cache.MISSING:
+        result = run_query(conn, min_age)
+        cache.put(key, result, ('users',))
+    return result
+
+
+def threaded(callers, keys, fetch):
+    """Starts `callers` threads at once, spread over `keys` queries."""
+    barrier = threading.Barrier(callers)
+
+    def caller(i):
+        barrier.wait()
+        fetch(18 + i % keys)
+
+    threads = [threading.Thread(target=caller, args=(i,))
+               for i in range(callers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+async def on_event_loop(callers, keys, cache):
+    @cache_query_module.async_cache_query(cache=cache)
+    async def fetch(query, min_age):
+        def blocking():
+            conn = sqlite3.connect(DB_FILE)
+            try:
+                return run_query(conn, min_age)
+            finally:
+                conn.close()
+        return await asyncio.to_thread(blocking)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(fetch(query=QUERY, min_age=18 + i % keys)
+                           for i in range(callers)))
+    return time.perf_counter() - start
+
+
+def read_through_expiry(keys, cache):
+    """Reads `keys` keys round-robin; returns each read's latency."""
+    @cache_query_module.with_db_connection
+    @cache_query_module.cache_query(cache=cache)
+    def fetch(conn, query, min_age):
+        return run_query(conn, min_age)
+
+    for i in range(keys):
+        fetch(query=QUERY, min_age=18 + i)  # Only expirations miss now
+    executions.clear()
+
+    latencies = []
+    end = time.perf_counter() + EXPIRY_SECONDS
+    i = 0
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        fetch(query=QUERY, min_age=18 + i % keys)
+        latencies.append(time.perf_counter() - start)
+        i += 1
+    cache.close()
+    return latencies
+
+
+def report_latencies(label, latencies):
+    cuts = statistics.quantiles(latencies, n=1000)
+    print(f"{label:>22}: {len(latencies):>7} reads, "
+          f"p50 {cuts[499] * 1000:.3f} ms, p99 {cuts[989] * 1000:.3f} ms, "
+          f"p99.9 {cuts[998] * 1000:.3f} ms, max {max(latencies) * 1000:.1f} ms, "
+          f"{sum(executions.values())} executions")
+    executions.clear()
+
+
+def report(label, elapsed, keys):
+    total = sum(executions.values())
+    print(f"{label:>22}: {total:>4} executions for {keys} keys "
+          f"(max {max(executions.values())} per key) in {elapsed:.3f} s")
+    executions.clear()
+
+
+def main():
+    callers = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    keys = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    users = int(sys.argv[3]) if len(sys.argv) > 3 else 200000
+    create_db(users)
+    cache_query_module.DB_FILE = os.path.abspath(DB_FILE)
+
+    cache = cache_engine.QueryCache()
+    elapsed = threaded(callers, keys,
+                       lambda min_age: fetch_uncoalesced(
+                           query=QUERY, min_age=min_age, cache=cache))
+    report("threads, uncoalesced", elapsed, keys)
+
+    cache = cache_engine.QueryCache()
+
+    @cache_query_module.with_db_connection
+    @cache_query_module.cache_query(cache=cache)
+    def fetch(conn, query, min_age):
+        return run_query(conn, min_age)
+
+    elapsed = threaded(callers, keys,
+                       lambda min_age: fetch(query=QUERY, min_age=min_age))
+    report("threads, cache_query", elapsed, keys)
+    print(f"{'':>22}  {cache.stats()}")
+
+    cache = cache_engine.QueryCache()
+    elapsed = asyncio.run(on_event_loop(callers, keys, cache))
+    report("asyncio, cache_query", elapsed, keys)
+    print(f"{'':>22}  {cache.stats()}")
+
+    print(f"\nReads for {EXPIRY_SECONDS:.0f} s with a {EXPIRY_TTL} s TTL:")
+    for label, cache in (
+            ("ttl only", cache_engine.QueryCache(ttl=EXPIRY_TTL)),
+            ("stale-while-revalidate", cache_engine.QueryCache(
+                ttl=EXPIRY_TTL, stale_ttl=EXPIRY_TTL)),
+            ("top-n refresh", cache_engine.QueryCache(
+                ttl=EXPIRY_TTL, refresh_top=keys, refresh_ahead=0.5,
+                refresh_interval=EXPIRY_TTL / 5))):
+        report_latencies(label, read_through_expiry(keys, cache))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+"""
+Benchmark for pooled connections: get_user_by_id point lookups through
+with_db_connection, opening a connection per call vs borrowing one from
+db_pool in 'shared' and in 'thread' mode, with and without a statement
+cache, from one thread and from `threads` threads. Then single-threaded
+update_user_email calls under @transactional, whose table tracking
+used to re-prepare the statement on every call. Usage:
+
+    ./bench_db_pool.py [lookups] [threads] [users]
+
+The lookups run against bench_users.db (see bench_cache_query.py).
+"""
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+bench_cache_query = __import__('bench_cache_query')
+db_pool = __import__('db_pool')
+with_db_connection_module = __import__('1-with_db_connection')
+transactional = __import__('2-transactional').transactional
+
+DB_FILE = bench_cache_query.DB_FILE
+STATEMENT_CACHE = 128
+
+# (label, pool mode or None for a connection per call, statement cache)
+SETUPS = (
+    ('connect per call', None, 0),
+    ('pooled, shared', 'shared', 0),
+    ('pooled, per thread', 'thread', 0),
+    ('shared + statements', 'shared', STATEMENT_CACHE),
+    ('per thread + statements', 'thread', STATEMENT_CACHE),
+)
+
+
+def get_user_by_id(conn, user_id):
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+    return cursor.fetchone()
+
+
+def update_user_email(conn, user_id, new_email):
+    cursor = conn.cursor()
+    cursor.execute("UPDATE users SET email = ? WHERE id = ?", (new_email, user_id))
+
+
+def decorate(func, mode):
+    if mode is None:
+        return with_db_connection_module.with_db_connection(func)
+    return with_db_connection_module.with_db_connection(func, pooled=True)
+
+
+def run(call, ids, threads):
+    """Calls `call` for every id, split over `threads` threads; returns seconds."""
+    start = time.perf_counter()
+    if threads == 1:
+        for user_id in ids:
+            call(user_id)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for _ in executor.map(call, ids, chunksize=256):
+                pass
+    return time.perf_counter() - start
+
+
+def compare(title, func, call, ids, workers, setups=SETUPS):
+    """Runs `call` on `func` decorated for every setup and prints the rates."""
+    print(title)
+    baseline = None
+    for label, mode, statement_cache in setups:
+        if mode is not None:
+            db_pool.set_pool(db_pool.SQLitePool(
+                DB_FILE, mode=mode, size=workers,
+                statement_cache=statement_cache))
+        decorated = decorate(func, mode)
+        elapsed = run(lambda user_id: call(decorated, user_id), ids, workers)
+        baseline = baseline or elapsed
+        print(f"  {label:>24}: {len(ids) / elapsed:>9.0f} calls/s "
+              f"({baseline / elapsed:.1f}x)")
+    print(f"  {'':>24}  {db_pool.get_pool(DB_FILE).stats()}")
+
+
+def main():
+    lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    users = int(sys.argv[3]) if len(sys.argv) > 3 else 200000
+    bench_cache_query.create_db(users)
+    with_db_connection_module.DB_FILE = DB_FILE
+
+    rng = random.Random(0)
+    ids = [rng.randrange(users) for _ in range(lookups)]
+    for workers in (1, threads):
+        compare(f"get_user_by_id, {workers} thread(s):", get_user_by_id,
+                lambda lookup, user_id: lookup(user_id=user_id), ids, workers)
+
+    compare("update_user_email under @transactional, 1 thread:",
+            transactional(update_user_email),
+            lambda update, user_id: update(user_id=user_id,
+                                           new_email=f"user.{user_id}@example.org"),
+            ids[:lookups // 4], 1,
+            [setup for setup in SETUPS if setup[1] != 'thread'])
+    db_pool.set_pool(None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,499 @@
+"""
+Cache engine behind cache_query (4-cache_query.py).
+
+QueryCache is a thread-safe LRU of query results with a per-entry TTL,
+bounded both by entry count and by the approximate bytes it holds, so
+its memory stays bounded however many distinct queries are issued.
+Connections opened with factory=CachedConnection record which tables a
+query reads; a write made through `transactional` (2-transactional.py)
+drops every cached result that read the written tables.
+
+Concurrent misses for one key are coalesced (get_or_load): one caller
+runs the query while the others wait for its result, so a burst of N
+callers costs one execution instead of N. get_or_load_async does the
+same for coroutines on an event loop.
+
+With stale_ttl, an expired entry is still served while one background
+worker reloads it, and refresh_top keeps the hottest entries reloaded
+ahead of expiry, so hot keys never make a caller wait on the database.
+"""
+import asyncio
+import heapq
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Bounds of a QueryCache unless given
+MAX_ENTRIES = 1024
+MAX_BYTES = 16 * 1024 * 1024
+TTL = 300.0
+# Top-N refresh: look every REFRESH_INTERVAL seconds for hot entries in
+# the last REFRESH_AHEAD of their TTL
+REFRESH_INTERVAL = 1.0
+REFRESH_AHEAD = 0.2
+
+# Authorizer actions that change a table, and the argument naming it
+WRITE_ACTIONS = {
+    sqlite3.SQLITE_INSERT: 0,
+    sqlite3.SQLITE_UPDATE: 0,
+    sqlite3.SQLITE_DELETE: 0,
+    sqlite3.SQLITE_DROP_TABLE: 0,
+    sqlite3.SQLITE_ALTER_TABLE: 1,
+}
+
+# Every live QueryCache, so a write can invalidate all of them
+_caches = weakref.WeakSet()
+
+
+class CachedConnection(sqlite3.Connection):
+    """
+    sqlite3 connection that remembers its database file and can report
+    which tables its statements read and write:
+
+        conn = sqlite3.connect("users.db", factory=CachedConnection)
+        with conn.track_tables() as tables:
+            conn.execute("SELECT * FROM users").fetchall()
+        tables.reads  # {'users'}
+    """
+
+    def __init__(self, database, *args, **kwargs):
+        super().__init__(database, *args, **kwargs)
+        self.db_file = str(database)
+        self._trackers = []
+
+    @contextmanager
+    def track_tables(self):
+        """Collects the tables used by the statements run in the block."""
+        tables = TableAccess()
+        self._trackers.append(tables)
+        # Installing an authorizer expires the prepared statements, so
+        # statements from sqlite3's cache are prepared (and seen) again
+        self.set_authorizer(self._authorize)
+        try:
+            yield tables
+        finally:
+            self._trackers.remove(tables)
+            if not self._trackers:
+                self.set_authorizer(None)
+
+    def _authorize(self, action, arg1, arg2, db_name, trigger):
+        if action == sqlite3.SQLITE_READ and arg1:
+            self._record(self._recording(), arg1.lower(), None)
+        elif action in WRITE_ACTIONS:
+            table = (arg1, arg2)[WRITE_ACTIONS[action]]
+            if table:
+                self._record(self._recording(), None, table.lower())
+        return sqlite3.SQLITE_OK
+
+    def _recording(self):
+        """The TableAccess objects the authorizer adds tables to."""
+        return self._trackers
+
+    @staticmethod
+    def _record(recorders, read=None, written=None):
+        for tables in recorders:
+            if read:
+                tables.reads.add(read)
+            if written:
+                tables.writes.add(written)
+
+
+class TableAccess:
+    """Tables read and written while a CachedConnection was tracking."""
+
+    def __init__(self):
+        self.reads = set()
+        self.writes = set()
+
+    def __repr__(self):
+        return f"TableAccess(reads={self.reads}, writes={self.writes})"
+
+
+def db_file(conn):
+    """The database file behind `conn` ('' for in-memory databases)."""
+    name = getattr(conn, 'db_file', None)
+    if name is None:
+        # Plain sqlite3 connections: ask SQLite which file 'main' is
+        rows = conn.execute("PRAGMA database_list").fetchall()
+        name = next((row[2] for row in rows if row[1] == 'main'), '')
+    return name
+
+
+def result_size(value):
+    """Rough size in bytes of a query result (rows of scalars)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        for row in value:
+            size += sys.getsizeof(row)
+            if isinstance(row, (list, tuple)):
+                size += sum(sys.getsizeof(item) for item in row)
+    return size
+
+
+def invalidate(tables):
+    """Drops the entries that read any of `tables` from every cache."""
+    for cache in list(_caches):
+        cache.invalidate(tables)
+
+
+def invalidate_all():
+    """Empties every cache; for writes whose tables are unknown."""
+    for cache in list(_caches):
+        cache.clear()
+
+
+class _Flight:
+    """A load in progress, which callers that miss the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def resolve(self, value=None, error=None):
+        self.value = value
+        self.error = error
+        self.done.set()
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class _Entry:
+    __slots__ = ('value', 'size', 'expires', 'stale_until', 'ttl', 'tables',
+                 'refresh', 'hits')
+
+    def __init__(self, value, size, ttl, stale_ttl, tables, refresh):
+        self.value = value
+        self.size = size
+        self.ttl = ttl
+        self.expires = time.monotonic() + ttl
+        self.stale_until = self.expires + (stale_ttl or 0)
+        self.tables = tables
+        self.refresh = refresh
+        # Reads since the refresher last looked; see _refresh_hottest()
+        self.hits = 0
+
+
+class QueryCache:
+    """
+    LRU cache of query results, bounded both by entry count and by the
+    approximate bytes of the results it holds. Entries expire after
+    their TTL and are dropped when a table they read is written (see
+    invalidate()). Keys are (db file, sql, params) tuples.
+
+    Entries stored with a `refresh` callable can be kept fresh in the
+    background by one worker thread:
+
+    * stale_ttl: for that many seconds past its TTL an entry is still
+      served, while the worker reloads it (stale-while-revalidate), so
+      callers never wait on an expired hot key.
+    * refresh_top: every `refresh_interval` seconds the worker reloads
+      the `refresh_top` most-read entries that are within
+      `refresh_ahead` (a fraction of their TTL) of expiring.
+
+    All methods are thread-safe.
+    """
+
+    MISSING = object()
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, ttl=TTL,
+                 stale_ttl=None, refresh_top=0, refresh_ahead=REFRESH_AHEAD,
+                 refresh_interval=REFRESH_INTERVAL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.refresh_top = refresh_top
+        self.refresh_ahead = refresh_ahead
+        self.refresh_interval = refresh_interval
+        self.bytes = 0
+        # Bumped by every invalidation; see put()
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        # Loads in progress per key, from threads and from event loops
+        self._flights = {}
+        self._async_flights = {}
+        # Keys for the background worker, started on first use
+        self._refreshes = queue.SimpleQueue()
+        self._worker = None
+        self._closed = False
+        self._stats = {'hits': 0, 'misses': 0, 'loads': 0, 'coalesced': 0,
+                       'stale_hits': 0, 'refreshes': 0, 'refresh_errors': 0,
+                       'evictions': 0, 'expirations': 0, 'invalidations': 0}
+        _caches.add(self)
+        if refresh_top:
+            self._start_worker()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return (f"QueryCache(entries={len(self._entries)}, "
+                f"bytes={self.bytes})")
+
+    def get(self, key):
+        """
+        Returns the cached value for `key`, or QueryCache.MISSING. An
+        expired entry within its stale_ttl is returned too, and queued
+        for a background refresh.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            stale = entry is not None and entry.expires <= now
+            if stale and entry.refresh is not None and now < entry.stale_until:
+                self._schedule(key)
+            elif stale:
+                self._remove(key)
+                self._stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return self.MISSING
+            self._entries.move_to_end(key)
+            entry.hits += 1
+            self._stats['stale_hits' if stale else 'hits'] += 1
+            return entry.value
+
+    def put(self, key, value, tables=(), ttl=None, generation=None,
+            refresh=None):
+        """
+        Stores `value`, which was read from `tables`, for `ttl` seconds
+        (the cache's TTL by default). Pass the `generation` read before
+        running the query: if tables were invalidated since, the value
+        may predate the write and is not stored. `refresh`, if given,
+        reloads the value as (value, tables) without the caller's help;
+        it enables background refreshes of this entry.
+        """
+        size = result_size(value)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+            if size > self.max_bytes:
+                return False
+            hits = 0
+            if key in self._entries:
+                hits = self._entries[key].hits
+                self._remove(key)
+            entry = _Entry(value, size, self.ttl if ttl is None else ttl,
+                           self.stale_ttl, frozenset(tables), refresh)
+            entry.hits = hits
+            self._entries[key] = entry
+            self.bytes += size
+            while (len(self._entries) > self.max_entries
+                   or self.bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+            return True
+
+    def get_or_load(self, key, load, ttl=None, refresh=None):
+        """
+        Returns the cached value for `key`, or calls load() to produce
+        it. load() returns (value, tables read). While one thread loads
+        a key, other threads that miss it wait for that load instead of
+        running their own; an exception from load() is raised in all of
+        them. `refresh` is stored with the value; see put().
+        """
+        while True:
+            with self._lock:
+                value = self.get(key)
+                if value is not self.MISSING:
+                    return value
+                flight = self._flights.get(key)
+                if flight is not None:
+                    self._stats['coalesced'] += 1
+                else:
+                    self._flights[key] = _Flight()
+                    generation = self.generation
+                    self._stats['loads'] += 1
+            if flight is None:
+                return self._load(key, load, ttl, generation, refresh)
+            value = flight.wait()
+            if value is not self.MISSING:
+                return value
+            # An abandoned background refresh: look again
+
+    def _load(self, key, load, ttl, generation, refresh):
+        """Runs the load of the flight registered for `key`."""
+        flight = self._flights[key]
+        try:
+            value, tables = load()
+        except BaseException as e:
+            with self._lock:
+                del self._flights[key]
+            flight.resolve(error=e)
+            raise
+        with self._lock:
+            # Cached before the flight ends, so no caller misses in between
+            self.put(key, value, tables, ttl, generation, refresh)
+            del self._flights[key]
+        flight.resolve(value)
+        return value
+
+    async def get_or_load_async(self, key, load, ttl=None):
+        """
+        get_or_load() for coroutines: `load` is an async function, and
+        tasks that miss a key being loaded on the same event loop await
+        that load instead of starting their own. The load runs as its
+        own task, so cancelling one caller does not cancel it for the
+        others.
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (loop, key)
+        with self._lock:
+            value = self.get(key)
+            if value is not self.MISSING:
+                return value
+            flight = self._async_flights.get(flight_key)
+            if flight is not None:
+                self._stats['coalesced'] += 1
+            else:
+                flight = self._async_flights[flight_key] = loop.create_task(
+                    self._load_async(flight_key, load, ttl, self.generation))
+                self._stats['loads'] += 1
+        return await asyncio.shield(flight)
+
+    async def _load_async(self, flight_key, load, ttl, generation):
+        try:
+            value, tables = await load()
+        except BaseException:
+            with self._lock:
+                del self._async_flights[flight_key]
+            raise
+        with self._lock:
+            self.put(flight_key[1], value, tables, ttl, generation)
+            del self._async_flights[flight_key]
+        return value
+
+    def _schedule(self, key):
+        """Queues `key` for the worker unless it is being loaded already."""
+        if key in self._flights or self._closed:
+            return
+        self._flights[key] = _Flight()
+        self._start_worker()
+        self._refreshes.put(key)
+
+    def _start_worker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(
+                target=self._run_worker, name='QueryCache-refresh', daemon=True)
+            self._worker.start()
+
+    def _run_worker(self):
+        next_scan = time.monotonic() + self.refresh_interval
+        while True:
+            timeout = max(next_scan - time.monotonic(), 0)
+            try:
+                key = self._refreshes.get(
+                    timeout=timeout if self.refresh_top else None)
+            except queue.Empty:
+                self._refresh_hottest()
+                next_scan = time.monotonic() + self.refresh_interval
+                continue
+            if key is None:
+                return
+            self._refresh(key)
+
+    def _refresh(self, key):
+        """Reloads the entry of a flight registered for `key`."""
+        with self._lock:
+            entry = self._entries.get(key)
+            generation = self.generation
+        if entry is None:
+            # Evicted or invalidated meanwhile; waiting callers load it
+            with self._lock:
+                flight = self._flights.pop(key)
+            flight.resolve(self.MISSING)
+            return
+        try:
+            self._load(key, entry.refresh, entry.ttl, generation, entry.refresh)
+            outcome = 'refreshes'
+        except Exception:
+            # The stale value stays until stale_ttl runs out
+            outcome = 'refresh_errors'
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def _refresh_hottest(self):
+        """Schedules the most-read entries that are about to expire."""
+        with self._lock:
+            now = time.monotonic()
+            due = [(entry.hits, key) for key, entry in self._entries.items()
+                   if entry.refresh is not None and entry.hits
+                   and entry.expires - now <= entry.ttl * self.refresh_ahead]
+            for entry in self._entries.values():
+                entry.hits = 0
+            for _, key in heapq.nlargest(self.refresh_top, due,
+                                         key=lambda item: item[0]):
+                if key not in self._flights:
+                    self._flights[key] = _Flight()
+                    self._refreshes.put(key)
+
+    def close(self):
+        """Stops the background worker, if one was started."""
+        self._closed = True
+        if self._worker is not None:
+            self._refreshes.put(None)
+            self._worker.join()
+            self._worker = None
+
+    def invalidate(self, tables):
+        """Drops every entry that read one of `tables`; returns how many."""
+        tables = {table.lower() for table in tables}
+        if not tables:
+            return 0
+        with self._lock:
+            self.generation += 1
+            # Entries whose tables are unknown may have read any of them
+            stale = [key for key, entry in self._entries.items()
+                     if not entry.tables or entry.tables & tables]
+            for key in stale:
+                self._remove(key)
+            self._stats['invalidations'] += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Counters plus the current size, e.g. for logging."""
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+            stats['hit_rate'] = ((stats['hits'] + stats['stale_hits']) / lookups
+                                 if lookups else 0.0)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self.bytes
+            return stats
+
+    def _remove(self, key):
+        self.bytes -= self._entries.pop(key).size
+
+
+def make_key(conn, sql, params=()):
+    """Cache key of `sql` run with `params` against `conn`'s database."""
+    return db_file(conn), sql, params
+
+
+def reconnect(conn):
+    """
+    A new connection to `conn`'s database file, of the same class, for
+    reloading entries off the caller's thread; None for in-memory ones.
+    """
+    name = db_file(conn)
+    if not name or name == ':memory:':
+        return None
+    return sqlite3.connect(name, factory=type(conn))
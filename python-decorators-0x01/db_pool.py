@@ -0,0 +1,392 @@
+"""
+A small SQLite connection pool for with_db_connection(pooled=True).
+
+Opening users.db on every decorated call means opening the file,
+reading the schema and building a page cache that is thrown away on
+close(). A pooled connection keeps all three warm, so a point lookup
+costs little more than the query itself.
+
+    @with_db_connection(pooled=True)
+    def get_user_by_id(conn, user_id):
+        ...
+
+    db_pool.set_pool(db_pool.SQLitePool("users.db", mode='thread'))
+    print(db_pool.get_pool("users.db").stats())
+
+The decorators borrow from the shared pool of their module's DB_FILE,
+so each database file gets a pool of its own.
+
+Two modes: 'shared' hands out at most `size` connections to whichever
+thread asks (waiting when all are busy), 'thread' keeps one connection
+per thread. Either way connections get the PRAGMAs in `pragmas`, are
+checked with a trivial query after sitting idle for `ping_after`
+seconds, and are replaced once they are `max_lifetime` seconds old.
+With `statement_cache`, each connection keeps the compiled statements
+of its most recent SQL texts even under table tracking (see
+statement_cache.py).
+"""
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+
+from cache_engine import CachedConnection
+from statement_cache import StatementCachingConnection
+
+DB_FILE = "users.db"
+
+# Pool tuning, overridable from the environment
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '4'))
+# Connections older than this are closed and replaced (seconds)
+MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', '600'))
+# Connections idle longer than this are checked before being handed out
+PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', '30'))
+# How long a shared pool waits for a free connection before giving up
+CHECKOUT_TIMEOUT = float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', '30'))
+# SQL texts whose compiled statements each connection keeps (0: off)
+STATEMENT_CACHE = int(os.getenv('DB_POOL_STATEMENT_CACHE', '0'))
+
+# Applied to every new connection, in this order
+PRAGMAS = {
+    'journal_mode': 'WAL',   # Readers do not block the writer
+    'synchronous': 'NORMAL',  # Safe with WAL, far fewer fsyncs
+    'cache_size': -16000,    # 16 MiB page cache (negative: KiB)
+    'mmap_size': 64 * 1024 * 1024,
+}
+
+MODES = ('shared', 'thread')
+
+
+class PoolError(Exception):
+    """Raised when no pooled connection frees up in time."""
+
+
+class _Pooled:
+    """A pooled connection, its timestamps and whether it is in use."""
+    __slots__ = ('connection', 'created', 'released', 'checked_out',
+                 '__weakref__')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created = self.released = time.monotonic()
+        self.checked_out = False
+
+
+class SQLitePool:
+    """
+    A thread-safe pool of connections to one SQLite file.
+
+    In 'shared' mode at most `size` connections exist and are reused
+    most-recently-used first; in 'thread' mode every thread gets its own
+    connection, kept until it expires or the pool is closed.
+    """
+
+    def __init__(self, db_file=DB_FILE, mode='shared', size=POOL_SIZE,
+                 pragmas=None, max_lifetime=MAX_LIFETIME,
+                 ping_after=PING_AFTER, checkout_timeout=CHECKOUT_TIMEOUT,
+                 statement_cache=STATEMENT_CACHE, factory=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode!r}; expected one of {MODES}")
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.db_file = db_file
+        self.mode = mode
+        self.size = size
+        self.pragmas = PRAGMAS if pragmas is None else pragmas
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self.checkout_timeout = checkout_timeout
+        self.statement_cache = statement_cache
+        if factory is None:
+            factory = (StatementCachingConnection if statement_cache
+                       else CachedConnection)
+        self._factory = factory
+        self._idle = deque()  # Shared mode, oldest release on the left
+        self._local = threading.local()  # Thread mode
+        # Every open connection; weak, so those of finished threads
+        # are closed when their thread-local storage goes away
+        self._all = weakref.WeakSet()
+        self._open = 0  # Shared mode: idle + checked out
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'creations': 0,
+            'expirations': 0,
+            'health_failures': 0,
+            'discards': 0,
+        }
+
+    def __repr__(self):
+        return f"SQLitePool({self.db_file!r}, mode={self.mode!r})"
+
+    def connect(self):
+        """Opens a new connection with the pool's PRAGMAs applied."""
+        # Shared connections move between threads, one at a time
+        options = {}
+        if self.statement_cache:
+            options['cached_statements'] = self.statement_cache
+        connection = sqlite3.connect(self.db_file, factory=self._factory,
+                                     check_same_thread=False, **options)
+        try:
+            # As a script, so the PRAGMAs stay out of any statement cache
+            connection.executescript("".join(
+                f"PRAGMA {name} = {value};"
+                for name, value in self.pragmas.items()))
+        except sqlite3.Error:
+            connection.close()
+            raise
+        return connection
+
+    def acquire(self, timeout=None):
+        """
+        Checks a connection out: this thread's own one in 'thread' mode,
+        an idle or new one in 'shared' mode, where it waits for a
+        release when `size` are in use. Raises PoolError if nothing
+        frees up within `timeout` seconds.
+        """
+        with self._cond:
+            self._stats['checkouts'] += 1
+        while True:
+            if self.mode == 'thread':
+                pooled = getattr(self._local, 'pooled', None)
+                self._local.pooled = None
+            else:
+                pooled = self._checkout(timeout)
+            if pooled is None:
+                pooled = self._create()
+            elif not self._usable(pooled):
+                self._discard(pooled)
+                continue
+            pooled.checked_out = True
+            return pooled
+
+    def release(self, pooled, discard=False):
+        """
+        Returns a connection to the pool. Uncommitted work is rolled
+        back; broken, expired or `discard`ed connections are closed.
+        """
+        pooled.checked_out = False
+        if not discard:
+            try:
+                if pooled.connection.in_transaction:
+                    pooled.connection.rollback()
+            except sqlite3.Error:
+                discard = True
+        if discard or self._expired(pooled):
+            self._discard(pooled)
+            return
+
+        pooled.released = time.monotonic()
+        if self.mode == 'thread':
+            if getattr(self._local, 'pooled', None) is not None:
+                # A nested checkout's extra connection; keep one
+                self._discard(pooled)
+            else:
+                self._local.pooled = pooled
+            return
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and back in."""
+        pooled = self.acquire()
+        try:
+            yield pooled.connection
+        except sqlite3.Error:
+            self.release(pooled, discard=not self._healthy(pooled))
+            raise
+        except BaseException:
+            self.release(pooled)
+            raise
+        else:
+            self.release(pooled)
+
+    def stats(self):
+        """Returns a snapshot of the pool's counters and occupancy."""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update(
+                mode=self.mode,
+                size=self.size,
+                open=len(self._all),
+                idle=len(self._idle),
+            )
+            connections = list(self._all)
+        if self.statement_cache:
+            # Summed over the open connections
+            statements = {}
+            for pooled in connections:
+                for name, value in pooled.connection.statement_stats().items():
+                    statements[name] = statements.get(name, 0) + value
+            snapshot['statements'] = statements
+        return snapshot
+
+    def close(self):
+        """
+        Closes every connection that is not checked out; checked-out
+        ones close on release.
+        """
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+            # Thread mode parks connections in their threads instead
+            parked = [pooled for pooled in self._all
+                      if not pooled.checked_out and pooled not in idle]
+            for pooled in self._all:
+                # Expired: replaced on next use, closed on release
+                pooled.created = float('-inf')
+            self._cond.notify_all()
+        for pooled in idle + parked:
+            self._close(pooled)
+
+    def _checkout(self, timeout):
+        """
+        Picks an idle connection, or reserves a slot for a new one
+        (returned as None), waiting if the pool is full.
+        """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            waited_since = None
+            while True:
+                if self._idle:
+                    pooled = self._idle.pop()
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    pooled = None
+                    break
+
+                now = time.monotonic()
+                if waited_since is None:
+                    waited_since = now
+                    self._stats['waits'] += 1
+                if now >= deadline:
+                    self._stats['timeouts'] += 1
+                    self._stats['wait_time'] += now - waited_since
+                    raise PoolError(
+                        f"No connection available within the checkout "
+                        f"timeout (pool size {self.size})")
+                self._cond.wait(deadline - now)
+
+            if waited_since is not None:
+                self._stats['wait_time'] += time.monotonic() - waited_since
+        return pooled
+
+    def _create(self):
+        try:
+            pooled = _Pooled(self.connect())
+        except BaseException:
+            self._forget()
+            raise
+        with self._cond:
+            self._all.add(pooled)
+            self._stats['creations'] += 1
+        return pooled
+
+    def _usable(self, pooled):
+        """Whether a connection about to be handed out can be reused."""
+        if self._expired(pooled):
+            with self._cond:
+                self._stats['expirations'] += 1
+            return False
+        if time.monotonic() - pooled.released < self.ping_after:
+            return True
+        if self._healthy(pooled):
+            return True
+        with self._cond:
+            self._stats['health_failures'] += 1
+        return False
+
+    def _expired(self, pooled):
+        return time.monotonic() - pooled.created >= self.max_lifetime
+
+    @staticmethod
+    def _healthy(pooled):
+        try:
+            pooled.connection.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, pooled):
+        with self._cond:
+            self._stats['discards'] += 1
+        self._close(pooled)
+        self._forget()
+
+    def _close(self, pooled):
+        with self._cond:
+            self._all.discard(pooled)
+        try:
+            pooled.connection.close()
+        except sqlite3.Error:
+            pass
+
+    def _forget(self):
+        """Frees the slot of a connection that was closed or never opened."""
+        if self.mode == 'thread':
+            return
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+
+# Shared pools by absolute database path
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def _forget_pools_after_fork():
+    """
+    A forked child must not use SQLite connections opened by its parent,
+    so it drops the inherited pools and opens connections of its own.
+    """
+    global _pools, _pool_lock
+    _pools = {}
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pools_after_fork)
+
+
+def get_pool(db_file=DB_FILE):
+    """
+    Returns the shared pool for `db_file`, which with_db_connection
+    (pooled=True) borrows from; created with the defaults on first use.
+    """
+    key = os.path.abspath(db_file)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = SQLitePool(db_file)
+    return pool
+
+
+def set_pool(new_pool):
+    """
+    Makes `new_pool` the shared pool for its file, e.g. to change its
+    mode or size; idle connections of the pool it replaces are closed.
+    set_pool(None) closes and forgets every shared pool.
+    """
+    with _pool_lock:
+        if new_pool is None:
+            old = list(_pools.values())
+            _pools.clear()
+        else:
+            key = os.path.abspath(new_pool.db_file)
+            old = [_pools[key]] if _pools.get(key) not in (None, new_pool) else []
+            _pools[key] = new_pool
+    for pool in old:
+        pool.close()
@@ -0,0 +1,123 @@
+"""
+Prepared-statement reuse for pooled connections.
+
+sqlite3 already keeps the compiled statements of a connection in an
+LRU keyed by the SQL text (`cached_statements`), but the decorator
+stack defeats it: track_tables(), which cache_query and transactional
+use, installs an authorizer, and installing one expires every prepared
+statement, so the next call parses its SQL again.
+
+StatementCachingConnection installs its authorizer once and remembers,
+per SQL text, the tables the statement reads and writes (an LRU of
+`cached_statements` texts, like sqlite3's own), so tracking costs
+nothing once a statement is known and compiled statements stay valid.
+Cursors are not reused: creating one costs less than making sure an
+old one is finished with. Decorated functions do not change; give the
+pool a statement cache:
+
+    db_pool.set_pool(db_pool.SQLitePool("users.db", statement_cache=256))
+
+    @with_db_connection(pooled=True)
+    def get_user_by_id(conn, user_id):
+        cursor = conn.cursor()  # statement compiled once per connection
+        ...
+"""
+import sqlite3
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from cache_engine import CachedConnection, TableAccess
+
+STATEMENT_CACHE_SIZE = 128
+
+
+class StatementCursor(sqlite3.Cursor):
+    """Cursor that reports the tables of known statements it runs."""
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self._run(super().executemany, sql, parameters)
+
+    def _run(self, method, sql, parameters):
+        connection = self.connection
+        statement = connection._prepare(sql)
+        connection._preparing = statement
+        try:
+            method(sql, parameters)
+        finally:
+            connection._preparing = None
+        # A compiled statement is not authorized again; report its tables
+        for tables in connection._trackers:
+            tables.reads |= statement.reads
+            tables.writes |= statement.writes
+        return self
+
+
+class StatementCachingConnection(CachedConnection):
+    """
+    CachedConnection that knows the tables of its `cached_statements`
+    most recent SQL texts; see the module doc.
+    """
+
+    def __init__(self, database, *args, **kwargs):
+        super().__init__(database, *args, **kwargs)
+        self.statement_cache_size = kwargs.get('cached_statements',
+                                               STATEMENT_CACHE_SIZE)
+        self._statements = OrderedDict()  # SQL text -> TableAccess
+        # The statement whose execute() may prepare it right now
+        self._preparing = None
+        self._statement_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.set_authorizer(self._authorize)
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or StatementCursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+    @contextmanager
+    def track_tables(self):
+        """
+        Collects the tables used by the statements run in the block.
+        The authorizer stays installed, so nothing is re-prepared.
+        """
+        tables = TableAccess()
+        self._trackers.append(tables)
+        try:
+            yield tables
+        finally:
+            self._trackers.remove(tables)
+
+    def statement_stats(self):
+        stats = dict(self._statement_stats)
+        stats['statements'] = len(self._statements)
+        return stats
+
+    def _recording(self):
+        if self._preparing is None:
+            return self._trackers
+        return self._trackers + [self._preparing]
+
+    def _prepare(self, sql):
+        """The TableAccess of `sql`, filled in when it is compiled."""
+        statement = self._statements.get(sql)
+        if statement is not None:
+            self._statement_stats['hits'] += 1
+            self._statements.move_to_end(sql)
+            return statement
+
+        self._statement_stats['misses'] += 1
+        # sqlite3 may still hold a compiled copy that it would run without
+        # authorizing it again; re-installing the authorizer expires it
+        self.set_authorizer(self._authorize)
+        statement = self._statements[sql] = TableAccess()
+        if len(self._statements) > self.statement_cache_size:
+            self._statements.popitem(last=False)
+            self._statement_stats['evictions'] += 1
+        return statement
+
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Unit tests for cache_engine.py
+"""
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from cache_engine import CachedConnection, QueryCache, make_key, result_size
+
+transactional_module = __import__('2-transactional')
+cache_query_module = __import__('4-cache_query')
+
+
+def make_users_db(directory):
+    """Creates a small users.db in `directory` and returns its path."""
+    path = os.path.join(directory, "users.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, "
+                 "email TEXT, age INTEGER)")
+    conn.execute("CREATE TABLE other (id INTEGER PRIMARY KEY)")
+    conn.executemany("INSERT INTO users VALUES (?, ?, ?, ?)",
+                     [(i, f"User {i}", f"user{i}@example.com", 20 + i)
+                      for i in range(1, 11)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+class TestQueryCache(unittest.TestCase):
+    """
+    Test class for the bounds, expiry and invalidation of QueryCache.
+    """
+
+    def test_get_missing(self):
+        """
+        Test that an unknown key is a miss.
+        """
+        cache = QueryCache()
+        self.assertIs(cache.get('key'), QueryCache.MISSING)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_put_and_get(self):
+        """
+        Test that a stored value is returned and counted as a hit.
+        """
+        cache = QueryCache()
+        self.assertTrue(cache.put('key', [(1, 'a')], ('users',)))
+        self.assertEqual(cache.get('key'), [(1, 'a')])
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['bytes'], result_size([(1, 'a')]))
+
+    def test_evicts_least_recently_used(self):
+        """
+        Test that the entry bound evicts the least recently read entry.
+        """
+        cache = QueryCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIs(cache.get('b'), QueryCache.MISSING)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_evicts_by_bytes(self):
+        """
+        Test that the byte bound evicts entries until the rest fit.
+        """
+        value = [(i, 'x' * 100) for i in range(10)]
+        size = result_size(value)
+        cache = QueryCache(max_bytes=size * 2)
+        for key in ('a', 'b', 'c'):
+            cache.put(key, list(value))
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.bytes, size * 2)
+        self.assertIs(cache.get('a'), QueryCache.MISSING)
+
+    def test_skips_values_over_max_bytes(self):
+        """
+        Test that a value bigger than the whole cache is not stored.
+        """
+        cache = QueryCache(max_bytes=100)
+        self.assertFalse(cache.put('key', ['x' * 1000]))
+        self.assertEqual(len(cache), 0)
+
+    def test_expires_after_ttl(self):
+        """
+        Test that an entry is dropped once its TTL has run out.
+        """
+        cache = QueryCache(ttl=0.05)
+        cache.put('short', 1)
+        cache.put('long', 2, ttl=60)
+        time.sleep(0.1)
+        self.assertIs(cache.get('short'), QueryCache.MISSING)
+        self.assertEqual(cache.get('long'), 2)
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_invalidate_tables(self):
+        """
+        Test that invalidating a table drops the entries that read it,
+        and those whose tables are unknown, but no others.
+        """
+        cache = QueryCache()
+        cache.put('users', 1, ('users',))
+        cache.put('other', 2, ('other',))
+        cache.put('unknown', 3)
+        self.assertEqual(cache.invalidate(['USERS']), 2)
+        self.assertIs(cache.get('users'), QueryCache.MISSING)
+        self.assertIs(cache.get('unknown'), QueryCache.MISSING)
+        self.assertEqual(cache.get('other'), 2)
+
+    def test_put_after_invalidation_is_dropped(self):
+        """
+        Test that a value loaded before an invalidation is not stored.
+        """
+        cache = QueryCache()
+        generation = cache.generation
+        cache.invalidate(['users'])
+        self.assertFalse(cache.put('key', 1, ('users',),
+                                   generation=generation))
+        self.assertIs(cache.get('key'), QueryCache.MISSING)
+
+
+def wait_until(condition, timeout=5.0):
+    """Polls `condition` until it holds; fails the test after `timeout`."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Condition not met in time")
+        time.sleep(0.005)
+
+
+class TestSingleFlight(unittest.TestCase):
+    """
+    Test class for the coalescing of concurrent misses in get_or_load.
+    """
+    callers = 8
+
+    def run_callers(self, cache, load):
+        """Calls get_or_load from `callers` threads; returns their outcomes."""
+        outcomes = [None] * self.callers
+
+        def caller(index):
+            try:
+                outcomes[index] = cache.get_or_load('key', load)
+            except Exception as e:
+                outcomes[index] = e
+
+        threads = [threading.Thread(target=caller, args=(index,))
+                   for index in range(self.callers)]
+        for thread in threads:
+            thread.start()
+        return threads, outcomes
+
+    def test_concurrent_misses_load_once(self):
+        """
+        Test that callers missing the same key share one load.
+        """
+        cache = QueryCache()
+        release = threading.Event()
+        loads = []
+
+        def load():
+            loads.append(1)
+            release.wait(5)
+            return [(1, 'a')], ('users',)
+
+        threads, outcomes = self.run_callers(cache, load)
+        wait_until(lambda: cache.stats()['coalesced'] == self.callers - 1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(outcomes, [[(1, 'a')]] * self.callers)
+        self.assertEqual(cache.get('key'), [(1, 'a')])
+
+    def test_failed_load_raises_in_every_caller(self):
+        """
+        Test that a failing load raises in all waiting callers and that
+        the next miss loads again.
+        """
+        cache = QueryCache()
+        release = threading.Event()
+
+        def load():
+            release.wait(5)
+            raise sqlite3.OperationalError("database is locked")
+
+        threads, outcomes = self.run_callers(cache, load)
+        wait_until(lambda: cache.stats()['coalesced'] == self.callers - 1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        for outcome in outcomes:
+            self.assertIsInstance(outcome, sqlite3.OperationalError)
+        self.assertIs(cache.get('key'), QueryCache.MISSING)
+
+        self.assertEqual(cache.get_or_load('key', lambda: (2, ())), 2)
+        self.assertEqual(cache.stats()['loads'], 2)
+
+    def test_async_misses_load_once(self):
+        """
+        Test that tasks missing the same key await one load, which
+        survives the cancellation of one of them.
+        """
+        cache = QueryCache()
+        loads = []
+
+        async def load():
+            loads.append(1)
+            await asyncio.sleep(0.05)
+            return 'value', ()
+
+        async def main():
+            tasks = [asyncio.ensure_future(cache.get_or_load_async('key', load))
+                     for _ in range(self.callers)]
+            await asyncio.sleep(0.01)
+            tasks[0].cancel()
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+        outcomes = asyncio.run(main())
+        self.assertIsInstance(outcomes[0], asyncio.CancelledError)
+        self.assertEqual(outcomes[1:], ['value'] * (self.callers - 1))
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(cache.get('key'), 'value')
+
+
+class TestBackgroundRefresh(unittest.TestCase):
+    """
+    Test class for stale-while-revalidate and top-N refresh.
+    """
+
+    def make_cache(self, **options):
+        cache = QueryCache(**options)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_serves_stale_while_refreshing(self):
+        """
+        Test that an expired entry is served while the worker reloads it.
+        """
+        cache = self.make_cache(ttl=0.05, stale_ttl=60)
+        cache.put('key', 'old', refresh=lambda: ('new', ()))
+        time.sleep(0.1)
+        self.assertEqual(cache.get('key'), 'old')
+        wait_until(lambda: cache.get('key') == 'new')
+        stats = cache.stats()
+        # The refreshed entry can expire again while we poll
+        self.assertGreaterEqual(stats['stale_hits'], 1)
+        self.assertGreaterEqual(stats['refreshes'], 1)
+
+    def test_drops_entries_past_stale_ttl(self):
+        """
+        Test that an entry is a miss once its stale_ttl has run out too.
+        """
+        cache = self.make_cache(ttl=0.02, stale_ttl=0.02)
+        cache.put('key', 'old', refresh=lambda: ('new', ()))
+        time.sleep(0.1)
+        self.assertIs(cache.get('key'), QueryCache.MISSING)
+
+    def test_failed_refresh_keeps_stale_value(self):
+        """
+        Test that a refresh that raises leaves the stale value in place.
+        """
+        def refresh():
+            raise sqlite3.OperationalError("database is locked")
+
+        cache = self.make_cache(ttl=0.05, stale_ttl=60)
+        cache.put('key', 'old', refresh=refresh)
+        time.sleep(0.1)
+        self.assertEqual(cache.get('key'), 'old')
+        wait_until(lambda: cache.stats()['refresh_errors'] == 1)
+        self.assertEqual(cache.get('key'), 'old')
+
+    def test_refreshes_hot_entries_ahead_of_expiry(self):
+        """
+        Test that the most-read entry is reloaded before it expires, and
+        an entry nobody reads is not.
+        """
+        cache = self.make_cache(ttl=0.5, refresh_top=1, refresh_ahead=1.0,
+                                refresh_interval=0.05)
+        reloads = {'hot': 0, 'cold': 0}
+
+        def refresher(key):
+            def refresh():
+                reloads[key] += 1
+                return f"{key} {reloads[key]}", ()
+            return refresh
+
+        for key in reloads:
+            cache.put(key, f"{key} 0", refresh=refresher(key))
+        cache.get('hot')
+        wait_until(lambda: reloads['hot'] >= 1, timeout=0.4)
+        self.assertEqual(cache.get('hot'), f"hot {reloads['hot']}")
+        self.assertEqual(reloads['cold'], 0)
+
+    def test_cache_query_refreshes_over_new_connection(self):
+        """
+        Test that cache_query's background refresh reads the database
+        again after the caller's connection was closed.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = make_users_db(directory.name)
+        saved = cache_query_module.DB_FILE
+        cache_query_module.DB_FILE = path
+        self.addCleanup(setattr, cache_query_module, 'DB_FILE', saved)
+        cache = self.make_cache(ttl=0.05, stale_ttl=60)
+
+        @cache_query_module.with_db_connection
+        @cache_query_module.cache_query(cache=cache)
+        def fetch(conn, query):
+            return conn.execute(query).fetchall()
+
+        query = "SELECT name FROM users WHERE id = 1"
+        self.assertEqual(fetch(query=query), [('User 1',)])
+        # Changed behind the cache's back, so only a refresh can see it
+        conn = sqlite3.connect(path)
+        conn.execute("UPDATE users SET name = 'Renamed' WHERE id = 1")
+        conn.commit()
+        conn.close()
+        time.sleep(0.1)
+        self.assertEqual(fetch(query=query), [('User 1',)])
+        wait_until(lambda: fetch(query=query) == [('Renamed',)])
+
+
+class TestCachedConnection(unittest.TestCase):
+    """
+    Test class for the table tracking of CachedConnection.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = make_users_db(self.directory.name)
+        self.conn = sqlite3.connect(self.path, factory=CachedConnection)
+
+    def tearDown(self):
+        self.conn.close()
+        self.directory.cleanup()
+
+    def test_tracks_reads_and_writes(self):
+        """
+        Test that track_tables() reports the tables read and written.
+        """
+        with self.conn.track_tables() as tables:
+            self.conn.execute("SELECT * FROM users").fetchall()
+            self.conn.execute("DELETE FROM other")
+        self.assertEqual(tables.reads, {'users'})
+        self.assertEqual(tables.writes, {'other'})
+
+    def test_tracks_cached_statements(self):
+        """
+        Test that a statement already in sqlite3's cache is still seen.
+        """
+        query = "SELECT * FROM users WHERE id = ?"
+        self.conn.execute(query, (1,)).fetchall()
+        with self.conn.track_tables() as tables:
+            self.conn.execute(query, (2,)).fetchall()
+        self.assertEqual(tables.reads, {'users'})
+
+    def test_make_key_uses_database_file(self):
+        """
+        Test that cache keys tell databases apart.
+        """
+        memory = sqlite3.connect(':memory:', factory=CachedConnection)
+        self.assertNotEqual(make_key(self.conn, "SELECT 1"),
+                            make_key(memory, "SELECT 1"))
+        memory.close()
+
+
+class TestWriteInvalidation(unittest.TestCase):
+    """
+    Test class for @transactional writes invalidating @cache_query results.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = make_users_db(self.directory.name)
+        self.saved = (cache_query_module.DB_FILE, transactional_module.DB_FILE)
+        cache_query_module.DB_FILE = transactional_module.DB_FILE = path
+        self.cache = QueryCache()
+        self.runs = 0
+
+        @cache_query_module.with_db_connection
+        @cache_query_module.cache_query(cache=self.cache)
+        def fetch(conn, query):
+            self.runs += 1
+            return conn.execute(query).fetchall()
+        self.fetch = fetch
+
+    def tearDown(self):
+        cache_query_module.DB_FILE, transactional_module.DB_FILE = self.saved
+        self.directory.cleanup()
+
+    def test_write_drops_results_of_the_table(self):
+        """
+        Test that a committed write reloads results that read its table.
+        """
+        query = "SELECT email FROM users WHERE id = 1"
+        self.fetch(query=query)
+        self.fetch(query=query)
+        self.assertEqual(self.runs, 1)
+
+        transactional_module.update_user_email(user_id=1,
+                                               new_email='new@example.com')
+        self.assertEqual(self.fetch(query=query), [('new@example.com',)])
+        self.assertEqual(self.runs, 2)
+
+    def test_write_keeps_results_of_other_tables(self):
+        """
+        Test that a write leaves results of untouched tables cached.
+        """
+        query = "SELECT * FROM other"
+        self.fetch(query=query)
+        transactional_module.update_user_email(user_id=1,
+                                               new_email='new@example.com')
+        self.fetch(query=query)
+        self.assertEqual(self.runs, 1)
+
+    def test_rolled_back_write_keeps_results(self):
+        """
+        Test that a write that raises is rolled back and drops nothing.
+        """
+        query = "SELECT email FROM users WHERE id = 1"
+        self.fetch(query=query)
+
+        @transactional_module.with_db_connection
+        @transactional_module.transactional
+        def failing_update(conn):
+            conn.execute("UPDATE users SET email = 'x' WHERE id = 1")
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            failing_update()
+        self.assertEqual(self.fetch(query=query), [('user1@example.com',)])
+        self.assertEqual(self.runs, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Unit tests for db_pool.py
+"""
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from db_pool import PoolError, SQLitePool, get_pool, set_pool
+from test_cache_engine import make_users_db
+
+with_db_connection_module = __import__('1-with_db_connection')
+
+
+class TestSQLitePool(unittest.TestCase):
+    """
+    Test class for checkouts and releases of SQLitePool.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = make_users_db(self.directory.name)
+        self.pools = []
+
+    def tearDown(self):
+        for pool in self.pools:
+            pool.close()
+        self.directory.cleanup()
+
+    def make_pool(self, **options):
+        pool = SQLitePool(self.path, **options)
+        self.pools.append(pool)
+        return pool
+
+    def test_reuses_connection(self):
+        """
+        Test that a released connection is handed out again.
+        """
+        pool = self.make_pool(size=2)
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            self.assertIs(first, second)
+        stats = pool.stats()
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['creations'], 1)
+
+    def test_applies_pragmas(self):
+        """
+        Test that new connections get the pool's PRAGMAs.
+        """
+        pool = self.make_pool(pragmas={'journal_mode': 'WAL'})
+        with pool.connection() as conn:
+            (mode,) = conn.execute("PRAGMA journal_mode").fetchone()
+        self.assertEqual(mode, 'wal')
+
+    def test_times_out_when_full(self):
+        """
+        Test that a full shared pool raises PoolError after waiting.
+        """
+        pool = self.make_pool(size=1, checkout_timeout=0.05)
+        held = pool.acquire()
+        with self.assertRaises(PoolError):
+            pool.acquire()
+        pool.release(held)
+        stats = pool.stats()
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['waits'], 1)
+
+    def test_waiter_gets_released_connection(self):
+        """
+        Test that a waiting checkout gets a connection once one is released.
+        """
+        pool = self.make_pool(size=1, checkout_timeout=5)
+        held = pool.acquire()
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+        waiter.start()
+        pool.release(held)
+        waiter.join()
+        self.assertIs(got[0], held)
+        pool.release(got[0])
+
+    def test_rolls_back_on_release(self):
+        """
+        Test that uncommitted work is rolled back when a connection returns.
+        """
+        pool = self.make_pool(size=1)
+        with pool.connection() as conn:
+            conn.execute("DELETE FROM users")
+        with pool.connection() as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM users").fetchone()
+        self.assertEqual(count, 10)
+
+    def test_replaces_expired_connections(self):
+        """
+        Test that connections past max_lifetime are closed and replaced.
+        """
+        pool = self.make_pool(max_lifetime=0)
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            self.assertIsNot(first, second)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            first.execute("SELECT 1")
+
+    def test_discards_broken_connection(self):
+        """
+        Test that a connection that failed its health check is discarded.
+        """
+        pool = self.make_pool(size=1)
+        with self.assertRaises(sqlite3.Error):
+            with pool.connection() as conn:
+                conn.close()
+                conn.execute("SELECT 1")
+        with pool.connection() as conn:
+            self.assertEqual(conn.execute("SELECT 1").fetchone(), (1,))
+        self.assertEqual(pool.stats()['discards'], 1)
+
+    def test_thread_mode_keeps_one_connection_per_thread(self):
+        """
+        Test that thread mode reuses each thread's own connection.
+        """
+        pool = self.make_pool(mode='thread')
+        seen = {}
+
+        def borrow(name):
+            with pool.connection() as first:
+                pass
+            with pool.connection() as second:
+                seen[name] = (first, second)
+
+        threads = [threading.Thread(target=borrow, args=(name,))
+                   for name in ('a', 'b')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIs(seen['a'][0], seen['a'][1])
+        self.assertIsNot(seen['a'][0], seen['b'][0])
+
+    def test_rejects_unknown_mode(self):
+        """
+        Test that an unknown mode raises ValueError.
+        """
+        with self.assertRaises(ValueError):
+            SQLitePool(self.path, mode='other')
+
+
+class TestPooledDecorator(unittest.TestCase):
+    """
+    Test class for with_db_connection(pooled=True).
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = make_users_db(self.directory.name)
+        self.saved = with_db_connection_module.DB_FILE
+        with_db_connection_module.DB_FILE = self.path
+
+        @with_db_connection_module.with_db_connection(pooled=True)
+        def get_user_by_id(conn, user_id):
+            return conn.execute("SELECT name FROM users WHERE id = ?",
+                                (user_id,)).fetchone()
+        self.get_user_by_id = get_user_by_id
+
+    def tearDown(self):
+        set_pool(None)
+        with_db_connection_module.DB_FILE = self.saved
+        self.directory.cleanup()
+
+    def test_borrows_from_shared_pool(self):
+        """
+        Test that pooled calls share the pool set for DB_FILE.
+        """
+        set_pool(SQLitePool(self.path, size=1))
+        self.assertEqual(self.get_user_by_id(user_id=1), ('User 1',))
+        self.assertEqual(self.get_user_by_id(user_id=2), ('User 2',))
+        stats = get_pool(self.path).stats()
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['creations'], 1)
+
+    def test_default_pool_follows_db_file(self):
+        """
+        Test that without set_pool() the pooled path opens DB_FILE.
+        """
+        self.assertEqual(self.get_user_by_id(user_id=3), ('User 3',))
+        self.assertEqual(get_pool(self.path).db_file, self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
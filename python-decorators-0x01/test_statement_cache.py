@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Unit tests for statement_cache.py
+"""
+import sqlite3
+import tempfile
+import unittest
+
+from cache_engine import QueryCache
+from db_pool import SQLitePool, set_pool
+from statement_cache import StatementCachingConnection
+from test_cache_engine import make_users_db
+
+transactional_module = __import__('2-transactional')
+cache_query_module = __import__('4-cache_query')
+
+
+class TestStatementCachingConnection(unittest.TestCase):
+    """
+    Test class for the per-SQL table memo of StatementCachingConnection.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = make_users_db(self.directory.name)
+        self.conn = sqlite3.connect(self.path, cached_statements=2,
+                                    factory=StatementCachingConnection)
+
+    def tearDown(self):
+        self.conn.close()
+        self.directory.cleanup()
+
+    def test_reports_tables_of_known_statements(self):
+        """
+        Test that a statement run again still reports its tables.
+        """
+        query = "SELECT * FROM users WHERE id = ?"
+        for user_id in (1, 2):
+            with self.conn.track_tables() as tables:
+                self.conn.execute(query, (user_id,)).fetchone()
+            self.assertEqual(tables.reads, {'users'})
+        stats = self.conn.statement_stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+
+    def test_reports_writes(self):
+        """
+        Test that writes are reported on every run of a statement.
+        """
+        query = "UPDATE users SET age = age + 1 WHERE id = ?"
+        for user_id in (1, 2):
+            with self.conn.track_tables() as tables:
+                self.conn.execute(query, (user_id,))
+            self.assertEqual(tables.writes, {'users'})
+        self.conn.rollback()
+
+    def test_nested_cursors(self):
+        """
+        Test that statements run while another cursor is open are tracked.
+        """
+        with self.conn.track_tables() as tables:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT id FROM users LIMIT 3")
+            for _ in cursor:
+                self.conn.execute("SELECT * FROM other").fetchall()
+        self.assertEqual(tables.reads, {'users', 'other'})
+
+    def test_evicts_least_recently_used(self):
+        """
+        Test that the memo holds at most cached_statements texts, and that
+        an evicted statement is tracked again when it comes back.
+        """
+        for query in ("SELECT 1", "SELECT 2", "SELECT * FROM users"):
+            self.conn.execute(query).fetchall()
+        stats = self.conn.statement_stats()
+        self.assertEqual(stats['statements'], 2)
+        self.assertEqual(stats['evictions'], 1)
+
+        self.conn.execute("SELECT 3").fetchall()
+        with self.conn.track_tables() as tables:
+            self.conn.execute("SELECT * FROM users").fetchall()
+        self.assertEqual(tables.reads, {'users'})
+
+
+class TestPoolStatementCache(unittest.TestCase):
+    """
+    Test class for pools created with a statement cache.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = make_users_db(self.directory.name)
+        self.pool = SQLitePool(self.path, size=1, statement_cache=8)
+        set_pool(self.pool)
+        self.saved = cache_query_module.DB_FILE
+        cache_query_module.DB_FILE = self.path
+
+    def tearDown(self):
+        set_pool(None)
+        cache_query_module.DB_FILE = self.saved
+        self.directory.cleanup()
+
+    def test_pool_uses_statement_cache(self):
+        """
+        Test that pooled connections cache statements and report them.
+        """
+        for _ in range(3):
+            with self.pool.connection() as conn:
+                self.assertIsInstance(conn, StatementCachingConnection)
+                conn.execute("SELECT * FROM users WHERE id = 1").fetchone()
+        statements = self.pool.stats()['statements']
+        self.assertEqual(statements['misses'], 1)
+        self.assertEqual(statements['hits'], 2)
+
+    def test_pooled_write_invalidates_cache(self):
+        """
+        Test that @transactional writes over pooled connections drop
+        the cached results of the table they wrote.
+        """
+        cache = QueryCache()
+        runs = []
+
+        @cache_query_module.with_db_connection(pooled=True)
+        @cache_query_module.cache_query(cache=cache)
+        def fetch(conn, query):
+            runs.append(query)
+            return conn.execute(query).fetchall()
+
+        @cache_query_module.with_db_connection(pooled=True)
+        @transactional_module.transactional
+        def update_user_email(conn, user_id, new_email):
+            conn.execute("UPDATE users SET email = ? WHERE id = ?",
+                         (new_email, user_id))
+
+        query = "SELECT email FROM users WHERE id = 1"
+        fetch(query=query)
+        for email in ('a@example.com', 'b@example.com'):
+            update_user_email(user_id=1, new_email=email)
+            self.assertEqual(fetch(query=query), [(email,)])
+        self.assertEqual(len(runs), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,55 +1,64 @@
-import mysql.connector
-from mysql.connector import Error, errorcode
-import os
+from mysql.connector import errorcode
 
-# Get credentials from environment variables
-DB_HOST = os.getenv('DB_HOST', 'localhost')
-DB_USER = os.getenv('DB_USER', 'root')
-DB_PASS = os.getenv('DB_PASS', '')
-DB_NAME = 'ALX_prodev'
+# Import the seed module for the database settings
+seed = __import__('seed')
+# Where the rows come from: MySQL by default, or a local stand-in
+row_source = __import__('row_source')
 
+COLUMNS = ('user_id', 'name', 'email', 'age')
 
-def stream_users():
+# Number of rows pulled from the source per fetch window
+FETCH_SIZE = 1000
+
+
+def stream_users(buffered=False, fetch_size=FETCH_SIZE, row_format='dict',
+                 stats=None, source=None, handle=None):
     """
     A generator that connects to the user_data table
     and yields rows one by one as dictionaries.
+
+    By default the rows are streamed from an unbuffered (server-side)
+    cursor, `fetch_size` rows at a time, so memory stays flat no matter
+    how large the table grows. Pass buffered=True to load the whole
+    result set into client memory before the first row is yielded.
+
+    row_format='compact' yields tuple-backed rows that still support
+    row['age'], and row_format='tuple' plain tuples (see rows.py); both
+    avoid building a dict per row.
+
+    Pass an instrument.ScanStats as `stats` to record the query latency,
+    fetch waits, row shaping and consumer time of the scan.
+
+    `source` is a row_source.RowSource (MySQL, SQLite or a file) and
+    defaults to row_source.get_source().
+
+    `handle` is an optional cancellation.ScanHandle: its cancel() stops
+    the scan from any thread, and its deadlines bound it. The generator
+    then raises ScanCancelled or ScanTimeout.
     """
-    connection = None
-    cursor = None
+    if source is None:
+        source = row_source.get_source()
+    plan = source.plan(COLUMNS)
+    shape = plan.shaper(row_format)
     try:
-        # Connect to the database
-        connection = mysql.connector.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASS,
-            database=DB_NAME
-        )
-        
-        # Add buffered=True to fetch all results at once
-        # This prevents the "Unread result" error when islice stops early
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        
-        # Define the query
-        query = "SELECT user_id, name, email, age FROM user_data"
-        
-        # Execute the query
-        cursor.execute(query)
-        
-        # Iterate over the buffered results
-        for row in cursor:
-            yield row
+        # On MySQL an unbuffered cursor leaves the result set on the
+        # server and reads it off the socket as we fetch. If the consumer
+        # stops early (e.g. islice), the pool kills the query and reads
+        # the few rows in flight instead of the rest of the table, or
+        # closes the connection if it cannot (see pool.release()).
+        # Either way, pull bounded windows of rows and hand them out one
+        # at a time.
+        for rows in source.scan(plan, fetch_size, shape, stats, handle,
+                                buffered=buffered):
+            for row in rows:
+                yield row
             
-    except Error as e:
+    except row_source.ERRORS as e:
         # Handle potential errors
-        if e.errno == errorcode.ER_ACCESS_DENIED_ERROR:
+        errno = getattr(e, 'errno', None)
+        if errno == errorcode.ER_ACCESS_DENIED_ERROR:
             print("Something is wrong with your user name or password")
-        elif e.errno == errorcode.ER_BAD_DB_ERROR:
-            print(f"Database {DB_NAME} does not exist")
+        elif errno == errorcode.ER_BAD_DB_ERROR:
+            print(f"Database {seed.DB_NAME} does not exist")
         else:
             print(f"Error while streaming: {e}")
-    finally:
-        # This block is crucial.
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
\ No newline at end of file
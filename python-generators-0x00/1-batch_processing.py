@@ -1,77 +1,243 @@
-import mysql.connector
-from mysql.connector import Error, errorcode
-import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 
-# Get credentials from environment variables
-DB_HOST = os.getenv('DB_HOST', 'localhost')
-DB_USER = os.getenv('DB_USER', 'root')
-DB_PASS = os.getenv('DB_PASS', '')
-DB_NAME = 'ALX_prodev'
+from mysql.connector import errorcode
 
+# Import the seed module for the database settings
+seed = __import__('seed')
+# Filter expressions that compile into SQL
+filters = __import__('filters')
+# Where the rows come from: MySQL by default, or a local stand-in
+row_source = __import__('row_source')
+# Fetch sizes tuned at runtime (batch_size='auto')
+adaptive = __import__('adaptive')
 
-def stream_users_in_batches(batch_size=1000):
+# Batches the pipelined producer may fetch ahead of the consumers
+PREFETCH = 4
+
+
+def stream_users_in_batches(batch_size=1000, where=None, columns=None,
+                            row_format='dict', stats=None, source=None,
+                            handle=None):
     """
     A generator that connects to the user_data table
     and yields rows in batches (lists) of a specified size.
+
+    Each batch is fetched from an unbuffered cursor only when it is
+    requested, so fetching can overlap with processing (see prefetch()).
+
+    `where` is a filters expression (e.g. filters.Age > 25) and
+    `columns` a list of the columns to return; both are applied by MySQL
+    so only the needed rows and bytes are transferred. Parts of `where`
+    that cannot be expressed in SQL are evaluated here instead, which
+    can make some batches smaller than batch_size.
+
+    row_format picks the row type: 'dict' (default), 'compact' or
+    'tuple' (see rows.py).
+
+    batch_size='auto' (or an adaptive.AdaptiveBatchSize) tunes the fetch
+    size as the scan goes, toward a target time and memory per batch,
+    so batches vary in size; `stats` records the sizes chosen.
+
+    `stats` is an optional instrument.ScanStats that records where the
+    scan spends its time, and `source` a row_source.RowSource (default:
+    row_source.get_source()). Sources that cannot run SQL evaluate the
+    whole of `where` here. `handle` is an optional
+    cancellation.ScanHandle, as for stream_users().
     """
-    connection = None
-    cursor = None
+    if source is None:
+        source = row_source.get_source()
+    plan = source.plan(columns, where)
+    shape = plan.shaper(row_format)
+    batch_size = adaptive.resolve(batch_size)
+
     try:
-        connection = mysql.connector.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASS,
-            database=DB_NAME
-        )
-        
-        # Use a buffered, dictionary cursor
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        
-        query = "SELECT user_id, name, email, age FROM user_data"
-        cursor.execute(query)
-        
-        batch = []
-        # --- LOOP 1: Iterates over all rows in the database ---
-        for row in cursor:
-            batch.append(row)
-            if len(batch) == batch_size:
+        # --- LOOP 1: Pulls one batch at a time off the source ---
+        # (an unbuffered cursor on a pooled connection for MySQL)
+        for batch in source.scan(plan, batch_size, shape, stats, handle):
+            if batch:
                 yield batch
-                batch = []  # Reset the batch
-        
-        # Yield any remaining users in the last batch
-        if batch:
-            yield batch
             
-    except Error as e:
-        if e.errno == errorcode.ER_ACCESS_DENIED_ERROR:
+    except row_source.ERRORS as e:
+        errno = getattr(e, 'errno', None)
+        if errno == errorcode.ER_ACCESS_DENIED_ERROR:
             print("Something is wrong with your user name or password")
-        elif e.errno == errorcode.ER_BAD_DB_ERROR:
-            print(f"Database {DB_NAME} does not exist")
+        elif errno == errorcode.ER_BAD_DB_ERROR:
+            print(f"Database {seed.DB_NAME} does not exist")
         else:
             print(f"Error while streaming: {e}")
-    finally:
-        # Ensure resources are closed
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
     
     return
 
 
-def batch_processing(batch_size):
+def prefetch(iterable, depth=PREFETCH):
+    """
+    A generator that runs `iterable` in a background producer thread and
+    yields its items, keeping up to `depth` of them ready in a bounded
+    queue. The producer blocks once the queue is full, so memory stays
+    bounded however slow the consumer is. Exceptions raised by the
+    producer are re-raised in the consumer.
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(entry):
+        # Give up if the consumer went away while we wait for room
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        source = iter(iterable)
+        try:
+            for item in source:
+                if not put(('item', item)):
+                    break
+        except BaseException as e:
+            put(('error', e))
+        else:
+            put(('done', None))
+        finally:
+            # Close the source in the thread that has been running it
+            if hasattr(source, 'close'):
+                source.close()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == 'done':
+                break
+            if kind == 'error':
+                raise value
+            yield value
+    finally:
+        stop.set()
+        producer.join()
+
+
+def _filter_batch(batch, where=None):
+    """Process: keeps the users matching `where` (runs in consumers)."""
+    if where is None:
+        return len(batch), batch
+    return len(batch), [user for user in batch if where.evaluate(user)]
+
+
+def _bounded_map(executor, func, iterable, window):
+    """
+    Like executor.map(), but with at most `window` tasks in flight, so a
+    fast producer cannot queue up the whole table. Results keep the
+    order of the input.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def batch_processing(batch_size, pipelined=False, prefetch_depth=PREFETCH,
+                     consumers=1, processes=False, where=filters.Age > 25,
+                     pushdown=True, stats=None, source=None):
     """
     Fetches user batches and processes them.
     Filters users to find those over 25 and prints them.
+
+    The filter is `where`, which by default is pushed down to MySQL so
+    only the matching users are fetched; pushdown=False fetches every
+    user and evaluates `where` in the consumers instead.
+
+    With pipelined=True a background producer fetches up to
+    `prefetch_depth` batches ahead while the batches are filtered, and
+    `consumers` > 1 filters several batches at once in a thread pool (or
+    a process pool with processes=True). Users are printed in table
+    order either way.
+
+    Returns a report with the rows fetched, users printed, elapsed
+    seconds and rows per second. With an instrument.ScanStats as `stats`
+    the report also carries its timings, with the consumer side split
+    into 'filter' and 'print' stages. When pipelined, its consumer_s is
+    timed in the consuming thread, per batch (per result with several
+    consumers). `source` picks the row source, as
+    for stream_users_in_batches().
     """
-    # --- LOOP 2: Iterates over the batches (lists) from the generator ---
-    for batch in stream_users_in_batches(batch_size):
-        
-        # --- LOOP 3: Iterates over users (dictionaries) in a single batch ---
-        for user in batch:
-            # Process: filter users over the age of 25
-            if user['age'] > 25:
-                # The main script expects this to be printed
-                print(user)
-    
-    return
\ No newline at end of file
+    start = time.perf_counter()
+    rows = matched = 0
+    if pushdown:
+        batches = stream_users_in_batches(batch_size, where=where, stats=stats,
+                                          source=source)
+        process = _filter_batch
+    else:
+        batches = stream_users_in_batches(batch_size, stats=stats,
+                                          source=source)
+        process = partial(_filter_batch, where=where)
+
+    def stage(name):
+        # Timed per batch, so printing a user costs nothing extra
+        return nullcontext() if stats is None else stats.stage(name)
+
+    if not pipelined:
+        # --- LOOP 2: Iterates over the batches (lists) from the generator ---
+        for batch in batches:
+            rows += len(batch)
+
+            # --- LOOP 3: Iterates over users (dictionaries) in a single batch ---
+            with stage('print'):
+                for user in batch:
+                    # Process: filter users over the age of 25, unless MySQL
+                    # already did
+                    if pushdown or where is None or where.evaluate(user):
+                        # The main script expects this to be printed
+                        print(user)
+                        matched += 1
+        mode = 'serial'
+    else:
+        batches = prefetch(batches, prefetch_depth)
+        # The fetches run in the producer thread, which cannot see how
+        # long this side works on a batch
+        consumed = (lambda items: items) if stats is None else stats.consumed
+        if consumers > 1:
+            executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+            with executor_class(max_workers=consumers) as executor:
+                # Twice the consumers keeps them busy without piling up
+                for seen, users in consumed(_bounded_map(
+                        executor, process, batches, consumers * 2)):
+                    rows += seen
+                    matched += len(users)
+                    with stage('print'):
+                        for user in users:
+                            print(user)
+        else:
+            for batch in consumed(batches):
+                with stage('filter'):
+                    seen, users = process(batch)
+                rows += seen
+                matched += len(users)
+                with stage('print'):
+                    for user in users:
+                        print(user)
+        mode = 'pipelined'
+
+    elapsed = time.perf_counter() - start
+    report = {
+        'mode': mode,
+        'rows': rows,
+        'matched': matched,
+        'seconds': elapsed,
+        'rows_per_sec': rows / elapsed if elapsed else 0.0,
+    }
+    if stats is not None:
+        report['stats'] = stats.as_dict()
+    return report
@@ -1,66 +1,213 @@
 """
 Module with a generator for lazy pagination.
+
+Two strategies are available:
+
+* offset  - `LIMIT ... OFFSET ...`; page N makes the server walk past
+            N * page_size rows, so a full scan is quadratic.
+* keyset  - seeks past the last row of the previous page on an indexed
+            column (`WHERE user_id > ... ORDER BY user_id LIMIT ...`),
+            so every page costs the same however deep we go.
+
+Keyset scans can be resumed from a cursor token; see next_cursor().
+Pages are read from a row_source (MySQL by default).
 """
-import mysql.connector
-from mysql.connector import Error
+import base64
+import json
+
+# Shapes the fetched tuples into dicts or compact rows
+rows_module = __import__('rows')
+# Filter expressions; keyset seeks are built from them so every row
+# source can run them
+filters = __import__('filters')
+# Where the rows come from: MySQL by default, or a local stand-in
+row_source = __import__('row_source')
 
-# Import the seed module to use its connection function
-seed = __import__('seed')
+# Columns of every page, in this order (also the positions of 'tuple' rows)
+COLUMNS = ('user_id', 'name', 'email', 'age')
+SELECT = f"SELECT {', '.join(COLUMNS)} FROM user_data"
 
+# Columns keyset pagination may seek on. Every entry must be unique
+# and indexed: seeking past the last value of a page would skip rows
+# sharing it, and without an index each page is a full table scan.
+KEYSET_COLUMNS = ('user_id',)
 
-def paginate_users(page_size, offset):
+
+def paginate_users(page_size, offset, row_format='dict', stats=None,
+                   source=None, handle=None):
     """
     Fetches a specific page of users from the database.
     This is a helper function, not a generator.
     """
-    connection = None
-    cursor = None
+    if source is None:
+        source = row_source.get_source()
+    plan = source.plan(COLUMNS)
     try:
-        connection = seed.connect_to_prodev()
-        if not connection:
-            return []  # Return empty list on connection failure
-
-        cursor = connection.cursor(dictionary=True)
-        
-        # Use parameterized query for safety, converting page_size/offset to int
-        query = "SELECT * FROM user_data LIMIT %s OFFSET %s"
-        cursor.execute(query, (int(page_size), int(offset)))
-        
-        rows = cursor.fetchall()
+        # The source binds page_size/offset as parameters, converted to int
+        rows = source.page(plan, page_size, plan.shaper(row_format),
+                           offset=offset, stats=stats, handle=handle)
         
-    except Error as e:
+    except row_source.ERRORS as e:
+        # Also covers failing to get a connection
         print(f"Error during pagination: {e}")
         rows = []
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
             
     return rows
 
 
-def lazy_pagination(page_size):
+def keyset_filter(key, after):
+    """
+    Returns (where, order_by) for one keyset page: the filters
+    expression seeking past `after` (None on the first page) and the
+    columns to sort on.
+    """
+    if key not in KEYSET_COLUMNS:
+        raise ValueError(
+            f"Cannot paginate on {key!r}; choose one of {KEYSET_COLUMNS}")
+
+    order_by = (key,)
+    if after is None:
+        return None, order_by
+    return filters.Column(key) > after[0], order_by
+
+
+def keyset_query(key, after):
+    """Builds the MySQL seek query and its parameters for one keyset page."""
+    where, order_by = keyset_filter(key, after)
+    query, params = filters.ScanPlan(COLUMNS, where).sql(
+        order_by=', '.join(order_by))
+    return f"{query} LIMIT %s", params
+
+
+def paginate_users_keyset(page_size, after=None, key='user_id',
+                          row_format='dict', stats=None, source=None,
+                          handle=None):
+    """
+    Fetches the page of users that comes right after `after`.
+
+    `after` is the sort key of the last row already seen, as returned by
+    decode_cursor(), or None for the first page. Only the rows of the
+    page itself are read, thanks to the index on `key`.
+    """
+    if source is None:
+        source = row_source.get_source()
+    where, order_by = keyset_filter(key, after)
+    plan = source.plan(COLUMNS, where)
+    try:
+        rows = source.page(plan, page_size, plan.shaper(row_format),
+                           order_by=order_by, stats=stats, handle=handle)
+
+    except row_source.ERRORS as e:
+        print(f"Error during pagination: {e}")
+        rows = []
+
+    return rows
+
+
+def encode_cursor(key, values):
+    """Packs a sort key position into an opaque, URL-safe cursor token."""
+    payload = json.dumps({'key': key, 'after': list(values)}, default=str)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token):
+    """Unpacks a cursor token into (key, values)."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        return payload['key'], tuple(payload['after'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor token: {token!r}") from e
+
+
+def sort_position(row, key):
+    """Returns the sort key of a row in any of the row formats."""
+    if isinstance(row, (dict, rows_module.CompactRow)):
+        return (row[key],)
+    return (row[COLUMNS.index(key)],)
+
+
+def next_cursor(page, key='user_id'):
+    """
+    Returns the token that resumes a keyset scan right after `page`.
+    Store it once the page has been processed and pass it back to
+    lazy_pagination(cursor=...) to pick the scan up where it stopped.
+    """
+    return encode_cursor(key, sort_position(page[-1], key))
+
+
+def lazy_pagination(page_size, mode='keyset', key='user_id', cursor=None,
+                    row_format='dict', stats=None, source=None, handle=None):
     """
     A generator that yields one page of users at a time.
     It fetches the next page only when requested.
+
+    mode='keyset' (the default) seeks on the indexed `key` column and can
+    resume from a `cursor` token; mode='offset' uses LIMIT/OFFSET.
+    row_format is 'dict' (default), 'compact' or 'tuple' (see rows.py).
+
+    `stats` is an optional instrument.ScanStats; every page adds one
+    query to it. `source` is a row_source.RowSource, by default
+    row_source.get_source().
+
+    `handle` is an optional cancellation.ScanHandle whose timeout bounds
+    the whole walk, across pages, and whose cancel() stops it; the
+    generator then raises ScanCancelled or ScanTimeout.
     """
-    offset = 0
-    
-    # This is the single loop
+    try:
+        yield from _pages(page_size, mode, key, cursor, row_format, stats,
+                          source, handle)
+    finally:
+        if stats is not None:
+            stats.finish()
+
+
+def _pages(page_size, mode, key, cursor, row_format, stats, source,
+           handle):
+    """The body of lazy_pagination(), minus the stats bookkeeping."""
+    if mode == 'offset':
+        offset = 0
+
+        # This is the single loop
+        while True:
+            # Fetch the next page
+            page = paginate_users(page_size, offset, row_format, stats, source,
+                                  handle)
+
+            # If the page is empty, we've reached the end
+            if not page:
+                break
+
+            # Yield the current page (which is a list of users)
+            yield page
+
+            # Prepare the offset for the *next* iteration
+            offset += page_size
+        return
+
+    if mode != 'keyset':
+        raise ValueError(f"Unknown pagination mode: {mode!r}")
+
+    after = None
+    if cursor is not None:
+        cursor_key, after = decode_cursor(cursor)
+        if cursor_key != key:
+            raise ValueError(
+                f"Cursor was issued for {cursor_key!r}, not {key!r}")
+
     while True:
-        # Fetch the next page
-        page = paginate_users(page_size, offset)
-        
-        # If the page is empty, we've reached the end
+        page = paginate_users_keyset(page_size, after, key, row_format, stats,
+                                     source, handle)
         if not page:
             break
-        
-        # Yield the current page (which is a list of users)
+
         yield page
-        
-        # Prepare the offset for the *next* iteration
-        offset += page_size
-    
+
+        # Remember where this page ended; the next query seeks past it
+        after = sort_position(page[-1], key)
+
+        # A short page means there is nothing left to read
+        if len(page) < page_size:
+            break
+
     # Added to satisfy potential checker
-    return
\ No newline at end of file
+    return
@@ -1,66 +1,210 @@
-import mysql.connector
-from mysql.connector import Error, errorcode
-import os
+from mysql.connector import errorcode
+from array import array
+from collections import Counter
 from decimal import Decimal  # Import Decimal to handle DECIMAL type from SQL
+from operator import itemgetter, mul
 
-# Get credentials from environment variables
-DB_HOST = os.getenv('DB_HOST', 'localhost')
-DB_USER = os.getenv('DB_USER', 'root')
-DB_PASS = os.getenv('DB_PASS', '')
-DB_NAME = 'ALX_prodev'
+try:
+    import numpy as np
+except ImportError:  # The columnar path falls back to array('H')
+    np = None
 
+# Import the seed module for the database settings
+seed = __import__('seed')
+# Where the rows come from: MySQL by default, or a local stand-in
+row_source = __import__('row_source')
 
-def stream_user_ages():
+# Ages pulled per round-trip by the columnar path
+AGE_BATCH_SIZE = 10000
+# Width of the age ranges counted by the histograms
+BUCKET_WIDTH = 10
+
+
+def stream_user_ages(source=None):
     """
     Generator that yields user ages one by one from the database.
+
+    `source` is a row_source.RowSource (default: row_source.get_source()).
+    Ages are Decimals from MySQL and ints from the other sources.
     """
-    connection = None
-    cursor = None
+    if source is None:
+        source = row_source.get_source()
+    # Optimization: Only select the 'age' column
+    plan = source.plan(['age'])
     try:
-        connection = mysql.connector.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASS,
-            database=DB_NAME
-        )
-        # Use dictionary=True to access by column name 'age'
-        # Use buffered=True to fetch all results
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        
-        # Optimization: Only select the 'age' column
-        query = "SELECT age FROM user_data"
-        cursor.execute(query)
-        
-        # Loop 1: Iterate over cursor and yield ages
-        for row in cursor:
-            yield row['age']  # This will be a Decimal object
+        # Plain tuples: no dict is built just to read one field
+        # Use buffered=True to fetch all results (MySQL)
+        for batch in source.scan(plan, AGE_BATCH_SIZE, buffered=True):
+            # Loop 1: Iterate over the batch and yield ages
+            for (age,) in batch:
+                yield age
             
-    except Error as e:
-        if e.errno == errorcode.ER_ACCESS_DENIED_ERROR:
+    except row_source.ERRORS as e:
+        errno = getattr(e, 'errno', None)
+        if errno == errorcode.ER_ACCESS_DENIED_ERROR:
             print("Something is wrong with your user name or password")
-        elif e.errno == errorcode.ER_BAD_DB_ERROR:
-            print(f"Database {DB_NAME} does not exist")
+        elif errno == errorcode.ER_BAD_DB_ERROR:
+            print(f"Database {seed.DB_NAME} does not exist")
         else:
             print(f"Error while streaming: {e}")
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
     
     return
 
 
-def calculate_average_age():
+def stream_age_batches(batch_size=AGE_BATCH_SIZE, stats=None, source=None):
+    """
+    Generator that yields user ages in compact array('H') batches of up
+    to `batch_size` values, two bytes per age instead of one Decimal
+    object each.
+
+    Database errors are raised rather than printed, so an aggregate is
+    never silently computed over part of the table. `stats` is an
+    optional instrument.ScanStats and `source` a row_source.RowSource.
+    """
+    if source is None:
+        source = row_source.get_source()
+    first = itemgetter(0)
+    # raw=True makes MySQL hand back the ages as bytes, which int()
+    # parses directly, skipping the Decimal conversion entirely
+    yield from source.scan(
+        source.plan(['age']), batch_size,
+        lambda rows: array('H', map(int, map(first, rows))), stats, raw=True)
+
+
+def _summarize(count, total, total_sq, lowest, highest, histogram):
+    """
+    Turns exact integer aggregates into the age statistics. Everything
+    is derived from integer sums, so the mean is the same Decimal the
+    row-by-row path produces.
+    """
+    if count == 0:
+        return {'count': 0, 'mean': Decimal(0), 'min': None, 'max': None,
+                'stddev': Decimal(0), 'histogram': {}}
+
+    # Population variance: (n * sum(x^2) - sum(x)^2) / n^2
+    variance_num = Decimal(count * total_sq - total * total)
+    return {
+        'count': count,
+        'mean': Decimal(total) / Decimal(count),
+        'min': lowest,
+        'max': highest,
+        'stddev': variance_num.sqrt() / Decimal(count),
+        'histogram': dict(sorted(histogram.items())),
+    }
+
+
+def _columnar_stats(batch_size, bucket_width, source):
+    """Aggregates the age batches with vectorized operations."""
+    count = total = total_sq = 0
+    lowest = highest = None
+    per_age = Counter() if np is None else None
+    bins = None
+
+    for batch in stream_age_batches(batch_size, source=source):
+        if np is not None:
+            ages = np.frombuffer(batch, dtype=np.uint16)
+            wide = ages.astype(np.int64)
+            total += int(wide.sum())
+            total_sq += int(np.dot(wide, wide))
+            batch_min, batch_max = int(ages.min()), int(ages.max())
+            counts = np.bincount(ages)
+            bins = counts if bins is None else _add_bins(bins, counts)
+        else:
+            total += sum(batch)
+            total_sq += sum(map(mul, batch, batch))
+            batch_min, batch_max = min(batch), max(batch)
+            per_age.update(batch)  # Counted in C, not a Python loop
+
+        count += len(batch)
+        lowest = batch_min if lowest is None else min(lowest, batch_min)
+        highest = batch_max if highest is None else max(highest, batch_max)
+
+    if bins is not None:
+        per_age = {age: int(n) for age, n in enumerate(bins) if n}
+
+    histogram = Counter()
+    for age, n in per_age.items():
+        histogram[age // bucket_width * bucket_width] += n
+    return _summarize(count, total, total_sq, lowest, highest, histogram)
+
+
+def _add_bins(bins, counts):
+    """Adds two bincount() results that may differ in length."""
+    if len(counts) > len(bins):
+        bins, counts = counts, bins
+    bins = bins.copy()
+    bins[:len(counts)] += counts
+    return bins
+
+
+def _pushdown_stats(bucket_width, source):
+    """Lets the database compute the aggregates and only fetches the results."""
+    if not isinstance(source, row_source.SQLSource):
+        raise ValueError(f"{source!r} cannot compute aggregates; "
+                         f"use mode='columnar'")
+    with source.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*), SUM(age), SUM(age * age), MIN(age), MAX(age) "
+            "FROM user_data")
+        count, total, total_sq, lowest, highest = cursor.fetchone()
+
+        # Ages are whole and non-negative, so subtracting the remainder
+        # floors them to their bucket in MySQL and SQLite alike
+        cursor.execute(
+            f"SELECT age - age % {source.placeholder} AS bucket, COUNT(*) "
+            f"FROM user_data GROUP BY bucket",
+            (bucket_width,))
+        histogram = {int(bucket): n for bucket, n in cursor.fetchall()}
+
+    if not count:
+        return _summarize(0, 0, 0, None, None, {})
+    return _summarize(count, int(total), int(total_sq),
+                      int(lowest), int(highest), histogram)
+
+
+def age_stats(mode='columnar', batch_size=AGE_BATCH_SIZE,
+              bucket_width=BUCKET_WIDTH, source=None):
+    """
+    Computes count, mean, min, max, population stddev and a histogram
+    (keyed by the first age of each `bucket_width`-wide range) of the
+    users' ages.
+
+    mode='columnar' streams the ages in compact batches and aggregates
+    them with NumPy (or array/C builtins when NumPy is missing);
+    mode='pushdown' asks the database for the aggregates directly, which
+    needs an SQL source (MySQL or SQLite).
+    """
+    if source is None:
+        source = row_source.get_source()
+    try:
+        if mode == 'columnar':
+            return _columnar_stats(batch_size, bucket_width, source)
+        if mode == 'pushdown':
+            return _pushdown_stats(bucket_width, source)
+    except row_source.ERRORS as e:
+        print(f"Error while aggregating: {e}")
+        return None
+    raise ValueError(f"Unknown aggregation mode: {mode!r}")
+
+
+def calculate_average_age(mode='decimal', source=None):
     """
     Calculates the average age by iterating over the stream_user_ages generator.
+
+    mode='columnar' and mode='pushdown' compute the same Decimal through
+    age_stats() instead of summing one Decimal per row. `source` picks
+    the row source, as for stream_user_ages().
     """
+    if mode != 'decimal':
+        stats = age_stats(mode, source=source)
+        return stats['mean'] if stats else Decimal(0)
+
     # Initialize as Decimal objects for precision
     total_age = Decimal(0)
     user_count = 0
     
     # Loop 2: Iterate over the generator
-    for age in stream_user_ages():
+    for age in stream_user_ages(source):
         total_age += age  # Decimal arithmetic
         user_count += 1
         
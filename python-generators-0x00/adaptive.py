@@ -0,0 +1,86 @@
+"""
+Adaptive fetch sizes for the batch generators.
+
+A fixed batch_size is a guess: narrow rows on a slow network want big
+batches (the round-trip dominates), while a slow consumer or wide rows
+want small ones (each batch takes long to process, or holds too much
+memory). AdaptiveBatchSize re-tunes the size after every batch:
+
+    for batch in stream_users_in_batches(batch_size='auto'):
+        ...
+
+    sizer = AdaptiveBatchSize(target_latency=0.02, memory_budget=2 << 20)
+    stats = ScanStats()
+    for batch in stream_users_in_batches(batch_size=sizer, stats=stats):
+        ...
+    print(stats.as_dict()['batch_sizes'])
+"""
+
+# Starting point, and the bounds the size is kept within
+INITIAL_SIZE = 1000
+MIN_SIZE = 100
+MAX_SIZE = 100000
+# Aim for each batch to take about this long, fetch plus processing
+TARGET_LATENCY = 0.05
+# Rough cap on the fetched bytes of one batch
+MEMORY_BUDGET = 8 * 1024 * 1024
+
+
+class AdaptiveBatchSize:
+    """
+    Picks the next fetch size from how the last batch went.
+
+    A batch that took less than half of `target_latency` (fetch plus the
+    consumer's time on it) doubles the size, as round-trips dominate;
+    one that took longer shrinks it in proportion, as the consumer or
+    the fetch is lagging. The size never exceeds what fits into
+    `memory_budget` bytes at the observed row width, nor leaves
+    [min_size, max_size].
+    """
+
+    def __init__(self, initial=INITIAL_SIZE, min_size=MIN_SIZE,
+                 max_size=MAX_SIZE, target_latency=TARGET_LATENCY,
+                 memory_budget=MEMORY_BUDGET):
+        if not 1 <= min_size <= max_size:
+            raise ValueError("Need 1 <= min_size <= max_size")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.memory_budget = memory_budget
+        self.size = self._clamp(initial)
+
+    def __repr__(self):
+        return f"AdaptiveBatchSize(size={self.size})"
+
+    def _clamp(self, size):
+        return max(self.min_size, min(self.max_size, int(size)))
+
+    def observe(self, rows, row_bytes, fetch_seconds, consumer_seconds):
+        """
+        Records one batch: `rows` fetched at about `row_bytes` each in
+        `fetch_seconds`, then held by the consumer for `consumer_seconds`.
+        Returns the new size.
+        """
+        if rows < self.size:
+            # A short batch is the end of the table, not a measurement
+            return self.size
+
+        elapsed = fetch_seconds + consumer_seconds
+        size = self.size
+        if elapsed > self.target_latency:
+            # Shrink in proportion, but at most fourfold per step
+            size = max(size * self.target_latency / elapsed, size / 4)
+        elif elapsed < self.target_latency / 2:
+            size = size * 2
+
+        if row_bytes:
+            size = min(size, self.memory_budget // row_bytes)
+        self.size = self._clamp(size)
+        return self.size
+
+
+def resolve(batch_size):
+    """Turns batch_size='auto' into a fresh AdaptiveBatchSize."""
+    if batch_size == 'auto':
+        return AdaptiveBatchSize()
+    return batch_size
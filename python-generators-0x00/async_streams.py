@@ -0,0 +1,260 @@
+"""
+Async counterparts of the user_data generators.
+
+They run on mysql.connector's asyncio driver (mysql.connector.aio,
+mysql-connector-python 8.3+), so many scans can share one event loop
+and one thread instead of blocking a thread each:
+
+    async for user in astream_users():
+        ...
+
+    async for page in alazy_pagination(100):
+        ...
+
+Connections come from a bounded, per-event-loop AsyncConnectionPool.
+"""
+import asyncio
+from contextlib import aclosing
+
+from mysql.connector import Error
+from mysql.connector.aio import connect
+from mysql.connector.errors import PoolError
+
+seed = __import__('seed')
+pool = __import__('pool')
+filters = __import__('filters')
+rows_module = __import__('rows')
+paginate = __import__('2-lazy_paginate')
+
+COLUMNS = ('user_id', 'name', 'email', 'age')
+FETCH_SIZE = 1000
+
+
+async def aconnect():
+    """Opens a new asyncio connection to the ALX_prodev database."""
+    return await connect(
+        host=seed.DB_HOST,
+        user=seed.DB_USER,
+        password=seed.DB_PASS,
+        database=seed.DB_NAME
+    )
+
+
+class AsyncConnectionPool:
+    """
+    A bounded pool of asyncio connections for one event loop. Tasks that
+    find it full wait for a release; nothing blocks the loop.
+    """
+
+    def __init__(self, size=pool.POOL_SIZE,
+                 checkout_timeout=pool.CHECKOUT_TIMEOUT, factory=aconnect):
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self._factory = factory
+        self._idle = []
+        self._slots = asyncio.Semaphore(size)
+        self._stats = {'checkouts': 0, 'waits': 0, 'creations': 0,
+                       'discards': 0}
+
+    async def acquire(self):
+        self._stats['checkouts'] += 1
+        if self._slots.locked():
+            self._stats['waits'] += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.checkout_timeout)
+        except asyncio.TimeoutError:
+            raise PoolError(f"No connection available within the checkout "
+                            f"timeout (pool size {self.size})") from None
+
+        if self._idle:
+            return self._idle.pop()
+        try:
+            connection = await self._factory()
+        except BaseException:
+            self._slots.release()
+            raise
+        self._stats['creations'] += 1
+        return connection
+
+    async def release(self, connection, discard=False):
+        """
+        Returns a connection to the pool; one left with unread rows by an
+        abandoned scan is shut down instead of drained.
+        """
+        try:
+            if not discard and connection.unread_result:
+                discard = True
+            if not discard and connection.in_transaction:
+                # End the read snapshot so the next scan sees fresh data
+                await connection.rollback()
+        except Error:
+            discard = True
+
+        if discard:
+            self._stats['discards'] += 1
+            try:
+                await connection.shutdown()
+            except Error:
+                pass
+        else:
+            self._idle.append(connection)
+        self._slots.release()
+
+    def stats(self):
+        snapshot = dict(self._stats)
+        snapshot.update(size=self.size, idle=len(self._idle))
+        return snapshot
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            await connection.close()
+
+
+# One pool per event loop: asyncio connections cannot cross loops
+_pools = {}
+
+
+def get_pool():
+    """Returns the AsyncConnectionPool of the running event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _pools:
+        # Forget the pools of loops that have been closed since
+        for stale in [other for other in _pools if other.is_closed()]:
+            del _pools[stale]
+        _pools[loop] = AsyncConnectionPool()
+    return _pools[loop]
+
+
+def set_pool(new_pool):
+    """Installs `new_pool` as the pool of the running event loop."""
+    _pools[asyncio.get_running_loop()] = new_pool
+
+
+async def _scan(query, params, size, shape):
+    """
+    Async generator shared by the scans: runs `query` on a pooled
+    connection and yields lists of up to `size` shaped rows.
+    """
+    connections = get_pool()
+    connection = await connections.acquire()
+    discard = False
+    try:
+        cursor = await connection.cursor()
+        await cursor.execute(query, params)
+        while True:
+            batch = await cursor.fetchmany(size)
+            if not batch:
+                break
+            yield shape(batch)
+        await cursor.close()
+    except Error:
+        discard = True
+        raise
+    finally:
+        # Also runs on aclose() when the consumer stops early
+        await connections.release(connection, discard)
+
+
+async def astream_users(fetch_size=FETCH_SIZE, row_format='dict'):
+    """
+    Async generator that yields the rows of user_data one by one, read
+    from an unbuffered cursor `fetch_size` rows at a time.
+    """
+    query = f"SELECT {', '.join(COLUMNS)} FROM user_data"
+    shape = rows_module.formatter(COLUMNS, row_format)
+    try:
+        # aclosing() releases the connection as soon as we are closed
+        async with aclosing(_scan(query, (), fetch_size, shape)) as scan:
+            async for rows in scan:
+                for row in rows:
+                    yield row
+    except Error as e:
+        print(f"Error while streaming: {e}")
+
+
+async def astream_users_in_batches(batch_size=1000, where=None, columns=None,
+                                   row_format='dict'):
+    """
+    Async generator that yields the rows of user_data in batches (lists),
+    with the same `where`, `columns` and `row_format` options as
+    stream_users_in_batches().
+    """
+    plan = filters.ScanPlan(columns, where)
+    query, params = plan.sql()
+
+    try:
+        shape = plan.shaper(row_format)
+        async with aclosing(_scan(query, params, batch_size, shape)) as scan:
+            async for batch in scan:
+                if batch:
+                    yield batch
+    except Error as e:
+        print(f"Error while streaming: {e}")
+
+
+async def apaginate_users_keyset(page_size, after=None, key='user_id',
+                                 row_format='dict'):
+    """Fetches the keyset page after `after` (see paginate_users_keyset)."""
+    query, params = paginate.keyset_query(key, after)
+    shape = rows_module.formatter(COLUMNS, row_format)
+    page = []
+    try:
+        async for rows in _scan(query, params + (int(page_size),),
+                                page_size, shape):
+            page.extend(rows)
+    except Error as e:
+        print(f"Error during pagination: {e}")
+        return []
+    return page
+
+
+async def apaginate_users(page_size, offset, row_format='dict'):
+    """Fetches one LIMIT/OFFSET page (see paginate_users)."""
+    query = f"{paginate.SELECT} LIMIT %s OFFSET %s"
+    shape = rows_module.formatter(COLUMNS, row_format)
+    page = []
+    try:
+        async for rows in _scan(query, (int(page_size), int(offset)),
+                                page_size, shape):
+            page.extend(rows)
+    except Error as e:
+        print(f"Error during pagination: {e}")
+        return []
+    return page
+
+
+async def alazy_pagination(page_size, mode='keyset', key='user_id',
+                           cursor=None, row_format='dict'):
+    """
+    Async generator that yields one page of users at a time, with the
+    same options and cursor tokens as lazy_pagination().
+    """
+    if mode == 'offset':
+        offset = 0
+        while True:
+            page = await apaginate_users(page_size, offset, row_format)
+            if not page:
+                break
+            yield page
+            offset += page_size
+        return
+
+    if mode != 'keyset':
+        raise ValueError(f"Unknown pagination mode: {mode!r}")
+
+    after = None
+    if cursor is not None:
+        cursor_key, after = paginate.decode_cursor(cursor)
+        if cursor_key != key:
+            raise ValueError(
+                f"Cursor was issued for {cursor_key!r}, not {key!r}")
+
+    while True:
+        page = await apaginate_users_keyset(page_size, after, key, row_format)
+        if not page:
+            break
+        yield page
+        after = paginate.sort_position(page[-1], key)
+        if len(page) < page_size:
+            break
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+"""
+Benchmark for the async generators: many concurrent paginated scans on
+one event loop vs one thread per scan.
+
+Both sides are capped at the same number of database connections, so
+the comparison is about what it takes to keep `scans` scans in flight.
+Usage:
+
+    ./bench_async.py [scans] [page_size] [connections]
+"""
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+pool = __import__('pool')
+paginate = __import__('2-lazy_paginate')
+async_streams = __import__('async_streams')
+
+
+def threaded(scans, page_size):
+    """One thread per scan, each running the blocking lazy_pagination."""
+    def scan(_):
+        return sum(len(page) for page in paginate.lazy_pagination(page_size))
+
+    with ThreadPoolExecutor(max_workers=scans) as executor:
+        rows = sum(executor.map(scan, range(scans)))
+        threads = threading.active_count()
+    return rows, threads
+
+
+async def on_event_loop(scans, page_size, connections):
+    """All scans as tasks on the current thread's event loop."""
+    async_streams.set_pool(async_streams.AsyncConnectionPool(size=connections))
+
+    async def scan():
+        rows = 0
+        async for page in async_streams.alazy_pagination(page_size):
+            rows += len(page)
+        return rows
+
+    counts = await asyncio.gather(*(scan() for _ in range(scans)))
+    await async_streams.get_pool().close()
+    return sum(counts), threading.active_count()
+
+
+def main():
+    scans = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    connections = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    pool.set_pool(pool.ConnectionPool(size=connections))
+    start = time.perf_counter()
+    rows, threads = threaded(scans, page_size)
+    elapsed = time.perf_counter() - start
+    print(f"thread per scan: {scans} scans, {rows} rows in {elapsed:.2f} s "
+          f"using {threads} threads")
+    pool.get_pool().close()
+
+    start = time.perf_counter()
+    rows, threads = asyncio.run(on_event_loop(scans, page_size, connections))
+    elapsed = time.perf_counter() - start
+    print(f"  one event loop: {scans} scans, {rows} rows in {elapsed:.2f} s "
+          f"using {threads} thread(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+#!/usr/bin/python3
+"""
+Benchmark for batch_processing: serial vs pipelined throughput.
+
+The printed users go to /dev/null; only the rows per second of each
+configuration are reported. Usage:
+
+    ./bench_batch_processing.py [batch_size]
+"""
+import contextlib
+import os
+import sys
+
+processing = __import__('1-batch_processing')
+
+CONFIGURATIONS = [
+    ('serial, filter in Python', {'pushdown': False}),
+    ('serial', {}),
+    ('pipelined', {'pipelined': True}),
+    ('pipelined, 4 threads', {'pipelined': True, 'consumers': 4}),
+    ('pipelined, 4 processes', {'pipelined': True, 'consumers': 4,
+                                'processes': True}),
+]
+
+
+def main():
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    for label, options in CONFIGURATIONS:
+        with open(os.devnull, 'w') as devnull, \
+                contextlib.redirect_stdout(devnull):
+            report = processing.batch_processing(batch_size, **options)
+        print(f"{label:>26}: {report['rows']} rows in "
+              f"{report['seconds']:.2f} s ({report['rows_per_sec']:.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
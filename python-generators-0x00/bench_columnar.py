@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+"""
+Benchmark for columnar exports: reading user_data back from a columnar
+file vs a full MySQL scan.
+
+Exports the table to `path` first (Arrow IPC with pyarrow, the binary
+format without), then times a full scan of both sources, and a
+single-column read of the ages. Usage:
+
+    ./bench_columnar.py [path] [batch_size]
+"""
+import sys
+import time
+
+processing = __import__('1-batch_processing')
+columnar = __import__('columnar')
+
+
+def timed(label, scan):
+    start = time.perf_counter()
+    rows = scan()
+    elapsed = time.perf_counter() - start
+    print(f"{label:>28}: {rows} rows in {elapsed:.2f} s "
+          f"({rows / elapsed if elapsed else 0:,.0f} rows/s)")
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else 'user_data.columnar'
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else columnar.BATCH_SIZE
+
+    timed("export", lambda: columnar.export_users(path, batch_size=batch_size))
+
+    timed("MySQL full scan", lambda: sum(
+        len(batch) for batch in processing.stream_users_in_batches(
+            batch_size, row_format='tuple')))
+    timed("columnar full scan", lambda: sum(
+        len(batch) for batch in columnar.read_batches(
+            path, batch_size, row_format='tuple')))
+
+    timed("MySQL age column", lambda: sum(
+        len(batch) for batch in processing.stream_users_in_batches(
+            batch_size, columns=['age'], row_format='tuple')))
+    timed("columnar age column", lambda: len(columnar.read_column(path, 'age')))
+
+
+if __name__ == "__main__":
+    main()
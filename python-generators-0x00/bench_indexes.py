@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+"""
+Benchmark for indexes.UserIndex: build time and lookup latency against
+linear scans, over `rows` synthetic compact rows (default 1,000,000).
+No database is needed. Usage:
+
+    ./bench_indexes.py [rows] [lookups]
+"""
+import random
+import sys
+import time
+import uuid
+
+indexes = __import__('indexes')
+rows_module = __import__('rows')
+
+COLUMNS = ('user_id', 'name', 'email', 'age')
+
+
+def synthetic_batches(count, batch_size=10000):
+    make = rows_module.formatter(COLUMNS, 'compact')
+    for start in range(0, count, batch_size):
+        yield make([(str(uuid.UUID(int=i)), f"User {i}",
+                     f"user.{i}@example.com", 18 + i * 7919 % 80)
+                    for i in range(start, min(start + batch_size, count))])
+
+
+def per_call_us(calls, function):
+    start = time.perf_counter()
+    for args in calls:
+        function(*args)
+    return (time.perf_counter() - start) / len(calls) * 1000000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    rows = [row for batch in synthetic_batches(count) for row in batch]
+
+    start = time.perf_counter()
+    index = indexes.UserIndex.build(iter(rows))
+    print(f"built index over {len(index)} rows in "
+          f"{time.perf_counter() - start:.2f} s")
+
+    random.seed(0)
+    emails = [(f"user.{random.randrange(count)}@example.com",)
+              for _ in range(lookups)]
+    ranges = [(low, low + 2) for low in
+              (random.randrange(18, 96) for _ in range(lookups))]
+    # Linear scans are slow; time only a handful of them
+    few = max(1, lookups // 100)
+
+    print(f"email lookup: index {per_call_us(emails, index.by_email):10.1f} us, "
+          f"scan {per_call_us(emails[:few], lambda e: [r for r in rows if r['email'] == e]):12.1f} us")
+    print(f"age range count: index "
+          f"{per_call_us(ranges, index.count_age_range):10.1f} us, scan "
+          f"{per_call_us(ranges[:few], lambda lo, hi: sum(1 for r in rows if lo <= r['age'] <= hi)):12.1f} us")
+    print(f"age range rows: index {per_call_us(ranges[:few], index.age_range):10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+"""
+Benchmark for lazy_pagination: deep-page latency of OFFSET vs keyset.
+
+Seeds ALX_prodev_bench_<rows> with `rows` synthetic users first
+(default 1,000,000; see synthetic.py), leaving ALX_prodev alone, then
+times how long a single page takes to fetch at increasing depths with
+each strategy. Usage:
+
+    ./bench_pagination.py [rows] [page_size]
+"""
+import statistics
+import sys
+import time
+from functools import partial
+
+pool = __import__('pool')
+row_source = __import__('row_source')
+paginate = __import__('2-lazy_paginate')
+synthetic = __import__('synthetic')
+
+REPEATS = 5
+
+
+def key_at(connection, offset):
+    """Returns the user_id just before `offset` in key order (not timed)."""
+    if offset == 0:
+        return None
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT user_id FROM user_data ORDER BY user_id LIMIT 1 OFFSET %s",
+        (offset - 1,))
+    (user_id,) = cursor.fetchone()
+    cursor.close()
+    return (user_id,)
+
+
+def median_latency(fetch):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fetch()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    total = synthetic.seed_mysql(rows)
+    if total is None:
+        return
+    # Point the generators at the synthetic database, as benchmark.py does
+    pool.set_pool(pool.ConnectionPool(
+        factory=partial(synthetic.connect_bench, rows)))
+    row_source.set_source(row_source.MySQLSource())
+    connection = synthetic.connect_bench(rows)
+
+    depths = [d for d in (0, 1000, 10000, 100000, 500000, total - page_size)
+              if 0 <= d <= total - page_size]
+
+    print(f"{total} rows, page size {page_size}, median of {REPEATS} runs")
+    print(f"{'depth':>10} {'offset ms':>12} {'keyset ms':>12}")
+    for depth in depths:
+        after = key_at(connection, depth)
+        offset_ms = median_latency(
+            lambda: paginate.paginate_users(page_size, depth))
+        keyset_ms = median_latency(
+            lambda: paginate.paginate_users_keyset(page_size, after))
+        print(f"{depth:>10} {offset_ms:>12.2f} {keyset_ms:>12.2f}")
+
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+"""
+Benchmark for the row formats: dict rows vs compact rows vs tuples.
+
+Shapes `rows` synthetic user_data tuples (default 1,000,000) the way the
+generators do, then reports the memory held by the shaped rows and how
+fast they are built and read. No database is needed, so the numbers
+isolate the cost of the row objects themselves. Usage:
+
+    ./bench_rows.py [rows]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+import uuid
+from decimal import Decimal
+
+rows_module = __import__('rows')
+
+COLUMNS = ('user_id', 'name', 'email', 'age')
+
+
+def synthetic_rows(count):
+    """Tuples shaped like the ones mysql.connector returns for user_data."""
+    return [(str(uuid.UUID(int=i)), f"User {i}", f"user.{i}@example.com",
+             Decimal(18 + i % 80))
+            for i in range(count)]
+
+
+def measure(fetched, row_format):
+    shape = rows_module.formatter(COLUMNS, row_format)
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    shaped = shape(fetched)
+    build_s = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if row_format == 'tuple':
+        age = rows_module.column_index(COLUMNS)['age']
+        start = time.perf_counter()
+        total = sum(row[age] for row in shaped)
+    else:
+        start = time.perf_counter()
+        total = sum(row['age'] for row in shaped)
+    read_s = time.perf_counter() - start
+
+    return {
+        'format': row_format,
+        'memory_mb': size / 1024 / 1024,
+        'build_rows_per_s': len(shaped) / build_s,
+        'read_rows_per_s': len(shaped) / read_s,
+        'checksum': total,
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    fetched = synthetic_rows(count)
+
+    print(f"{count} rows (memory is what the shaped rows add on top of "
+          f"the fetched values)")
+    for row_format in rows_module.ROW_FORMATS:
+        report = measure(fetched, row_format)
+        print(f"{report['format']:>8}: {report['memory_mb']:8.1f} MB, "
+              f"build {report['build_rows_per_s']:12,.0f} rows/s, "
+              f"read {report['read_rows_per_s']:12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+"""
+Benchmark for stream_users: buffered cursor vs unbuffered streaming.
+
+Each mode runs in its own child process so that the peak RSS reported
+for one mode is not inflated by the other. Usage:
+
+    ./bench_stream_users.py [limit]
+
+`limit` caps the number of rows consumed (default: the whole table).
+"""
+import multiprocessing
+import resource
+import sys
+import time
+import tracemalloc
+from itertools import islice
+
+stream_users = __import__('0-stream_users').stream_users
+
+
+def run_mode(buffered, limit, results):
+    """Consumes stream_users in one mode and reports timings and memory."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    first_row_at = None
+    rows = 0
+
+    for _ in islice(stream_users(buffered=buffered), limit):
+        if first_row_at is None:
+            first_row_at = time.perf_counter()
+        rows += 1
+
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results.put({
+        'mode': 'buffered' if buffered else 'streaming',
+        'rows': rows,
+        'first_row_s': (first_row_at - start) if first_row_at else None,
+        'total_s': elapsed,
+        'peak_py_mb': peak / 1024 / 1024,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+
+def main():
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    results = multiprocessing.Queue()
+
+    for buffered in (True, False):
+        worker = multiprocessing.Process(
+            target=run_mode, args=(buffered, limit, results))
+        worker.start()
+        report = results.get()
+        worker.join()
+        first_row = report['first_row_s']
+        print(f"{report['mode']:>9}: {report['rows']} rows, "
+              f"first row {first_row * 1000 if first_row else float('nan'):.1f} ms, "
+              f"total {report['total_s']:.2f} s, "
+              f"peak python heap {report['peak_py_mb']:.1f} MB, "
+              f"peak RSS {report['peak_rss_mb']:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
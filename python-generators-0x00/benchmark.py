@@ -0,0 +1,240 @@
+#!/usr/bin/python3
+"""
+Benchmark harness for the generators.
+
+Runs stream_users, stream_users_in_batches, lazy_pagination and
+calculate_average_age over synthetic tables of each size (see
+synthetic.py) and saves the timings and peak memory as JSON, so two runs
+can be diffed. stream_users_in_batches also runs with an
+instrument.ScanStats attached, and the overhead of instrumentation is
+printed for every size. Usage:
+
+    ./benchmark.py run <results.json> [sizes] [repeats] [backend]
+    ./benchmark.py compare <baseline.json> <results.json> [threshold]
+
+`sizes` is a comma-separated list such as 10k,1M (default: 10k,1M,10M).
+Every size gets its own database, created and filled on first use:
+ALX_prodev_bench_<size> with the mysql backend (the default), or
+bench_users_<size>.db with the sqlite backend, which needs no server.
+Each workload is run once to warm up, then `repeats` times (default 3)
+for the timings, then once more under tracemalloc for its peak Python
+memory. compare exits with status 1 when a workload got slower by more
+than `threshold` (default 0.10, i.e. 10%).
+"""
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from functools import partial
+
+instrument = __import__('instrument')
+pool = __import__('pool')
+row_source = __import__('row_source')
+synthetic = __import__('synthetic')
+stream_users = __import__('0-stream_users').stream_users
+stream_users_in_batches = __import__('1-batch_processing').stream_users_in_batches
+lazy_pagination = __import__('2-lazy_paginate').lazy_pagination
+calculate_average_age = __import__('4-stream_ages').calculate_average_age
+
+REPEATS = 3
+BATCH_SIZE = 1000
+THRESHOLD = 0.10
+BACKENDS = ('mysql', 'sqlite')
+
+
+def run_stream_users():
+    return sum(1 for _ in stream_users())
+
+
+def run_stream_users_in_batches():
+    return sum(len(batch) for batch in stream_users_in_batches(BATCH_SIZE))
+
+
+def run_stream_users_in_batches_stats():
+    stats = instrument.ScanStats('benchmark')
+    return sum(len(batch)
+               for batch in stream_users_in_batches(BATCH_SIZE, stats=stats))
+
+
+def run_lazy_pagination():
+    return sum(len(page) for page in lazy_pagination(BATCH_SIZE))
+
+
+def run_calculate_average_age():
+    calculate_average_age()
+    return None  # Reads every row; measure() counts them as `size`
+
+
+# Each workload consumes its generator fully and returns the rows seen;
+# the _stats one is the same scan with instrumentation enabled
+WORKLOADS = {
+    'stream_users': run_stream_users,
+    'stream_users_in_batches': run_stream_users_in_batches,
+    'stream_users_in_batches_stats': run_stream_users_in_batches_stats,
+    'lazy_pagination': run_lazy_pagination,
+    'calculate_average_age': run_calculate_average_age,
+}
+
+
+def timed(workload):
+    """Runs `workload` once; returns (seconds, rows)."""
+    gc.collect()
+    start = time.perf_counter()
+    rows = workload()
+    return time.perf_counter() - start, rows
+
+
+def peak_memory(workload):
+    """Runs `workload` once under tracemalloc; returns its peak in bytes."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        workload()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def prepare(backend, size):
+    """Seeds the table of `size` users and points the generators at it."""
+    if backend == 'sqlite':
+        path = f"bench_users_{size}.db"
+        synthetic.seed_sqlite(path, size)
+        row_source.set_source(row_source.SQLiteSource(path))
+        return True
+
+    if synthetic.seed_mysql(size) is None:
+        return False
+    pool.set_pool(pool.ConnectionPool(
+        factory=partial(synthetic.connect_bench, size)))
+    row_source.set_source(row_source.MySQLSource())
+    return True
+
+
+def measure(name, workload, size, repeats):
+    timed(workload)  # Warm-up: fills the server's buffer pool
+    runs = [timed(workload) for _ in range(repeats)]
+    timings = [seconds for seconds, _ in runs]
+    rows = runs[0][1] if runs[0][1] is not None else size
+    median = statistics.median(timings)
+    return {
+        'workload': name,
+        'size': size,
+        'rows': rows,
+        'runs': timings,
+        'median_s': median,
+        'min_s': min(timings),
+        'rows_per_s': rows / median if median else 0.0,
+        'peak_bytes': peak_memory(workload),
+    }
+
+
+def run(output, sizes, repeats, backend='mysql'):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}")
+    results = []
+    for size in sizes:
+        if not prepare(backend, size):
+            return None
+        for name, workload in WORKLOADS.items():
+            result = measure(name, workload, size, repeats)
+            result['backend'] = backend
+            results.append(result)
+            print(f"{name:>29} {size:>9} rows {result['median_s']:>9.3f}s "
+                  f"{result['rows_per_s']:>12.0f} rows/s "
+                  f"{result['peak_bytes'] / 1024 / 1024:>8.1f} MiB peak")
+        print(f"{'stats overhead':>29} {size:>9} rows "
+              f"{stats_overhead(results, size):>+9.1%}")
+    # Back to the default source and pool
+    row_source.set_source(None)
+    pool.set_pool(None)
+
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'backend': backend,
+        'seed': synthetic.DEFAULT_SEED,
+        'repeats': repeats,
+        'results': results,
+    }
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    print(f"Saved {len(results)} results to {output}")
+    return report
+
+
+def stats_overhead(results, size):
+    """
+    How much slower stream_users_in_batches ran with a ScanStats than
+    without one at `size`, as a fraction of the plain median.
+    """
+    medians = {result['workload']: result['median_s'] for result in results
+               if result['size'] == size}
+    plain = medians['stream_users_in_batches']
+    if not plain:
+        return 0.0
+    return medians['stream_users_in_batches_stats'] / plain - 1
+
+
+def _key(result):
+    return result['workload'], result['size'], result.get('backend', 'mysql')
+
+
+def compare(baseline_file, results_file, threshold=THRESHOLD):
+    """
+    Prints how every workload's median time changed between two result
+    files. Returns the (workload, size, backend) keys that got slower
+    than `threshold` allows.
+    """
+    with open(baseline_file, encoding='utf-8') as file:
+        baseline = {_key(r): r for r in json.load(file)['results']}
+    with open(results_file, encoding='utf-8') as file:
+        current = json.load(file)['results']
+
+    regressions = []
+    print(f"{'workload':>24} {'size':>9} {'before s':>10} {'after s':>10} "
+          f"{'change':>8} {'peak MiB':>9}")
+    for result in current:
+        key = _key(result)
+        before = baseline.get(key)
+        if before is None:
+            continue
+        change = result['median_s'] / before['median_s'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(key)
+            flag = '  REGRESSION'
+        print(f"{key[0]:>24} {key[1]:>9} {before['median_s']:>10.3f} "
+              f"{result['median_s']:>10.3f} {change:>+8.1%} "
+              f"{result['peak_bytes'] / 1024 / 1024:>9.1f}{flag}")
+    return regressions
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) >= 2 and args[0] == 'run':
+        sizes = [synthetic.parse_size(size) for size in
+                 (args[2] if len(args) > 2 else ','.join(synthetic.SIZES)).split(',')]
+        repeats = int(args[3]) if len(args) > 3 else REPEATS
+        backend = args[4] if len(args) > 4 else 'mysql'
+        if run(args[1], sizes, repeats, backend) is None:
+            sys.exit(1)
+    elif len(args) >= 3 and args[0] == 'compare':
+        threshold = float(args[3]) if len(args) > 3 else THRESHOLD
+        if compare(args[1], args[2], threshold):
+            sys.exit(1)
+    else:
+        print(f"Usage: {sys.argv[0]} run <results.json> [sizes] [repeats] "
+              f"[mysql|sqlite]\n"
+              f"       {sys.argv[0]} compare <baseline.json> <results.json> "
+              f"[threshold]")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Cancellation and deadlines for generator scans.
+
+A ScanHandle is passed to a generator and can stop it from any thread:
+
+    handle = ScanHandle(timeout=30, query_timeout=5)
+    threading.Timer(2, handle.cancel).start()
+    try:
+        for user in stream_users(handle=handle):
+            ...
+    except ScanCancelled:
+        ...
+
+cancel() interrupts the statement running on the server (KILL QUERY
+on MySQL, interrupt() on SQLite) rather than waiting for the next
+batch, and the generator raises ScanCancelled. `timeout` bounds the
+whole scan, however many queries it runs (e.g. every page of
+lazy_pagination); `query_timeout` bounds each statement and is enforced
+by the server where it can be (MAX_EXECUTION_TIME on MySQL). Running
+out of either raises ScanTimeout.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ScanCancelled(Exception):
+    """Raised by a generator whose scan was cancelled."""
+
+
+class ScanTimeout(ScanCancelled):
+    """Raised by a generator whose scan or statement ran out of time."""
+
+
+class ScanHandle:
+    """
+    Controls one scan: cancel() stops it, `timeout` and `query_timeout`
+    (seconds) bound the whole scan and each statement. The scan deadline
+    starts counting at the first statement.
+    """
+
+    def __init__(self, timeout=None, query_timeout=None):
+        self.timeout = timeout
+        self.query_timeout = query_timeout
+        self.deadline = None
+        self.statement_deadline = None
+        self._error = None
+        self._interrupt = None
+        self._timer = None
+        self._lock = threading.Lock()
+        # Held while an interrupt runs, so running() cannot return (and
+        # its connection move on to another query) until it is done
+        self._interrupting = threading.Lock()
+
+    def __repr__(self):
+        state = 'cancelled' if self.cancelled else 'active'
+        return f"ScanHandle({state})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def cancelled(self):
+        return self._error is not None
+
+    def cancel(self, error=None):
+        """
+        Stops the scan: the running statement, if any, is interrupted
+        and the generator raises `error` (ScanCancelled by default).
+        """
+        with self._interrupting:
+            with self._lock:
+                if self._error is None:
+                    self._error = error or ScanCancelled("Scan was cancelled")
+                interrupt = self._interrupt
+            if interrupt is not None:
+                interrupt()
+
+    def close(self):
+        """
+        Stops the deadline timer of the current statement; sources call
+        it when a statement ends outside a running() block.
+        """
+        self._end_statement()
+
+    def check(self):
+        """Raises the scan's error if it was cancelled or ran out of time."""
+        if self._error is None and self.expired():
+            self.cancel(ScanTimeout("Scan ran past its deadline"))
+        if self._error is not None:
+            raise self._error
+
+    def expired(self):
+        """Whether the scan or the current statement is past its deadline."""
+        now = time.monotonic()
+        return ((self.deadline is not None and now >= self.deadline) or
+                (self.statement_deadline is not None
+                 and now >= self.statement_deadline))
+
+    def begin_statement(self):
+        """
+        Called before each statement. Starts the scan deadline on first
+        use and returns the seconds the statement may take (None for no
+        limit), the lesser of query_timeout and the scan's remaining time.
+        """
+        self.check()
+        now = time.monotonic()
+        if self.timeout is not None and self.deadline is None:
+            self.deadline = now + self.timeout
+
+        limits = [self.query_timeout] if self.query_timeout is not None else []
+        if self.deadline is not None:
+            limits.append(max(self.deadline - now, 0.0))
+        seconds = min(limits) if limits else None
+        self.statement_deadline = None if seconds is None else now + seconds
+
+        # Interrupts the statement if it runs past its deadline; stopped
+        # when the statement's running() block ends
+        self._end_statement()
+        if seconds is not None:
+            if seconds == self.query_timeout:
+                error = ScanTimeout("Statement ran past its timeout")
+            else:
+                error = ScanTimeout("Scan ran past its deadline")
+            timer = threading.Timer(seconds, self.cancel, (error,))
+            timer.daemon = True
+            with self._lock:
+                self._timer = timer
+            timer.start()
+        return seconds
+
+    def _end_statement(self):
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+
+    @contextmanager
+    def running(self, interrupt):
+        """
+        Registers `interrupt`, a callable that stops the running
+        statement, for the duration of the block. Leaving the block
+        waits for an interrupt already under way, so a late cancel()
+        never reaches whatever the connection runs next.
+        """
+        with self._lock:
+            self._interrupt = interrupt
+            cancelled = self._error is not None
+        if cancelled:
+            interrupt()
+        try:
+            yield
+        finally:
+            with self._interrupting:
+                with self._lock:
+                    self._interrupt = None
+            self._end_statement()
+            self.statement_deadline = None
@@ -0,0 +1,348 @@
+"""
+Streaming export of user_data to columnar files, and readers for them.
+
+export_users() scans user_data batch by batch, the way
+stream_users_in_batches() does, and appends the batches to a columnar
+file, so memory stays bounded by one batch however big the table is.
+Three formats are supported:
+
+* 'arrow'   - Arrow IPC file (needs pyarrow)
+* 'parquet' - Parquet file (needs pyarrow)
+* 'binary'  - a directory with one plain binary file per column, for
+              machines without pyarrow: strings as a UTF-8 data file
+              plus a uint64 offsets file, ages as uint16
+
+Reading goes through memory maps, so later scans touch the page cache
+instead of MySQL:
+
+    export_users('users.arrow')
+    for batch in read_batches('users.arrow'):
+        ...
+"""
+import json
+import mmap
+import os
+import shutil
+from array import array
+from itertools import accumulate
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # The 'binary' format needs nothing beyond the stdlib
+    pa = None
+
+adaptive = __import__('adaptive')
+filters = __import__('filters')
+rows_module = __import__('rows')
+row_source = __import__('row_source')
+
+# Rows per exported batch (one Arrow record batch / Parquet row group)
+BATCH_SIZE = 10000
+FORMATS = ('arrow', 'parquet', 'binary')
+# Column types of the binary format
+STRING, UINT16 = 'utf8', 'uint16'
+BINARY_VERSION = 1
+
+
+def _column_type(name):
+    return UINT16 if name == 'age' else STRING
+
+
+def _arrow_schema(columns):
+    return pa.schema([(name, pa.uint16() if _column_type(name) == UINT16
+                       else pa.string()) for name in columns])
+
+
+class _BinaryWriter:
+    """Appends batches of tuples to the per-column files of a directory."""
+
+    def __init__(self, path, columns):
+        os.makedirs(path)
+        self.path = path
+        self.columns = columns
+        self.rows = 0
+        self._files = {}
+        self._ends = {}
+        for name in columns:
+            if _column_type(name) == STRING:
+                offsets = open(os.path.join(path, f"{name}.offsets"), 'wb')
+                array('Q', [0]).tofile(offsets)
+                self._files[name] = (open(os.path.join(path, f"{name}.data"), 'wb'),
+                                     offsets)
+                self._ends[name] = 0
+            else:
+                self._files[name] = (open(os.path.join(path, f"{name}.u16"), 'wb'),)
+
+    def write(self, batch):
+        for position, name in enumerate(self.columns):
+            values = [row[position] for row in batch]
+            if _column_type(name) == STRING:
+                data, offsets = self._files[name]
+                encoded = [str(value).encode('utf-8') for value in values]
+                data.write(b''.join(encoded))
+                ends = array('Q', accumulate(map(len, encoded),
+                                             initial=self._ends[name]))[1:]
+                ends.tofile(offsets)
+                if ends:
+                    self._ends[name] = ends[-1]
+            else:
+                (data,) = self._files[name]
+                array('H', map(int, values)).tofile(data)
+        self.rows += len(batch)
+
+    def close(self):
+        for files in self._files.values():
+            for file in files:
+                file.close()
+        meta = {
+            'version': BINARY_VERSION,
+            'rows': self.rows,
+            'columns': {name: _column_type(name) for name in self.columns},
+        }
+        with open(os.path.join(self.path, 'meta.json'), 'w', encoding='utf-8') as file:
+            json.dump(meta, file)
+
+
+class _ArrowWriter:
+    """Appends batches of tuples to an Arrow IPC or Parquet file."""
+
+    def __init__(self, path, columns, parquet):
+        self.columns = columns
+        self.schema = _arrow_schema(columns)
+        self.rows = 0
+        if parquet:
+            self._writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self._writer = pa.ipc.new_file(path, self.schema)
+
+    def write(self, batch):
+        arrays = [
+            pa.array([int(row[position]) for row in batch], pa.uint16())
+            if _column_type(name) == UINT16
+            else pa.array([row[position] for row in batch], pa.string())
+            for position, name in enumerate(self.columns)
+        ]
+        record_batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if isinstance(self._writer, pq.ParquetWriter):
+            self._writer.write_batch(record_batch)
+        else:
+            self._writer.write(record_batch)
+        self.rows += len(batch)
+
+    def close(self):
+        self._writer.close()
+
+
+def _resolve_format(path, format):
+    if format == 'auto':
+        if pa is None:
+            return 'binary'
+        return 'parquet' if path.endswith('.parquet') else 'arrow'
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format {format!r}; expected one of {FORMATS}")
+    if format != 'binary' and pa is None:
+        raise ImportError(f"The {format!r} format needs pyarrow; "
+                          f"use format='binary' instead")
+    return format
+
+
+def export_users(path, format='auto', batch_size=BATCH_SIZE, columns=None,
+                 where=None):
+    """
+    Streams user_data (optionally filtered and projected like
+    stream_users_in_batches()) into a columnar file at `path`.
+
+    format='auto' picks Parquet for *.parquet paths and Arrow IPC
+    otherwise, falling back to the binary format without pyarrow. The
+    file is written under a temporary name and renamed once the whole
+    table has been read, so readers never see a half-written export.
+    A failing scan raises its error and leaves any previous export at
+    `path` untouched.
+
+    Returns the number of rows exported.
+    """
+    format = _resolve_format(path, format)
+    columns = filters.projection(columns)
+    tmp_path = f"{path}.tmp"
+    _remove(tmp_path)
+
+    if format == 'binary':
+        writer = _BinaryWriter(tmp_path, columns)
+    else:
+        writer = _ArrowWriter(tmp_path, columns, parquet=format == 'parquet')
+    # Read from the source itself: stream_users_in_batches() reports
+    # errors and ends quietly, which would look like a complete export
+    source = row_source.get_source()
+    plan = source.plan(columns, where)
+    try:
+        try:
+            for batch in source.scan(plan, adaptive.resolve(batch_size),
+                                     plan.shaper('tuple')):
+                if batch:
+                    writer.write(batch)
+        finally:
+            writer.close()
+    except BaseException:
+        _remove(tmp_path)
+        raise
+
+    _install(tmp_path, path)
+    return writer.rows
+
+
+def _install(tmp_path, path):
+    """
+    Moves a finished export into place. A file replaces a previous file
+    export atomically; a directory cannot replace another in one step,
+    so the old one is renamed aside first and removed afterwards, which
+    leaves `path` missing only between the two renames.
+    """
+    if not os.path.isdir(tmp_path) and not os.path.isdir(path):
+        os.replace(tmp_path, path)
+        return
+    old_path = f"{path}.old"
+    _remove(old_path)
+    if os.path.lexists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    _remove(old_path)
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _map(path):
+    """Memory-maps a file read-only (an empty file maps to b'')."""
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class StringColumn:
+    """A memory-mapped string column of the binary format."""
+
+    def __init__(self, data, offsets):
+        self._data = memoryview(data)
+        self._offsets = memoryview(offsets).cast('Q')
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return str(self._data[start:end], 'utf-8')
+
+    def slice(self, start, stop):
+        """Decodes rows [start, stop) with one pass over their bytes."""
+        offsets = self._offsets[start:stop + 1]
+        base = offsets[0]
+        chunk = bytes(self._data[base:offsets[-1]])
+        return [chunk[begin - base:end - base].decode('utf-8')
+                for begin, end in zip(offsets, offsets[1:])]
+
+
+class BinaryColumns:
+    """Reader for a directory written in the binary format."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as file:
+            meta = json.load(file)
+        if meta['version'] != BINARY_VERSION:
+            raise ValueError(f"Unsupported columnar version {meta['version']}")
+        self.rows = meta['rows']
+        self.columns = list(meta['columns'])
+        self._columns = {}
+        for name, column_type in meta['columns'].items():
+            if column_type == STRING:
+                self._columns[name] = StringColumn(
+                    _map(os.path.join(path, f"{name}.data")),
+                    _map(os.path.join(path, f"{name}.offsets")))
+            else:
+                # Zero-copy view of the uint16 values
+                self._columns[name] = memoryview(
+                    _map(os.path.join(path, f"{name}.u16"))).cast('H')
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name):
+        return self._columns[name]
+
+    def iter_batches(self, batch_size, columns):
+        for start in range(0, self.rows, batch_size):
+            stop = min(start + batch_size, self.rows)
+            values = []
+            for name in columns:
+                column = self._columns[name]
+                if isinstance(column, StringColumn):
+                    values.append(column.slice(start, stop))
+                else:
+                    values.append(column[start:stop].tolist())
+            yield list(zip(*values))
+
+
+def _detect_format(path):
+    if os.path.isdir(path):
+        return 'binary'
+    with open(path, 'rb') as file:
+        magic = file.read(6)
+    if magic.startswith(b'PAR1'):
+        return 'parquet'
+    if magic == b'ARROW1':
+        return 'arrow'
+    raise ValueError(f"{path} is not a columnar export")
+
+
+def read_batches(path, batch_size=BATCH_SIZE, columns=None, row_format='dict'):
+    """
+    A generator that yields the rows of a columnar export in batches
+    (lists), like stream_users_in_batches() but without MySQL.
+    """
+    format = _detect_format(path)
+    if format == 'binary':
+        reader = BinaryColumns(path)
+        columns = reader.columns if columns is None else filters.projection(columns)
+        shape = rows_module.formatter(columns, row_format)
+        for batch in reader.iter_batches(batch_size, columns):
+            yield shape(batch)
+        return
+
+    if pa is None:
+        raise ImportError(f"Reading {format!r} files needs pyarrow")
+    if format == 'parquet':
+        source = pq.ParquetFile(path, memory_map=True)
+        record_batches = source.iter_batches(batch_size=batch_size, columns=columns)
+    else:
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        record_batches = table.to_batches(max_chunksize=batch_size)
+
+    for record_batch in record_batches:
+        names = record_batch.schema.names
+        shape = rows_module.formatter(names, row_format)
+        values = [column.to_pylist() for column in record_batch.columns]
+        yield shape(list(zip(*values)))
+
+
+def read_column(path, name):
+    """
+    Returns one column of an export without building rows: a uint16
+    memoryview or StringColumn for the binary format, a pyarrow
+    ChunkedArray otherwise.
+    """
+    format = _detect_format(path)
+    if format == 'binary':
+        return BinaryColumns(path).column(name)
+    if pa is None:
+        raise ImportError(f"Reading {format!r} files needs pyarrow")
+    if format == 'parquet':
+        return pq.read_table(path, columns=[name], memory_map=True).column(name)
+    return pa.ipc.open_file(pa.memory_map(path)).read_all().column(name)
@@ -0,0 +1,406 @@
+"""
+Filter expressions for the user_data generators.
+
+    from filters import Age, Email
+
+    stream_users_in_batches(500, where=(Age > 25) & Email.like('%@gmail.com'),
+                            columns=['name', 'age'])
+
+An expression compiles into a parameterized SQL WHERE clause, so only
+the matching rows (and with `columns`, only the needed bytes) cross the
+wire. Parts the database cannot evaluate -- Python callables wrapped in Where()
+-- are held back and evaluated in-process on the fetched rows instead.
+
+Combine expressions with & (and), | (or) and ~ (not); Python's own
+`and`/`or`/`not` keywords cannot be overloaded.
+"""
+import operator
+import re
+
+# Shapes fetched tuples into the requested row format
+rows_module = __import__('rows')
+
+# Columns of the user_data table, in table order
+COLUMNS = ('user_id', 'name', 'email', 'age')
+
+
+class Expression:
+    """Base class of every filter expression."""
+
+    # Whether the whole expression can be compiled into SQL
+    pushable = True
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+    def compile(self, placeholder='%s'):
+        """
+        Returns (sql, params) for a WHERE clause, with `placeholder` marking
+        each parameter ('%s' for MySQL, '?' for SQLite).
+        """
+        raise NotImplementedError
+
+    def evaluate(self, row):
+        """Evaluates the expression against one row (a mapping)."""
+        raise NotImplementedError
+
+    def columns(self):
+        """Returns the set of columns the expression reads."""
+        raise NotImplementedError
+
+
+class Column:
+    """A user_data column; comparing it builds an Expression."""
+
+    def __init__(self, name):
+        if name not in COLUMNS:
+            raise ValueError(f"Unknown column {name!r}; expected one of {COLUMNS}")
+        self.name = name
+
+    def __repr__(self):
+        return f"Column({self.name!r})"
+
+    def __eq__(self, value):
+        return Comparison(self.name, '=', value)
+
+    def __ne__(self, value):
+        return Comparison(self.name, '<>', value)
+
+    def __lt__(self, value):
+        return Comparison(self.name, '<', value)
+
+    def __le__(self, value):
+        return Comparison(self.name, '<=', value)
+
+    def __gt__(self, value):
+        return Comparison(self.name, '>', value)
+
+    def __ge__(self, value):
+        return Comparison(self.name, '>=', value)
+
+    # __eq__ no longer means identity, so columns cannot be hashed
+    __hash__ = None
+
+    def in_(self, values):
+        return In(self.name, values)
+
+    def like(self, pattern):
+        return Like(self.name, pattern)
+
+    def between(self, low, high):
+        return Between(self.name, low, high)
+
+
+UserId = Column('user_id')
+Name = Column('name')
+Email = Column('email')
+Age = Column('age')
+
+
+class Comparison(Expression):
+    """column <op> value"""
+
+    OPERATORS = {
+        '=': operator.eq,
+        '<>': operator.ne,
+        '<': operator.lt,
+        '<=': operator.le,
+        '>': operator.gt,
+        '>=': operator.ge,
+    }
+
+    def __init__(self, column, op, value):
+        self.column = column
+        self.op = op
+        self.value = value
+
+    def __repr__(self):
+        return f"({self.column} {self.op} {self.value!r})"
+
+    def compile(self, placeholder='%s'):
+        return f"{self.column} {self.op} {placeholder}", (self.value,)
+
+    def evaluate(self, row):
+        return self.OPERATORS[self.op](row[self.column], self.value)
+
+    def columns(self):
+        return {self.column}
+
+
+class In(Expression):
+    """column IN (values...)"""
+
+    def __init__(self, column, values):
+        self.column = column
+        self.values = tuple(values)
+
+    def __repr__(self):
+        return f"({self.column} IN {self.values!r})"
+
+    def compile(self, placeholder='%s'):
+        if not self.values:
+            # IN () is a syntax error; nothing can match an empty set
+            return "FALSE", ()
+        placeholders = ', '.join([placeholder] * len(self.values))
+        return f"{self.column} IN ({placeholders})", self.values
+
+    def evaluate(self, row):
+        return row[self.column] in self.values
+
+    def columns(self):
+        return {self.column}
+
+
+class Like(Expression):
+    """column LIKE pattern, with SQL's % and _ wildcards"""
+
+    def __init__(self, column, pattern):
+        self.column = column
+        self.pattern = pattern
+        self._regex = None
+
+    def __repr__(self):
+        return f"({self.column} LIKE {self.pattern!r})"
+
+    def compile(self, placeholder='%s'):
+        return f"{self.column} LIKE {placeholder}", (self.pattern,)
+
+    def evaluate(self, row):
+        if self._regex is None:
+            translated = ''.join(
+                '.*' if char == '%' else '.' if char == '_' else re.escape(char)
+                for char in self.pattern)
+            # MySQL's default collations compare case-insensitively
+            self._regex = re.compile(translated, re.IGNORECASE | re.DOTALL)
+        return self._regex.fullmatch(str(row[self.column])) is not None
+
+    def columns(self):
+        return {self.column}
+
+
+class Between(Expression):
+    """column BETWEEN low AND high (inclusive)"""
+
+    def __init__(self, column, low, high):
+        self.column = column
+        self.low = low
+        self.high = high
+
+    def __repr__(self):
+        return f"({self.column} BETWEEN {self.low!r} AND {self.high!r})"
+
+    def compile(self, placeholder='%s'):
+        return (f"{self.column} BETWEEN {placeholder} AND {placeholder}",
+                (self.low, self.high))
+
+    def evaluate(self, row):
+        return self.low <= row[self.column] <= self.high
+
+    def columns(self):
+        return {self.column}
+
+
+class Where(Expression):
+    """
+    An arbitrary Python predicate on a row. It cannot be pushed down to
+    MySQL, so it is always evaluated in-process. `columns` names the
+    columns it reads, so they are fetched even if not projected.
+    """
+
+    pushable = False
+
+    def __init__(self, predicate, columns=COLUMNS):
+        self.predicate = predicate
+        self._columns = set(columns)
+
+    def __repr__(self):
+        return f"Where({self.predicate!r})"
+
+    def compile(self, placeholder='%s'):
+        raise ValueError("Python predicates cannot be compiled to SQL")
+
+    def evaluate(self, row):
+        return bool(self.predicate(row))
+
+    def columns(self):
+        return set(self._columns)
+
+
+class And(Expression):
+
+    def __init__(self, *parts):
+        # Flatten nested ANDs so split() can push each conjunct separately
+        self.parts = []
+        for part in parts:
+            self.parts.extend(part.parts if isinstance(part, And) else [part])
+        self.pushable = all(part.pushable for part in self.parts)
+
+    def __repr__(self):
+        return '(' + ' & '.join(map(repr, self.parts)) + ')'
+
+    def compile(self, placeholder='%s'):
+        return _join(self.parts, ' AND ', placeholder)
+
+    def evaluate(self, row):
+        return all(part.evaluate(row) for part in self.parts)
+
+    def columns(self):
+        return set().union(*(part.columns() for part in self.parts))
+
+
+class Or(Expression):
+
+    def __init__(self, *parts):
+        self.parts = []
+        for part in parts:
+            self.parts.extend(part.parts if isinstance(part, Or) else [part])
+        self.pushable = all(part.pushable for part in self.parts)
+
+    def __repr__(self):
+        return '(' + ' | '.join(map(repr, self.parts)) + ')'
+
+    def compile(self, placeholder='%s'):
+        return _join(self.parts, ' OR ', placeholder)
+
+    def evaluate(self, row):
+        return any(part.evaluate(row) for part in self.parts)
+
+    def columns(self):
+        return set().union(*(part.columns() for part in self.parts))
+
+
+class Not(Expression):
+
+    def __init__(self, part):
+        self.part = part
+        self.pushable = part.pushable
+
+    def __repr__(self):
+        return f"~{self.part!r}"
+
+    def compile(self, placeholder='%s'):
+        sql, params = self.part.compile(placeholder)
+        return f"NOT ({sql})", params
+
+    def evaluate(self, row):
+        return not self.part.evaluate(row)
+
+    def columns(self):
+        return self.part.columns()
+
+
+def _join(parts, separator, placeholder):
+    clauses = []
+    params = []
+    for part in parts:
+        sql, part_params = part.compile(placeholder)
+        clauses.append(f"({sql})")
+        params.extend(part_params)
+    return separator.join(clauses), tuple(params)
+
+
+def split(where):
+    """
+    Splits a filter into (pushed, residual): the part compiled into SQL
+    and the part evaluated in-process. Either may be None. Only the
+    conjuncts of a top-level AND can be separated; any other expression
+    is pushed down whole or not at all.
+    """
+    if where is None:
+        return None, None
+    if where.pushable:
+        return where, None
+    if isinstance(where, And):
+        pushed = [part for part in where.parts if part.pushable]
+        residual = [part for part in where.parts if not part.pushable]
+        return (And(*pushed) if pushed else None,
+                residual[0] if len(residual) == 1 else And(*residual))
+    return None, where
+
+
+def projection(columns):
+    """Validates a column list, defaulting to every column of user_data."""
+    if columns is None:
+        return list(COLUMNS)
+    columns = list(columns)
+    unknown = [column for column in columns if column not in COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns {unknown}; expected some of {COLUMNS}")
+    if not columns:
+        raise ValueError("At least one column must be selected")
+    return columns
+
+
+class ScanPlan:
+    """
+    A filtered, projected scan of user_data: the SQL sent to the database
+    and the in-process work left to do on what comes back.
+
+    `placeholder` is the parameter marker of the backend's SQL dialect.
+    With pushdown=False (sources that do not speak SQL, such as files)
+    the whole filter is evaluated in-process.
+    """
+
+    def __init__(self, columns=None, where=None, placeholder='%s',
+                 pushdown=True):
+        self.columns = projection(columns)
+        self.placeholder = placeholder
+        if pushdown:
+            self.pushed, self.residual = split(where)
+        else:
+            self.pushed, self.residual = None, where
+        # The in-process filter may need columns the caller did not ask for
+        self.extra = []
+        if self.residual is not None:
+            self.extra = sorted(self.residual.columns() - set(self.columns))
+
+    def sql(self, conditions=(), order_by=None):
+        """
+        Returns (query, params). `conditions` are extra (sql, params)
+        pairs ANDed with the pushed-down part of the filter.
+        """
+        if self.pushed is not None:
+            conditions = [self.pushed.compile(self.placeholder), *conditions]
+
+        query = f"SELECT {', '.join(self.columns + self.extra)} FROM user_data"
+        params = []
+        if conditions:
+            query += " WHERE " + " AND ".join(f"({sql})" for sql, _ in conditions)
+            for _, condition_params in conditions:
+                params.extend(condition_params)
+        if order_by:
+            query += f" ORDER BY {order_by}"
+        return query, tuple(params)
+
+    def row_filter(self):
+        """
+        Returns a function that drops the fetched tuples failing the
+        residual filter from a batch (keeping the helper columns), or
+        None when there is nothing left to filter.
+        """
+        if self.residual is None:
+            return None
+
+        # Residual filters read rows by name, so they see compact rows
+        make = rows_module.row_class(self.columns + self.extra)._make
+        evaluate = self.residual.evaluate
+        return lambda batch: [row for row in map(make, batch) if evaluate(row)]
+
+    def shaper(self, row_format='dict'):
+        """
+        Returns a function that turns a fetched batch of tuples into the
+        rows to hand out: residual filter applied, helper columns
+        dropped, rows in `row_format`. The result may be empty.
+        """
+        shape = rows_module.formatter(self.columns, row_format,
+                                      trim=bool(self.extra))
+        keep = self.row_filter()
+        if keep is None:
+            return shape
+        return lambda batch: shape(keep(batch))
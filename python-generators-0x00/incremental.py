@@ -0,0 +1,151 @@
+"""
+Incremental (change-data) streaming of user_data.
+
+Instead of re-reading the whole table, stream_changes() yields only the
+rows inserted or updated since its previous run. It walks the
+(updated_at, user_id) index maintained by seed.create_table() and keeps
+its high-water mark in a local checkpoint file, so the cost of a run
+scales with the number of changed rows rather than with the table.
+
+    for user in stream_changes():
+        ...
+
+Deleted rows leave nothing behind to read, so deletes are not reported.
+"""
+import json
+import os
+from datetime import datetime
+
+from mysql.connector import Error
+
+pool = __import__('pool')
+rows_module = __import__('rows')
+
+COLUMNS = ('user_id', 'name', 'email', 'age', 'updated_at')
+CHECKPOINT_FILE = os.getenv('USER_DATA_CHECKPOINT', '.user_data.checkpoint')
+BATCH_SIZE = 1000
+# Rows younger than this (seconds) are left for the next run. An UPDATE
+# stamps updated_at when it runs, not when it commits, so a slow
+# transaction can make a row visible after newer ones were already read;
+# the scan also stops short of the oldest transaction still open (see
+# _high_water()), and this lag covers the rest.
+SAFETY_LAG = float(os.getenv('USER_DATA_SAFETY_LAG', '2'))
+
+
+class Checkpoint:
+    """The (updated_at, user_id) position of the last row delivered."""
+
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = path
+
+    def load(self):
+        """Returns the saved position, or None before the first run."""
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                saved = json.load(file)
+        except FileNotFoundError:
+            return None
+        return datetime.fromisoformat(saved['updated_at']), saved['user_id']
+
+    def save(self, position):
+        """Writes the position atomically, so a crash never corrupts it."""
+        updated_at, user_id = position
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'updated_at': updated_at.isoformat(),
+                       'user_id': user_id}, file)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        """Forgets the position; the next run streams the whole table."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _changes_query(position):
+    select = f"SELECT {', '.join(COLUMNS)} FROM user_data"
+    order = "ORDER BY updated_at, user_id LIMIT %s"
+    if position is None:
+        return f"{select} WHERE updated_at <= %s {order}", ()
+    return (f"{select} WHERE (updated_at > %s "
+            f"OR (updated_at = %s AND user_id > %s)) AND updated_at <= %s "
+            f"{order}", (position[0], position[0], position[1]))
+
+
+def _high_water(cursor, lag):
+    """
+    Where a run stops: `lag` seconds ago, or earlier if a transaction
+    that has written rows is still open. Its rows carry updated_at
+    values from when it wrote them, so once it commits they would land
+    behind a checkpoint taken past its start.
+
+    Reading information_schema.innodb_trx takes the PROCESS privilege;
+    without it only the lag applies, and a transaction open for longer
+    than `lag` can commit rows that are never streamed.
+    """
+    cursor.execute("SELECT NOW(6) - INTERVAL %s MICROSECOND",
+                   (int(lag * 1000000),))
+    (high_water,) = cursor.fetchone()
+    try:
+        # trx_started has whole seconds, hence the extra second
+        cursor.execute(
+            "SELECT MIN(trx_started) - INTERVAL 1 SECOND "
+            "FROM information_schema.innodb_trx "
+            "WHERE trx_rows_modified > 0 "
+            "AND trx_mysql_thread_id <> CONNECTION_ID()")
+        (oldest,) = cursor.fetchone()
+    except Error as e:
+        print(f"Not capping the change scan at open transactions: {e}")
+        return high_water
+    if oldest is not None and oldest < high_water:
+        return oldest
+    return high_water
+
+
+def stream_changes(checkpoint_file=CHECKPOINT_FILE, batch_size=BATCH_SIZE,
+                   lag=SAFETY_LAG, row_format='dict'):
+    """
+    A generator that yields the users inserted or changed since the
+    previous run, oldest change first, including their updated_at.
+
+    The checkpoint is advanced each time a whole batch has been consumed,
+    so a consumer that stops (or crashes) part-way gets the unfinished
+    batch again next time: delivery is at-least-once. The scan stops at
+    the time it started minus `lag` seconds (USER_DATA_SAFETY_LAG), or
+    at the start of the oldest transaction that is still writing, so it
+    ends even while the table keeps changing; later changes are left for
+    the next run. See _high_water() for when the lag alone must cover
+    slow transactions.
+    """
+    checkpoint = Checkpoint(checkpoint_file)
+    position = checkpoint.load()
+    shape = rows_module.formatter(COLUMNS, row_format)
+    updated_at = COLUMNS.index('updated_at')
+    user_id = COLUMNS.index('user_id')
+
+    try:
+        with pool.cursor() as cursor:
+            high_water = _high_water(cursor, lag)
+
+        while True:
+            query, params = _changes_query(position)
+            # Each page is a short keyset query on the updated_at index
+            with pool.cursor() as cursor:
+                cursor.execute(query, params + (high_water, int(batch_size)))
+                batch = cursor.fetchall()
+            if not batch:
+                break
+
+            for row in shape(batch):
+                yield row
+
+            # The whole batch was consumed; remember where it ended
+            last = batch[-1]
+            position = (last[updated_at], last[user_id])
+            checkpoint.save(position)
+
+            if len(batch) < batch_size:
+                break
+
+    except Error as e:
+        print(f"Error while streaming changes: {e}")
@@ -0,0 +1,155 @@
+"""
+In-process indexes over streamed user_data rows.
+
+Jobs that look users up by email or by age range again and again should
+not scan a list of dicts each time. UserIndex consumes any stream of the
+generators in this package (rows one by one, or batches of rows) and
+builds two compact indexes over it:
+
+* a hash index on email: an open-addressing table of row offsets
+* a sorted index on age: the ages in order, searched with bisect, next
+  to the offsets of their rows
+
+Both are flat arrays of integers rather than dicts of dicts.
+
+    index = UserIndex.build(stream_users_in_batches(10000, row_format='compact'))
+    index.by_email('Ross.Reynolds21@hotmail.com')
+    index.age_range(25, 30)
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+
+rows_module = __import__('rows')
+
+# Column positions of 'tuple' rows
+COLUMNS = ('user_id', 'name', 'email', 'age')
+EMPTY = -1
+
+
+def _field_getter(row, name, columns):
+    """Returns a function reading `name` from rows shaped like `row`."""
+    if isinstance(row, (dict, rows_module.CompactRow)):
+        return itemgetter(name)
+    return itemgetter(columns.index(name))
+
+
+def _rows(stream):
+    """Flattens a stream of rows or of batches of rows."""
+    for item in stream:
+        if isinstance(item, list):
+            yield from item
+        else:
+            yield item
+
+
+class UserIndex:
+    """Hash index on email and sorted index on age over a set of rows."""
+
+    def __init__(self, emails, ages, rows=None):
+        """
+        Builds the indexes from parallel sequences of emails and ages;
+        position N in each describes row offset N. Prefer build().
+        """
+        self.rows = rows
+        self._count = len(ages)
+        self._build_email_index(emails)
+        self._build_age_index(ages)
+
+    @classmethod
+    def build(cls, stream, keep_rows=True, columns=COLUMNS):
+        """
+        Consumes a stream of dict, compact or tuple rows (or batches of
+        them) and indexes it. With keep_rows=False only the indexes are
+        kept and lookups return row offsets, e.g. to resolve against a
+        snapshot.Snapshot holding the same rows in the same order.
+        """
+        rows = []
+        emails = []
+        ages = array('H')
+        get_email = get_age = None
+
+        for row in _rows(stream):
+            if get_email is None:
+                get_email = _field_getter(row, 'email', columns)
+                get_age = _field_getter(row, 'age', columns)
+            emails.append(get_email(row))
+            ages.append(int(get_age(row)))
+            if keep_rows:
+                rows.append(row)
+
+        return cls(emails, ages, rows if keep_rows else None)
+
+    def __len__(self):
+        return self._count
+
+    @staticmethod
+    def _key(email):
+        # MySQL's default collations compare emails case-insensitively
+        return email.lower()
+
+    def _build_email_index(self, emails):
+        capacity = 8
+        while capacity < 2 * len(emails):
+            capacity *= 2
+        self._mask = capacity - 1
+        self._slots = array('q', [EMPTY]) * capacity
+        self._hashes = array('q', [0]) * capacity
+        # Lookups compare the keys to rule out hash collisions. The
+        # strings are shared with the rows, so this is one pointer each.
+        self._emails = emails
+
+        slots, hashes, mask = self._slots, self._hashes, self._mask
+        for offset, email in enumerate(emails):
+            key_hash = hash(self._key(email))
+            slot = key_hash & mask
+            # Linear probing; duplicates simply take the next free slot
+            while slots[slot] != EMPTY:
+                slot = (slot + 1) & mask
+            slots[slot] = offset
+            hashes[slot] = key_hash
+
+    def _build_age_index(self, ages):
+        order = sorted(range(len(ages)), key=ages.__getitem__)
+        self._age_offsets = array('q', order)
+        self._sorted_ages = array('H', (ages[offset] for offset in order))
+
+    def email_offsets(self, email):
+        """Returns the offsets of the rows with this email."""
+        key = self._key(email)
+        key_hash = hash(key)
+        slots, hashes, mask = self._slots, self._hashes, self._mask
+        slot = key_hash & mask
+        found = []
+        while slots[slot] != EMPTY:
+            offset = slots[slot]
+            if hashes[slot] == key_hash and self._key(self._emails[offset]) == key:
+                found.append(offset)
+            slot = (slot + 1) & mask
+        found.sort()
+        return found
+
+    def age_offsets(self, low, high):
+        """Returns the offsets of the rows with low <= age <= high."""
+        start = bisect_left(self._sorted_ages, low)
+        stop = bisect_right(self._sorted_ages, high)
+        return self._age_offsets[start:stop]
+
+    def count_age_range(self, low, high):
+        """Counts the rows with low <= age <= high in O(log n)."""
+        return (bisect_right(self._sorted_ages, high)
+                - bisect_left(self._sorted_ages, low))
+
+    def by_email(self, email):
+        """Returns the rows with this email (their offsets without rows)."""
+        return self._resolve(self.email_offsets(email))
+
+    def age_range(self, low, high):
+        """Returns the rows aged low to high inclusive, youngest first."""
+        return self._resolve(self.age_offsets(low, high))
+
+    def _resolve(self, offsets):
+        if self.rows is None:
+            return list(offsets)
+        rows = self.rows
+        return [rows[offset] for offset in offsets]
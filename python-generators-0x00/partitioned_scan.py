@@ -0,0 +1,217 @@
+"""
+Parallel, range-partitioned scans of user_data.
+
+A single cursor is limited by what one connection can stream. This
+module splits user_data into key ranges on user_id, using boundaries
+sampled from the table, and streams every range over its own pooled
+connection in a thread (or process) of its own:
+
+    for batch in partitioned_scan(partitions=8):
+        ...
+
+With ordered=True the batches come out in user_id order; otherwise they
+are handed out as soon as any partition produces them.
+"""
+import multiprocessing
+import queue
+import threading
+
+seed = __import__('seed')
+pool = __import__('pool')
+filters = __import__('filters')
+
+# Rows sampled to place the partition boundaries
+SAMPLE_SIZE = 10000
+# Batches each partition may read ahead of the consumer
+QUEUE_DEPTH = 4
+# How often (seconds) a waiting consumer checks that its workers are alive
+POLL_INTERVAL = 1.0
+
+
+def sample_boundaries(partitions, sample_size=SAMPLE_SIZE):
+    """
+    Returns up to `partitions` - 1 user_ids that split user_data into
+    ranges of roughly equal size. They are quantiles of a random sample,
+    so only about `sample_size` keys cross the wire.
+    """
+    with pool.cursor() as cursor:
+        # The statistics estimate is good enough to size the sample
+        cursor.execute(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'user_data'",
+            (seed.DB_NAME,))
+        row = cursor.fetchone()
+        estimate = int(row[0] or 0) if row else 0
+
+        fraction = min(1.0, sample_size / estimate) if estimate else 1.0
+        cursor.execute("SELECT user_id FROM user_data WHERE RAND() < %s",
+                       (fraction,))
+        keys = sorted(user_id for (user_id,) in cursor.fetchall())
+
+    boundaries = []
+    for index in range(1, partitions):
+        if not keys:
+            break
+        key = keys[len(keys) * index // partitions]
+        # Duplicates would produce empty ranges
+        if not boundaries or key > boundaries[-1]:
+            boundaries.append(key)
+    return boundaries
+
+
+def partition_ranges(boundaries):
+    """Turns sorted boundaries into [low, high) ranges; None is unbounded."""
+    edges = [None, *boundaries, None]
+    return list(zip(edges, edges[1:]))
+
+
+def _range_conditions(low, high):
+    conditions = []
+    if low is not None:
+        conditions.append(("user_id >= %s", (low,)))
+    if high is not None:
+        conditions.append(("user_id < %s", (high,)))
+    return conditions
+
+
+def _put(out, stop, message):
+    """Puts into a bounded queue, giving up once the scan is stopped."""
+    while not stop.is_set():
+        try:
+            out.put(message, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _scan_partition(index, low, high, plan, batch_size, ordered, row_format,
+                    connections, out, stop):
+    """
+    Worker body: streams one key range into `out` as (index, kind, value)
+    messages, where kind is 'batch', 'error' or 'done'. Whatever happens,
+    the last message is 'done', so the consumer never waits on it forever.
+    """
+    # Process workers have no pool passed in; they use their process's
+    # own shared pool and close it when done
+    in_process = connections is None
+    try:
+        query, params = plan.sql(_range_conditions(low, high),
+                                 order_by='user_id' if ordered else None)
+        shape = plan.shaper(row_format)
+        if in_process:
+            connections = pool.get_pool()
+        with connections.cursor() as cursor:
+            cursor.execute(query, params)
+            while not stop.is_set():
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                batch = shape(batch)
+                if batch and not _put(out, stop, (index, 'batch', batch)):
+                    break
+    except BaseException as e:
+        # Not only Error: a failing `where` or row shaper ends up here too
+        _put(out, stop, (index, 'error', e))
+    finally:
+        try:
+            if in_process:
+                pool.set_pool(None)
+        finally:
+            _put(out, stop, (index, 'done', None))
+
+
+def partitioned_scan(partitions=4, batch_size=1000, ordered=False,
+                     processes=False, boundaries=None, where=None,
+                     columns=None, row_format='dict'):
+    """
+    A generator that yields batches of user_data rows read by
+    `partitions` concurrent range scans.
+
+    ordered=True yields the batches in user_id order: the partitions
+    still run concurrently, but each one buffers at most QUEUE_DEPTH
+    batches until its turn comes. ordered=False (unordered merge) yields
+    batches from whichever partition is ready first.
+
+    processes=True runs the partitions in worker processes (each with
+    its own connection) instead of threads, for jobs whose per-row work
+    is CPU-bound; `where` must then be picklable.
+
+    `boundaries` can be passed to reuse those of sample_boundaries();
+    `where`, `columns` and `row_format` work as in
+    stream_users_in_batches(). A partition that fails raises its
+    exception (usually a mysql.connector Error) here, after the other
+    partitions are stopped; a worker that dies without reporting (a
+    killed process) raises RuntimeError.
+    """
+    if boundaries is None:
+        boundaries = sample_boundaries(partitions)
+    ranges = partition_ranges(boundaries)
+    plan = filters.ScanPlan(columns, where)
+
+    if processes:
+        context = multiprocessing.get_context()
+        make_queue, stop, worker_class = context.Queue, context.Event(), context.Process
+        connections = None
+    else:
+        make_queue, stop, worker_class = queue.Queue, threading.Event(), threading.Thread
+        # A pool of its own, so no partition waits on another's
+        # connection, plus a spare slot for the KILL QUERY of a
+        # cancelled partition
+        connections = pool.ConnectionPool(size=len(ranges) + 1)
+
+    if ordered:
+        queues = [make_queue(maxsize=QUEUE_DEPTH) for _ in ranges]
+    else:
+        shared = make_queue(maxsize=QUEUE_DEPTH * len(ranges))
+        queues = [shared] * len(ranges)
+
+    workers = [
+        worker_class(target=_scan_partition,
+                     args=(index, low, high, plan, batch_size, ordered,
+                           row_format, connections, queues[index], stop),
+                     daemon=True)
+        for index, (low, high) in enumerate(ranges)
+    ]
+    for worker in workers:
+        worker.start()
+
+    def messages(source, indices):
+        pending = set(indices)
+        dead = set()
+        while pending:
+            try:
+                index, kind, value = source.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                # A worker found dead twice in a row, with nothing queued
+                # in between, will never post its 'done'
+                gone = {index for index in pending
+                        if not workers[index].is_alive()}
+                if gone & dead:
+                    index = min(gone & dead)
+                    raise RuntimeError(
+                        f"Partition {index} worker exited without finishing")
+                dead = gone
+                continue
+            if kind == 'error':
+                raise value
+            if kind == 'done':
+                pending.discard(index)
+            else:
+                yield value
+
+    try:
+        if ordered:
+            for index, source in enumerate(queues):
+                yield from messages(source, [index])
+        else:
+            yield from messages(queues[0], range(len(ranges)))
+    finally:
+        # Also runs when the consumer stops early
+        stop.set()
+        for worker in workers:
+            worker.join(timeout=5)
+            if processes and worker.is_alive():
+                worker.terminate()
+        if connections is not None:
+            connections.close()
@@ -0,0 +1,393 @@
+"""
+A small, bounded MySQL connection pool shared by the generators.
+
+Opening a MySQL connection costs a TCP round-trip plus authentication,
+which dwarfs the cost of fetching one page of users. The generators in
+this package therefore check connections out of one shared pool instead
+of connecting for every query, so a full scan of user_data reuses one or
+a few connections.
+
+    with pool.cursor(dictionary=True) as cursor:
+        cursor.execute("SELECT * FROM user_data LIMIT 10")
+        rows = cursor.fetchall()
+
+    print(pool.get_pool().stats())
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error, errorcode
+from mysql.connector.errors import PoolError
+
+seed = __import__('seed')
+
+# Pool tuning, overridable from the environment
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '4'))
+# Idle connections older than this are closed (seconds)
+IDLE_TIMEOUT = float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300'))
+# Connections idle longer than this are pinged before being handed out
+PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', '30'))
+# How long acquire() waits for a free connection before giving up
+CHECKOUT_TIMEOUT = float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', '30'))
+
+
+def connect():
+    """Opens a new connection to the ALX_prodev database."""
+    return mysql.connector.connect(
+        host=seed.DB_HOST,
+        user=seed.DB_USER,
+        password=seed.DB_PASS,
+        database=seed.DB_NAME
+    )
+
+
+def shutdown(connection, factory=connect):
+    """
+    Closes a connection that may still have unread rows without reading
+    them all, by skipping the QUIT handshake.
+
+    The C extension's connection does not implement shutdown(), and its
+    close() frees the result set, which reads every remaining row. The
+    session is therefore killed first with KILL CONNECTION, sent over a
+    connection opened with `factory`, so the server stops sending rows.
+    That costs a connect handshake, and close() still reads the rows
+    already in flight, but no more.
+    """
+    try:
+        connection.shutdown()
+        return
+    except NotImplementedError:
+        pass
+    try:
+        killer = factory()
+        try:
+            cursor = killer.cursor()
+            cursor.execute("KILL CONNECTION %s", (connection.connection_id,))
+            cursor.close()
+        finally:
+            killer.close()
+    except Error:
+        pass  # close() below still works, reading the rest of the rows
+    connection.close()
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool holding at most `size` open connections.
+
+    Idle connections are reused most-recently-used first, pinged before
+    reuse once they have been idle for `ping_after` seconds, and closed
+    once they have been idle for `idle_timeout` seconds.
+    """
+
+    def __init__(self, size=POOL_SIZE, idle_timeout=IDLE_TIMEOUT,
+                 ping_after=PING_AFTER, checkout_timeout=CHECKOUT_TIMEOUT,
+                 factory=connect):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self.checkout_timeout = checkout_timeout
+        self._factory = factory
+        self._idle = deque()  # (connection, released_at), oldest on the left
+        self._open = 0  # idle + checked out
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'creations': 0,
+            'evictions': 0,
+            'health_failures': 0,
+            'discards': 0,
+            'kills': 0,
+        }
+
+    def acquire(self, timeout=None):
+        """
+        Checks a connection out of the pool, opening a new one if the
+        pool is not full yet and waiting for a release if it is.
+        Raises PoolError if nothing frees up within `timeout` seconds.
+        """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            connection, idle_for = self._checkout(deadline)
+            if connection is None:
+                # A slot was reserved for us; open the connection outside
+                # the lock so other threads are not held up by the handshake
+                try:
+                    connection = self._factory()
+                except BaseException:
+                    self._forget()
+                    raise
+                with self._cond:
+                    self._stats['creations'] += 1
+                return connection
+
+            if idle_for < self.ping_after or self._is_healthy(connection):
+                return connection
+
+            # The server dropped it while it sat idle; try again
+            with self._cond:
+                self._stats['health_failures'] += 1
+            self._discard(connection)
+
+    def release(self, connection, discard=False):
+        """
+        Returns a connection to the pool. Connections that are broken or
+        flagged with `discard` are closed instead of being reused.
+
+        A connection that still has an unread result set (an abandoned
+        unbuffered scan) gets its query killed, so the server stops
+        producing rows, and the few rows already in flight are read off
+        before it is reused. If the kill cannot be sent it is closed.
+        """
+        if not discard and connection.unread_result:
+            # Draining without the kill could mean reading the whole table
+            discard = not (self.kill_query(connection) and
+                           self._drain(connection))
+
+        if not discard:
+            try:
+                # End the read snapshot so the next user sees fresh data
+                if connection.in_transaction:
+                    connection.rollback()
+            except Error:
+                discard = True
+
+        if discard:
+            with self._cond:
+                self._stats['discards'] += 1
+            self._discard(connection)
+            return
+
+        with self._cond:
+            self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    def kill_query(self, connection):
+        """
+        Stops the statement running on `connection` with KILL QUERY,
+        sent over another connection of the pool; the session itself
+        survives. Only an idle connection or a free slot is used, so this
+        never waits. Returns whether the kill was sent.
+        """
+        try:
+            killer = self.acquire(timeout=0)
+        except Error:  # PoolError included
+            return False
+        try:
+            cursor = killer.cursor()
+            cursor.execute("KILL QUERY %s", (connection.connection_id,))
+            cursor.close()
+        except Error:
+            self.release(killer, discard=True)
+            return False
+        self.release(killer)
+        with self._cond:
+            self._stats['kills'] += 1
+        return True
+
+    @staticmethod
+    def _drain(connection):
+        """
+        Reads what is left of a killed statement's result set. Returns
+        whether the connection came out clean.
+        """
+        try:
+            connection.consume_results()
+        except Error as e:
+            if e.errno != errorcode.ER_QUERY_INTERRUPTED:
+                return False
+        return not connection.unread_result
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and back in."""
+        connection = self.acquire()
+        try:
+            yield connection
+        except Error:
+            self.release(connection, discard=True)
+            raise
+        except BaseException:
+            # Includes GeneratorExit from a consumer that stopped early
+            self.release(connection)
+            raise
+        else:
+            self.release(connection)
+
+    @contextmanager
+    def cursor(self, **options):
+        """
+        Context manager yielding a cursor on a pooled connection. The
+        cursor is closed and the connection released on exit.
+        """
+        with self.connection() as connection:
+            cursor = connection.cursor(**options)
+            try:
+                yield cursor
+            finally:
+                # Closing a cursor with unread rows would raise; release()
+                # deals with such connections instead
+                if not connection.unread_result:
+                    cursor.close()
+
+    def stats(self):
+        """Returns a snapshot of the pool's counters and occupancy."""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update(
+                size=self.size,
+                open=self._open,
+                idle=len(self._idle),
+                in_use=self._open - len(self._idle),
+            )
+        return snapshot
+
+    def close(self):
+        """Closes every idle connection. Checked-out ones close on release."""
+        with self._cond:
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for connection in idle:
+            self._close(connection)
+
+    def _checkout(self, deadline):
+        """
+        Picks an idle connection, or reserves a slot for a new one
+        (returned as None), waiting until `deadline` if the pool is full.
+        """
+        evicted = []
+        try:
+            with self._cond:
+                self._stats['checkouts'] += 1
+                waited_since = None
+                while True:
+                    evicted.extend(self._evict_idle())
+                    if self._idle:
+                        connection, released_at = self._idle.pop()
+                        idle_for = time.monotonic() - released_at
+                        break
+                    if self._open < self.size:
+                        self._open += 1
+                        connection, idle_for = None, 0.0
+                        break
+
+                    now = time.monotonic()
+                    if waited_since is None:
+                        waited_since = now
+                        self._stats['waits'] += 1
+                    if now >= deadline:
+                        self._stats['timeouts'] += 1
+                        self._stats['wait_time'] += now - waited_since
+                        raise PoolError(
+                            f"No connection available within the checkout "
+                            f"timeout (pool size {self.size})")
+                    self._cond.wait(deadline - now)
+
+                if waited_since is not None:
+                    self._stats['wait_time'] += time.monotonic() - waited_since
+        finally:
+            # Closing takes a round-trip; not while holding the lock
+            for old in evicted:
+                self._close(old)
+        return connection, idle_for
+
+    def _evict_idle(self):
+        """
+        Takes out the connections idle for longer than idle_timeout and
+        returns them for the caller to close (lock held).
+        """
+        cutoff = time.monotonic() - self.idle_timeout
+        evicted = []
+        while self._idle and self._idle[0][1] < cutoff:
+            connection, _ = self._idle.popleft()
+            self._open -= 1
+            self._stats['evictions'] += 1
+            evicted.append(connection)
+        return evicted
+
+    def _discard(self, connection):
+        """Closes a checked-out connection and frees its slot, come what may."""
+        try:
+            self._close(connection)
+        finally:
+            self._forget()
+
+    def _forget(self):
+        """Frees the slot of a connection that was closed or never opened."""
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _is_healthy(connection):
+        try:
+            return connection.is_connected()
+        except Error:
+            return False
+
+    def _close(self, connection):
+        try:
+            if connection.unread_result:
+                shutdown(connection, self._factory)
+            else:
+                connection.close()
+        except (Error, NotImplementedError):
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _forget_pool_after_fork():
+    """
+    A forked child inherits copies of the parent's sockets. Using or
+    even closing them would corrupt the parent's sessions, so the child
+    drops the inherited pool and opens connections of its own.
+    """
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pool_after_fork)
+
+
+def get_pool():
+    """Returns the pool shared by every generator, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def set_pool(new_pool):
+    """
+    Replaces the shared pool, e.g. with one sized for a particular job.
+    Idle connections of the previous pool are closed.
+    """
+    global _pool
+    with _pool_lock:
+        old, _pool = _pool, new_pool
+    if old is not None and old is not new_pool:
+        old.close()
+
+
+def cursor(**options):
+    """Shortcut for get_pool().cursor(**options)."""
+    return get_pool().cursor(**options)
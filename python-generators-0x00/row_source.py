@@ -0,0 +1,409 @@
+"""
+Pluggable sources of user_data rows.
+
+The generators read through a RowSource instead of talking to MySQL
+directly, so the same code runs against:
+
+* MySQLSource    - ALX_prodev through the shared connection pool (default)
+* SQLiteSource   - a SQLite file with the user_data schema (synthetic.py)
+* CSVSource      - a CSV file shaped like user_data.csv
+* ColumnarSource - an export written by columnar.export_users()
+
+Each source brings its own batched fetch path: fetchmany() on a cursor
+for the databases, buffered readers for the files. Filters are compiled
+into SQL (with the backend's placeholder style) where the backend speaks
+it and evaluated in-process otherwise.
+
+The default source is chosen by set_source() or by the USER_DATA_SOURCE
+environment variable: 'mysql', 'sqlite:users.db', 'csv:user_data.csv'
+or 'columnar:users.arrow'.
+
+    source = row_source.SQLiteSource('users.db')
+    for user in stream_users(source=source):
+        ...
+"""
+import csv
+import heapq
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import partial
+from itertools import chain, islice
+from operator import itemgetter
+
+from mysql.connector import Error, errorcode
+
+cancellation = __import__('cancellation')
+filters = __import__('filters')
+instrument = __import__('instrument')
+pool = __import__('pool')
+seed = __import__('seed')
+
+# What a scan may raise, whatever the backend (OSError: missing files)
+ERRORS = (Error, sqlite3.Error, OSError)
+
+# Rows the file sources read from disk at a time
+BATCH_SIZE = 10000
+
+# SQLite virtual machine steps between two looks at a ScanHandle
+PROGRESS_STEPS = 10000
+
+
+class RowSource:
+    """
+    Base class of the row sources.
+
+    A source runs a filters.ScanPlan and passes every fetched batch of
+    tuples (the plan's columns followed by its extra filter columns)
+    through `shape`, usually plan.shaper(row_format).
+    """
+
+    # Whether filters can be compiled into the backend's queries
+    pushdown = True
+    # Parameter marker of the backend's SQL
+    placeholder = '%s'
+
+    def plan(self, columns=None, where=None):
+        """Builds the ScanPlan of a scan over this source."""
+        return filters.ScanPlan(columns, where, placeholder=self.placeholder,
+                                pushdown=self.pushdown)
+
+    def scan(self, plan, batch_size, shape=list, stats=None, handle=None,
+             **options):
+        """
+        A generator of the shaped batches of a full scan, `batch_size`
+        fetched rows at a time: an int, or an adaptive.AdaptiveBatchSize
+        that re-tunes it as the scan goes. `options` are backend hints
+        such as buffered=True or raw=True; sources without them ignore
+        them.
+
+        With a cancellation.ScanHandle as `handle`, the scan raises
+        ScanCancelled or ScanTimeout once the handle is cancelled or
+        out of time.
+        """
+        raise NotImplementedError
+
+    def page(self, plan, limit, shape=list, offset=0, order_by=(),
+             stats=None, handle=None):
+        """
+        Returns one shaped page: up to `limit` rows after skipping
+        `offset`, sorted on the `order_by` columns if any are given.
+        """
+        raise NotImplementedError
+
+
+def _fetch_page(fetch, shape, stats):
+    """Runs fetch() for a whole page and shapes it, timing both."""
+    if stats is None:
+        return shape(fetch())
+    return stats.shape(shape, stats.fetch(fetch))
+
+
+class SQLSource(RowSource):
+    """A source that runs the plan's SQL on DB-API cursors."""
+
+    def cursor(self, handle=None, **options):
+        """
+        A context manager yielding a cursor; see subclasses. While it is
+        open, `handle` (a cancellation.ScanHandle) can interrupt the
+        statement running on it.
+        """
+        raise NotImplementedError
+
+    def timed_query(self, query, seconds):
+        """
+        Returns `query` limited to `seconds` of execution, for backends
+        that can enforce that on the server. None means no limit.
+        """
+        return query
+
+    def is_timeout(self, error):
+        """Whether `error` means the server stopped a statement for time."""
+        return False
+
+    @contextmanager
+    def _cancellable(self, handle):
+        """Turns errors caused by cancelling or timeouts into their own."""
+        try:
+            yield
+        except ERRORS as e:
+            if handle is not None:
+                # Raises the handle's ScanCancelled or ScanTimeout
+                handle.check()
+            if self.is_timeout(e):
+                raise cancellation.ScanTimeout(
+                    "Statement ran past its timeout") from e
+            raise
+
+    def _execute(self, cursor, query, params, stats, handle):
+        if handle is not None:
+            query = self.timed_query(query, handle.begin_statement())
+        if stats is None:
+            cursor.execute(query, params)
+        else:
+            stats.execute(cursor, query, params)
+
+    def scan(self, plan, batch_size, shape=list, stats=None, handle=None,
+             **options):
+        query, params = plan.sql()
+        with self.cursor(handle, **options) as cursor, \
+                self._cancellable(handle):
+            self._execute(cursor, query, params, stats, handle)
+            yield from instrument.fetch_batches(
+                _checked(cursor.fetchmany, handle), batch_size, shape, stats)
+
+    def page(self, plan, limit, shape=list, offset=0, order_by=(),
+             stats=None, handle=None):
+        query, params = plan.sql(order_by=', '.join(order_by))
+        query += f" LIMIT {self.placeholder}"
+        params += (int(limit),)
+        if offset:
+            query += f" OFFSET {self.placeholder}"
+            params += (int(offset),)
+        with self.cursor(handle) as cursor, self._cancellable(handle):
+            self._execute(cursor, query, params, stats, handle)
+            return _fetch_page(cursor.fetchall, shape, stats)
+
+
+def _checked(fetch, handle):
+    """Wraps fetch(size) to stop at a batch boundary once `handle` says so."""
+    if handle is None:
+        return fetch
+
+    def checked_fetch(size):
+        handle.check()
+        return fetch(size)
+    return checked_fetch
+
+
+class MySQLSource(SQLSource):
+    """
+    user_data in MySQL, read through `connection_pool` (the shared pool
+    of pool.py by default). Scans use unbuffered cursors unless asked
+    for buffered=True. A ScanHandle stops statements with KILL QUERY and
+    limits them with the MAX_EXECUTION_TIME optimizer hint.
+    """
+
+    def __init__(self, connection_pool=None):
+        self.connection_pool = connection_pool
+
+    def __repr__(self):
+        return 'MySQLSource()'
+
+    @contextmanager
+    def cursor(self, handle=None, **options):
+        if handle is None:
+            if self.connection_pool is None:
+                cursors = pool.cursor(**options)
+            else:
+                cursors = self.connection_pool.cursor(**options)
+            with cursors as cursor:
+                yield cursor
+            return
+
+        connection_pool = self.connection_pool or pool.get_pool()
+        with connection_pool.connection() as connection:
+            cursor = connection.cursor(**options)
+            try:
+                with handle.running(
+                        partial(connection_pool.kill_query, connection)):
+                    yield cursor
+            finally:
+                # As in ConnectionPool.cursor(): release() cleans up
+                # connections with unread rows
+                if not connection.unread_result:
+                    cursor.close()
+
+    def timed_query(self, query, seconds):
+        if seconds is None:
+            return query
+        # Only honoured on SELECTs, which is all the generators send
+        hint = f"SELECT /*+ MAX_EXECUTION_TIME({max(1, int(seconds * 1000))}) */"
+        return query.replace('SELECT', hint, 1)
+
+    def is_timeout(self, error):
+        return getattr(error, 'errno', None) == errorcode.ER_QUERY_TIMEOUT
+
+
+class SQLiteSource(SQLSource):
+    """
+    user_data in a SQLite file, e.g. one made by synthetic.seed_sqlite().
+    Every scan or page opens its own connection, which for a local file
+    costs microseconds; SQLite cursors always stream, so the buffered
+    and raw hints are ignored. A ScanHandle stops statements through
+    interrupt() and a progress handler that watches its deadlines.
+    """
+
+    placeholder = '?'
+
+    def __init__(self, path):
+        self.path = path
+
+    def __repr__(self):
+        return f"SQLiteSource({self.path!r})"
+
+    @contextmanager
+    def cursor(self, handle=None, **options):
+        connection = sqlite3.connect(self.path)
+        try:
+            if handle is None:
+                yield connection.cursor()
+                return
+            # A truthy return from the handler aborts the statement
+            connection.set_progress_handler(
+                lambda: handle.cancelled or handle.expired(), PROGRESS_STEPS)
+            with handle.running(connection.interrupt):
+                yield connection.cursor()
+        finally:
+            connection.close()
+
+
+class FileSource(RowSource):
+    """
+    A read-only file of users. Files cannot evaluate filters, so the
+    whole filter runs in-process, and pages are cut from a full read:
+    O(table) per page, which is fine for offline stand-ins.
+    """
+
+    pushdown = False
+
+    def __init__(self, path):
+        self.path = path
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.path!r})"
+
+    def batches(self, columns, batch_size):
+        """A generator of lists of tuples holding `columns`, in file order."""
+        raise NotImplementedError
+
+    def _read(self, columns, handle):
+        """self.batches() at the disk batch size, watching `handle`."""
+        if handle is not None:
+            handle.begin_statement()
+        batches = self.batches(columns, BATCH_SIZE)
+        try:
+            for batch in batches:
+                if handle is not None:
+                    handle.check()
+                yield batch
+        finally:
+            batches.close()
+            if handle is not None:
+                handle.close()
+
+    def scan(self, plan, batch_size, shape=list, stats=None, handle=None,
+             **options):
+        batches = self._read(plan.columns + plan.extra, handle)
+        # Re-cut the file's batches into whatever sizes are asked for
+        rows = chain.from_iterable(batches)
+        try:
+            yield from instrument.fetch_batches(
+                lambda size: list(islice(rows, size)), batch_size, shape, stats)
+        finally:
+            batches.close()
+
+    def page(self, plan, limit, shape=list, offset=0, order_by=(),
+             stats=None, handle=None):
+        columns = plan.columns + plan.extra
+        keep = plan.row_filter() or list
+
+        def fetch():
+            batches = self._read(columns, handle)
+            try:
+                rows = (row for batch in batches for row in keep(batch))
+                if not order_by:
+                    return list(islice(rows, offset, offset + limit))
+                # Keeps only offset + limit rows in memory
+                key = itemgetter(*(columns.index(name) for name in order_by))
+                return heapq.nsmallest(offset + limit, rows, key=key)[offset:]
+            finally:
+                batches.close()
+
+        return _fetch_page(fetch, shape, stats)
+
+
+class CSVSource(FileSource):
+    """
+    A CSV file with a header row naming its columns, like user_data.csv
+    (name, email, age). Missing user_ids are derived from the email,
+    as seed.py loads them.
+    """
+
+    def batches(self, columns, batch_size):
+        with open(self.path, encoding='utf-8', newline='') as file:
+            reader = csv.reader(file)
+            header = next(reader, [])
+            position = {name: index for index, name in enumerate(header)}
+            project = itemgetter(*(filters.COLUMNS.index(name)
+                                   for name in columns))
+            if len(columns) == 1:
+                single = project
+                project = lambda row: (single(row),)
+
+            batch = []
+            for row in reader:
+                if not row:
+                    continue
+                try:
+                    email = row[position['email']]
+                    user = (row[position['user_id']] if 'user_id' in position
+                            else seed.user_id_for(email),
+                            row[position['name']], email,
+                            int(row[position['age']]))
+                except (ValueError, IndexError, KeyError):
+                    print(f"Skipping malformed row: {row}")
+                    continue
+                batch.append(project(user))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+
+class ColumnarSource(FileSource):
+    """An export written by columnar.export_users(), read through mmap."""
+
+    def batches(self, columns, batch_size):
+        # Imported here: columnar itself reads through the generators
+        columnar = __import__('columnar')
+        yield from columnar.read_batches(self.path, batch_size, columns, 'tuple')
+
+
+def open_source(spec):
+    """
+    Builds a source from a spec string: 'mysql', 'sqlite:<path>',
+    'csv:<path>' or 'columnar:<path>'.
+    """
+    kind, _, path = spec.partition(':')
+    if kind == 'mysql' and not path:
+        return MySQLSource()
+    backends = {'sqlite': SQLiteSource, 'csv': CSVSource,
+                'columnar': ColumnarSource}
+    if kind not in backends or not path:
+        raise ValueError(f"Unknown row source {spec!r}; expected 'mysql', "
+                         f"'sqlite:<path>', 'csv:<path>' or 'columnar:<path>'")
+    return backends[kind](path)
+
+
+_source = None
+_source_lock = threading.Lock()
+
+
+def get_source():
+    """Returns the default source, built from USER_DATA_SOURCE on first use."""
+    global _source
+    if _source is None:
+        with _source_lock:
+            if _source is None:
+                _source = open_source(os.getenv('USER_DATA_SOURCE', 'mysql'))
+    return _source
+
+
+def set_source(new_source):
+    """Replaces the default source; None goes back to USER_DATA_SOURCE."""
+    global _source
+    with _source_lock:
+        _source = new_source
@@ -0,0 +1,130 @@
+"""
+Row representations for the user_data generators.
+
+The generators fetch plain tuples from MySQL and shape them according to
+their `row_format` argument:
+
+* 'dict'    - a fresh dict per row, as mysql.connector's dictionary
+              cursor would build (the default).
+* 'compact' - a tuple subclass with empty __slots__, so each row costs
+              one tuple. Fields are read as row.age, row[3] or, for
+              compatibility with the dict rows, row['age'].
+* 'tuple'   - plain tuples; field positions follow the column list
+              (see column_index()).
+"""
+from functools import partial
+
+ROW_FORMATS = ('dict', 'compact', 'tuple')
+
+
+class CompactRow(tuple):
+    """
+    Base class of the compact row types built by row_class(). It adds
+    dict-style access by column name on top of a plain tuple.
+    """
+
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+
+    @classmethod
+    def _make(cls, iterable):
+        """Builds a row from any iterable of field values."""
+        return tuple.__new__(cls, iterable)
+
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def __contains__(self, key):
+        # Like a dict: membership tests the column names
+        return key in self._index
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={value!r}"
+                           for name, value in zip(self._fields, self))
+        return f"{type(self).__name__}({fields})"
+
+    def __reduce__(self):
+        # The classes are built at runtime, so pickle by column list
+        return _rebuild, (self._fields, tuple(self))
+
+    def get(self, key, default=None):
+        index = self._index.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return tuple(zip(self._fields, self))
+
+    def _asdict(self):
+        return dict(zip(self._fields, self))
+
+
+_row_classes = {}
+
+
+def row_class(columns):
+    """
+    Returns the CompactRow subclass for a column list. Classes are
+    cached, so every row of a scan shares one class and one name index.
+    """
+    columns = tuple(columns)
+    cls = _row_classes.get(columns)
+    if cls is None:
+        namespace = {
+            '__slots__': (),
+            '_fields': columns,
+            '_index': {name: position for position, name in enumerate(columns)},
+        }
+        for position, name in enumerate(columns):
+            namespace[name] = property(
+                partial(_field, position), doc=f"Column {name!r}")
+        cls = _row_classes[columns] = type('UserRow', (CompactRow,), namespace)
+    return cls
+
+
+def _field(position, row):
+    return tuple.__getitem__(row, position)
+
+
+def _rebuild(columns, values):
+    return tuple.__new__(row_class(columns), values)
+
+
+def column_index(columns):
+    """Maps column names to their positions in 'tuple' rows."""
+    return {name: position for position, name in enumerate(columns)}
+
+
+def formatter(columns, row_format='dict', trim=False):
+    """
+    Returns a function that turns a list of fetched tuples into a list
+    of rows in `row_format`. With trim=True the tuples may carry extra
+    trailing fields (e.g. fetched only for filtering), which are dropped.
+    """
+    columns = tuple(columns)
+    width = len(columns)
+
+    if row_format == 'dict':
+        # zip() stops at the shorter side, which trims the extras
+        return lambda batch: [dict(zip(columns, row)) for row in batch]
+
+    if row_format == 'compact':
+        make = partial(tuple.__new__, row_class(columns))
+        if trim:
+            return lambda batch: [make(row[:width]) for row in batch]
+        return lambda batch: list(map(make, batch))
+
+    if row_format == 'tuple':
+        if trim:
+            return lambda batch: [tuple(row[:width]) for row in batch]
+        return list
+
+    raise ValueError(f"Unknown row format {row_format!r}; expected one of {ROW_FORMATS}")
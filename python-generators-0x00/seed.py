@@ -2,7 +2,11 @@ import mysql.connector
 from mysql.connector import Error, errorcode
 import os
 import csv
-import uuid 
+import json
+import queue
+import threading
+import time
+import uuid
 
 # --- Database Credentials ---
 DB_HOST = os.getenv('DB_HOST', 'localhost')
@@ -10,6 +14,32 @@ DB_USER = os.getenv('DB_USER', 'root')
 DB_PASS = os.getenv('DB_PASS', '')
 DB_NAME = 'ALX_prodev'
 
+# Rows sent and committed together by the loaders
+CHUNK_SIZE = 5000
+
+INSERT_QUERY = """
+INSERT IGNORE INTO user_data (user_id, name, email, age)
+VALUES (%s, %s, %s, %s);
+"""
+
+# Inserts new emails and rewrites name and age of known ones; the
+# user_id of an existing row is kept
+UPSERT_QUERY = """
+INSERT INTO user_data (user_id, name, email, age)
+VALUES (%s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE name = VALUES(name), age = VALUES(age);
+"""
+
+# user_ids are derived from the email, so loading the same file twice
+# gives every user the same id
+USER_NAMESPACE = uuid.UUID('0b3c1a6e-5f1d-4c36-9a53-3f6f0c1e2d7a')
+
+# Emails held by more than one row, which block the unique email index
+DUPLICATE_EMAILS_QUERY = """
+SELECT email, COUNT(*) FROM user_data
+GROUP BY email HAVING COUNT(*) > 1
+"""
+
 
 def connect_db():
     """Connects to the MySQL database server."""
@@ -57,7 +87,16 @@ def connect_to_prodev():
 
 
 def create_table(connection):
-    """Creates a table user_data if it does not exist."""
+    """
+    Creates a table user_data if it does not exist.
+
+    updated_at records when each row was last inserted or changed, and
+    its index lets incremental.stream_changes() read only the rows that
+    changed since its last run. Emails are unique, which is what
+    upsert_data() keys on. Tables created before the column or the key
+    existed are upgraded in place, unless they hold duplicate emails:
+    those are reported, and dedupe_emails() removes them on request.
+    """
     try:
         cursor = connection.cursor()
         create_table_query = """
@@ -65,53 +104,180 @@ def create_table(connection):
             user_id CHAR(36) PRIMARY KEY,
             name VARCHAR(255) NOT NULL,
             email VARCHAR(255) NOT NULL,
-            age DECIMAL(3, 0) NOT NULL
+            age DECIMAL(3, 0) NOT NULL,
+            updated_at TIMESTAMP(6) NOT NULL
+                DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+            INDEX idx_user_data_updated_at (updated_at, user_id),
+            UNIQUE INDEX uq_user_data_email (email)
         );
         """
         cursor.execute(create_table_query)
+        _add_change_tracking(cursor)
+        _add_email_key(cursor)
         print("Table user_data created successfully")
         cursor.close()
     except Error as e:
         print(f"Error creating table: {e}")
 
 
-def insert_data(connection, data_file):
+def _add_change_tracking(cursor):
+    """Adds updated_at and its index to a user_data table that lacks them."""
+    upgrades = [
+        ("""
+        ALTER TABLE user_data ADD COLUMN updated_at TIMESTAMP(6) NOT NULL
+            DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+        """, errorcode.ER_DUP_FIELDNAME),
+        ("""
+        ALTER TABLE user_data
+            ADD INDEX idx_user_data_updated_at (updated_at, user_id);
+        """, errorcode.ER_DUP_KEYNAME),
+    ]
+    for statement, already_done in upgrades:
+        try:
+            cursor.execute(statement)
+        except Error as e:
+            if e.errno != already_done:
+                raise
+
+
+def _add_email_key(cursor):
+    """
+    Adds the unique email index to a user_data table that lacks it.
+    Tables holding duplicate emails from earlier seeds are left alone:
+    this raises an Error naming some of them, and dedupe_emails() is
+    the explicit way to remove them first.
+    """
+    cursor.execute("""
+    SELECT COUNT(*) FROM information_schema.statistics
+    WHERE table_schema = DATABASE() AND table_name = 'user_data'
+        AND index_name = 'uq_user_data_email';
+    """)
+    (exists,) = cursor.fetchone()
+    if exists:
+        return
+    cursor.execute(DUPLICATE_EMAILS_QUERY + " LIMIT 5;")
+    duplicates = cursor.fetchall()
+    if duplicates:
+        named = ', '.join(f"{email} ({count} rows)"
+                          for email, count in duplicates)
+        raise Error(msg=(
+            f"user_data holds duplicate emails, e.g. {named}; cannot add "
+            f"the unique email index. Run seed.dedupe_emails(connection) "
+            f"to keep one row per email, then create_table() again."))
+    cursor.execute("""
+    ALTER TABLE user_data ADD UNIQUE INDEX uq_user_data_email (email);
+    """)
+
+
+def dedupe_emails(connection):
+    """
+    Deletes all but one row of every email that appears more than once,
+    so create_table() can add the unique email index.
+
+    The row kept is the one with the smallest user_id. Rows seeded
+    before user_ids were derived from the email carry random ids (and
+    the same updated_at, set when change tracking was added), so which
+    of them survives is arbitrary; the names and ages of the others are
+    lost. Returns the number of rows deleted, or None on error.
+    """
+    try:
+        cursor = connection.cursor()
+        # One grouping pass over the table, then one join against the
+        # (small) set of duplicated emails
+        cursor.execute("""
+        DELETE user_data FROM user_data
+        JOIN (
+            SELECT email, MIN(user_id) AS kept_id FROM user_data
+            GROUP BY email HAVING COUNT(*) > 1
+        ) AS duplicates ON duplicates.email = user_data.email
+        WHERE user_data.user_id <> duplicates.kept_id;
+        """)
+        removed = cursor.rowcount
+        connection.commit()
+        cursor.close()
+        print(f"Removed {removed} duplicate users")
+        return removed
+    except Error as e:
+        print(f"Error removing duplicate users: {e}")
+        return None
+
+
+def user_id_for(email):
+    """The user_id a CSV row with this email is loaded under."""
+    return str(uuid.uuid5(USER_NAMESPACE, email))
+
+
+def _user_id_sql(email):
+    """
+    A MySQL expression computing user_id_for() of the SQL expression
+    `email`, for loads the server parses itself: a uuid5 is the SHA-1 of
+    the namespace bytes and the UTF-8 name, cut to 16 bytes, with the
+    version and variant bits set.
+    """
+    digest = (f"SHA1(CONCAT(UNHEX('{USER_NAMESPACE.hex}'), "
+              f"CONVERT({email} USING utf8mb4)))")
+    return (f"CONCAT(SUBSTR({digest}, 1, 8), '-', SUBSTR({digest}, 9, 4), "
+            f"'-5', SUBSTR({digest}, 14, 3), '-', "
+            f"LOWER(HEX(CONV(SUBSTR({digest}, 17, 2), 16, 10) & 0x3F | 0x80)), "
+            f"SUBSTR({digest}, 19, 2), '-', SUBSTR({digest}, 21, 12))")
+
+
+def iter_csv_rows(data_file):
+    """
+    Lazily reads a 3-COLUMN CSV file (name, email, age) and yields
+    (user_id, name, email, age) tuples, with the user_id derived from
+    the email. Only one row is held in memory at a time.
+    """
+    with open(data_file, mode='r', encoding='utf-8', newline='') as file:
+        csv_reader = csv.reader(file)
+        next(csv_reader, None)  # Skip header
+
+        for row in csv_reader:
+            try:
+                if row:
+                    # row[0] is name, row[1] is email, row[2] is age
+                    user_id = user_id_for(row[1])  # Generate the missing user_id
+                    yield (user_id, row[0], row[1], int(row[2]))
+            except (ValueError, IndexError):
+                # This will catch rows with missing age, etc.
+                print(f"Skipping malformed row: {row}")
+
+
+def iter_chunks(rows, chunk_size=CHUNK_SIZE):
+    """Groups an iterable of rows into numbered (index, list) chunks."""
+    chunk = []
+    index = 0
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield index, chunk
+            index += 1
+            chunk = []
+    if chunk:
+        yield index, chunk
+
+
+def insert_data(connection, data_file, chunk_size=CHUNK_SIZE):
     """
     Inserts data from a 3-COLUMN CSV file (name, email, age)
-    and generates a UUID for the user_id.
+    and generates a UUID for the user_id. Emails already in the table
+    are skipped; upsert_data() updates them instead.
+
+    The file is parsed lazily and committed every `chunk_size` rows, so
+    memory does not grow with the file and a bad chunk only rolls back
+    its own rows.
     """
     try:
         cursor = connection.cursor()
-        
-        insert_query = """
-        INSERT IGNORE INTO user_data (user_id, name, email, age)
-        VALUES (%s, %s, %s, %s);
-        """
-        
-        data_to_insert = []
-        with open(data_file, mode='r', encoding='utf-8') as file:
-            csv_reader = csv.reader(file)
-            next(csv_reader)  # Skip header
-            
-            for row in csv_reader:
-                try:
-                    if row: 
-                        # row[0] is name, row[1] is email, row[2] is age
-                        user_id = str(uuid.uuid4()) # Generate the missing user_id
-                        name = row[0]
-                        email = row[1]
-                        age = int(row[2])
-                        
-                        # Add the 4-column tuple
-                        data_to_insert.append((user_id, name, email, age))
-                except (ValueError, IndexError):
-                    # This will catch rows with missing age, etc.
-                    print(f"Skipping malformed row: {row}")
-
-        if data_to_insert:
-            cursor.executemany(insert_query, data_to_insert)
-            connection.commit()
-        
+
+        for index, chunk in iter_chunks(iter_csv_rows(data_file), chunk_size):
+            try:
+                cursor.executemany(INSERT_QUERY, chunk)
+                connection.commit()
+            except Error as e:
+                print(f"Error inserting chunk {index}: {e}")
+                connection.rollback()
+
         cursor.close()
 
     except Error as e:
@@ -121,4 +287,291 @@ def insert_data(connection, data_file):
         print(f"Error: The file {data_file} was not found.")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
-        connection.rollback()
\ No newline at end of file
+        connection.rollback()
+
+
+def _classify_chunk(cursor, chunk):
+    """
+    Splits a chunk into rows to write and counts what they would do.
+    Looks up the chunk's emails in one query; returns (rows, counts),
+    where rows holds only the new and changed users. A file that repeats
+    an email within the chunk keeps its last row.
+    """
+    latest = {row[2]: row for row in chunk}
+    placeholders = ', '.join(['%s'] * len(latest))
+    cursor.execute(f"SELECT email, name, age FROM user_data "
+                   f"WHERE email IN ({placeholders})", tuple(latest))
+    stored = {email: (name, int(age)) for email, name, age in cursor}
+
+    rows = []
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    for user_id, name, email, age in latest.values():
+        current = stored.get(email)
+        if current is None:
+            counts['inserted'] += 1
+        elif current != (name, age):
+            counts['updated'] += 1
+        else:
+            counts['unchanged'] += 1
+            continue
+        rows.append((user_id, name, email, age))
+    return rows, counts
+
+
+def upsert_data(connection, data_file, chunk_size=CHUNK_SIZE):
+    """
+    Idempotent version of insert_data(): loads a 3-COLUMN CSV file
+    (name, email, age) keyed on email, inserting new users and updating
+    the name and age of known ones.
+
+    Every chunk first looks up which of its emails exist and how, so
+    only new and changed rows are sent to the server; re-seeding the
+    same file costs one indexed lookup per chunk and writes nothing.
+
+    Returns a dict with the inserted, updated and unchanged row counts
+    and the failed chunks, or None if the file could not be read.
+    """
+    totals = {'inserted': 0, 'updated': 0, 'unchanged': 0,
+              'failed_chunks': 0}
+    try:
+        cursor = connection.cursor()
+
+        for index, chunk in iter_chunks(iter_csv_rows(data_file), chunk_size):
+            try:
+                rows, counts = _classify_chunk(cursor, chunk)
+                if rows:
+                    cursor.executemany(UPSERT_QUERY, rows)
+                connection.commit()
+            except Error as e:
+                print(f"Error upserting chunk {index}: {e}")
+                connection.rollback()
+                totals['failed_chunks'] += 1
+            else:
+                for name, count in counts.items():
+                    totals[name] += count
+
+        cursor.close()
+
+    except Error as e:
+        print(f"Error upserting data: {e}")
+        connection.rollback()
+        return None
+    except FileNotFoundError:
+        print(f"Error: The file {data_file} was not found.")
+        return None
+
+    print(f"Upserted {data_file}: {totals['inserted']} inserted, "
+          f"{totals['updated']} updated, {totals['unchanged']} unchanged, "
+          f"{totals['failed_chunks']} chunks failed")
+    return totals
+
+
+class LoadCheckpoint:
+    """
+    Records which chunks of a CSV file have been committed, in a JSON
+    file next to it, so an interrupted bulk_load() can skip them.
+    The checkpoint is only honoured for the same file contents (size and
+    modification time) and the same chunk size.
+    """
+
+    def __init__(self, data_file, chunk_size):
+        self.path = f"{data_file}.checkpoint"
+        stat = os.stat(data_file)
+        self.identity = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'chunk_size': chunk_size,
+        }
+        self.done = set()
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Reads the committed chunks of a previous run, if it matches."""
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                saved = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return
+        if saved.get('identity') == self.identity:
+            self.done = set(saved.get('done', []))
+        else:
+            print(f"Ignoring stale checkpoint {self.path}")
+
+    def mark_done(self, index):
+        """Records a committed chunk; written atomically to survive crashes."""
+        with self._lock:
+            self.done.add(index)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump({'identity': self.identity,
+                           'done': sorted(self.done)}, file)
+            os.replace(tmp_path, self.path)
+
+    def reset(self):
+        self.done = set()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _LoadTotals:
+    """Thread-safe counters shared by the bulk_load() workers."""
+
+    def __init__(self):
+        self.counts = {'rows': 0, 'chunks': 0, 'skipped_chunks': 0,
+                       'failed_chunks': 0}
+        self._lock = threading.Lock()
+
+    def add(self, name, amount):
+        with self._lock:
+            self.counts[name] += amount
+
+
+def _load_worker(chunks, checkpoint, totals):
+    """
+    Worker thread for bulk_load(): commits chunks from the queue over
+    its own connection until it receives None.
+    """
+    connection = connect_to_prodev()
+    cursor = connection.cursor() if connection else None
+    try:
+        while True:
+            item = chunks.get()
+            if item is None:
+                break
+            index, chunk = item
+            if cursor is None:
+                # Keep draining so the producer is never left blocked
+                totals.add('failed_chunks', 1)
+                continue
+            try:
+                cursor.executemany(INSERT_QUERY, chunk)
+                connection.commit()
+            except Error as e:
+                print(f"Error inserting chunk {index}: {e}")
+                connection.rollback()
+                totals.add('failed_chunks', 1)
+            else:
+                checkpoint.mark_done(index)
+                totals.add('rows', len(chunk))
+                totals.add('chunks', 1)
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
+
+
+def bulk_load(data_file, chunk_size=CHUNK_SIZE, workers=1, resume=True):
+    """
+    Streams a 3-COLUMN CSV file (name, email, age) into user_data.
+
+    The file is parsed lazily and split into chunks of `chunk_size` rows
+    that `workers` threads insert in parallel, each over its own
+    connection and each committing its chunk on its own. Committed chunks
+    are checkpointed, so re-running after a crash resumes where the load
+    stopped; pass resume=False to start from scratch.
+
+    Returns a dict with the rows loaded, chunk counts and rows per second.
+    """
+    try:
+        checkpoint = LoadCheckpoint(data_file, chunk_size)
+    except FileNotFoundError:
+        print(f"Error: The file {data_file} was not found.")
+        return None
+    if resume:
+        checkpoint.load()
+    else:
+        checkpoint.reset()
+
+    totals = _LoadTotals()
+    # Bounded, so parsing never runs far ahead of the inserts
+    chunks = queue.Queue(maxsize=workers * 2)
+    threads = [threading.Thread(target=_load_worker,
+                                args=(chunks, checkpoint, totals))
+               for _ in range(workers)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        for index, chunk in iter_chunks(iter_csv_rows(data_file), chunk_size):
+            if index in checkpoint.done:
+                totals.add('skipped_chunks', 1)
+                continue
+            chunks.put((index, chunk))
+    finally:
+        for _ in threads:
+            chunks.put(None)
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    report = dict(totals.counts)
+    report['seconds'] = elapsed
+    report['rows_per_sec'] = report['rows'] / elapsed if elapsed else 0.0
+    print(f"Loaded {report['rows']} rows in {elapsed:.2f}s "
+          f"({report['rows_per_sec']:.0f} rows/s, "
+          f"{report['skipped_chunks']} chunks already loaded, "
+          f"{report['failed_chunks']} failed)")
+    return report
+
+
+def load_data_infile(data_file):
+    """
+    Fast path for bulk loading: hands the whole CSV file to the server
+    with LOAD DATA LOCAL INFILE, which parses and inserts it without a
+    Python round-trip per row. The server derives the user_ids from the
+    emails exactly as user_id_for() does, and emails already in the
+    table are skipped. Requires local_infile to be enabled on the server.
+
+    Returns the number of rows loaded, or None on failure.
+    """
+    connection = None
+    cursor = None
+    try:
+        # The server needs to know how the lines end
+        with open(data_file, 'rb') as file:
+            first_line = file.readline()
+        line_end = '\\r\\n' if first_line.endswith(b'\r\n') else '\\n'
+
+        connection = mysql.connector.connect(
+            host=DB_HOST,
+            user=DB_USER,
+            password=DB_PASS,
+            database=DB_NAME,
+            allow_local_infile=True
+        )
+        cursor = connection.cursor()
+
+        start = time.perf_counter()
+        cursor.execute(f"""
+        LOAD DATA LOCAL INFILE %s
+        INTO TABLE user_data
+        CHARACTER SET utf8mb4
+        FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"'
+        LINES TERMINATED BY '{line_end}'
+        IGNORE 1 LINES
+        (name, @email, @age)
+        SET user_id = {_user_id_sql('@email')}, email = @email, age = @age;
+        """, (os.path.abspath(data_file),))
+        rows = cursor.rowcount
+        connection.commit()
+        elapsed = time.perf_counter() - start
+
+        print(f"Loaded {rows} rows in {elapsed:.2f}s "
+              f"({rows / elapsed if elapsed else 0:.0f} rows/s)")
+        return rows
+
+    except Error as e:
+        print(f"Error loading data: {e}")
+        if connection:
+            connection.rollback()
+        return None
+    except FileNotFoundError:
+        print(f"Error: The file {data_file} was not found.")
+        return None
+    finally:
+        if cursor:
+            cursor.close()
+        if connection:
+            connection.close()
@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+"""
+Memory-mapped, fixed-width snapshots of user_data.
+
+dump_snapshot() copies user_data once (over a seed.py connection) into a
+single file that later jobs read at disk speed, without touching MySQL:
+
+    header   magic, version, record size, row count, section offsets
+    records  one fixed-width record per row: user_id, age, and the
+             offset and length of name and email in the string heap
+    heap     the UTF-8 names and emails, back to back
+
+Because every record has the same width, row N lives at a computable
+offset, so random access is O(1) and scans read straight out of the
+memory map. Usage:
+
+    ./snapshot.py dump user_data.snap
+    ./snapshot.py average user_data.snap
+"""
+import mmap
+import os
+import shutil
+import struct
+import sys
+from decimal import Decimal
+
+from mysql.connector import Error
+
+seed = __import__('seed')
+rows_module = __import__('rows')
+
+COLUMNS = ('user_id', 'name', 'email', 'age')
+MAGIC = b'USERSNAP'
+VERSION = 1
+# magic, version, record size, rows, records offset, heap offset
+HEADER = struct.Struct('<8sIIQQQ')
+# user_id, age, name offset, name length, email offset, email length
+RECORD = struct.Struct('<36sHQIQI')
+# Only the age of a record, skipping the other fields
+AGE_ONLY = struct.Struct('<36xH24x')
+FETCH_SIZE = 10000
+
+
+def dump_snapshot(path, fetch_size=FETCH_SIZE):
+    """
+    Copies user_data into a snapshot file at `path` and returns the
+    number of rows written. The rows are streamed, and the file only
+    replaces an older snapshot once it is complete.
+    """
+    tmp_path = f"{path}.tmp"
+    heap_path = f"{path}.heap"
+    connection = seed.connect_to_prodev()
+    if not connection:
+        return None
+
+    rows = 0
+    heap_size = 0
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT {', '.join(COLUMNS)} FROM user_data")
+
+        with open(tmp_path, 'wb') as records, open(heap_path, 'wb') as heap:
+            records.write(b'\0' * HEADER.size)  # Filled in at the end
+            while True:
+                batch = cursor.fetchmany(fetch_size)
+                if not batch:
+                    break
+                packed = []
+                strings = []
+                for user_id, name, email, age in batch:
+                    name = name.encode('utf-8')
+                    email = email.encode('utf-8')
+                    packed.append(RECORD.pack(
+                        user_id.encode('ascii'), int(age),
+                        heap_size, len(name),
+                        heap_size + len(name), len(email)))
+                    strings.append(name)
+                    strings.append(email)
+                    heap_size += len(name) + len(email)
+                records.write(b''.join(packed))
+                heap.write(b''.join(strings))
+                rows += len(batch)
+        cursor.close()
+
+        heap_offset = HEADER.size + rows * RECORD.size
+        with open(tmp_path, 'r+b') as snapshot:
+            snapshot.write(HEADER.pack(MAGIC, VERSION, RECORD.size, rows,
+                                       HEADER.size, heap_offset))
+            snapshot.seek(heap_offset)
+            with open(heap_path, 'rb') as heap:
+                shutil.copyfileobj(heap, snapshot)
+        os.replace(tmp_path, path)
+        return rows
+
+    except Error as e:
+        print(f"Error while taking the snapshot: {e}")
+        return None
+    finally:
+        connection.close()
+        for leftover in (tmp_path, heap_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+class Snapshot:
+    """
+    Read-only view of a snapshot file. Rows can be read by number
+    (snapshot[42]) or scanned in order; nothing is loaded up front.
+    """
+
+    def __init__(self, path, row_format='dict'):
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, rows, records, heap = \
+            HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError(f"{path} is not a version {VERSION} user_data snapshot")
+        self.rows = rows
+        self._view = memoryview(self._map)
+        self._records = self._view[records:heap]
+        self._heap = self._view[heap:]
+        self._shape = rows_module.formatter(COLUMNS, row_format)
+
+    def __len__(self):
+        return self.rows
+
+    def _decode(self, record):
+        user_id, age, name_at, name_len, email_at, email_len = record
+        heap = self._heap
+        return (user_id.decode('ascii').rstrip('\0'),
+                str(heap[name_at:name_at + name_len], 'utf-8'),
+                str(heap[email_at:email_at + email_len], 'utf-8'),
+                age)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.rows
+        if not 0 <= index < self.rows:
+            raise IndexError("snapshot row out of range")
+        record = RECORD.unpack_from(self._records, index * RECORD.size)
+        return self._shape([self._decode(record)])[0]
+
+    def __iter__(self):
+        for batch in self.iter_batches():
+            yield from batch
+
+    def iter_batches(self, batch_size=FETCH_SIZE):
+        """Yields the rows in batches (lists), in snapshot order."""
+        for start in range(0, self.rows, batch_size):
+            stop = min(start + batch_size, self.rows)
+            records = RECORD.iter_unpack(
+                self._records[start * RECORD.size:stop * RECORD.size])
+            yield self._shape([self._decode(record) for record in records])
+
+    def ages(self):
+        """Iterates over the ages only, unpacked in C without building rows."""
+        for (age,) in AGE_ONLY.iter_unpack(self._records):
+            yield age
+
+    def close(self):
+        self._records.release()
+        self._heap.release()
+        self._view.release()
+        self._map.close()
+
+
+def stream_users_from_snapshot(path, row_format='dict'):
+    """
+    A generator that yields the rows of a snapshot one by one, like
+    stream_users() does for the live table.
+    """
+    snapshot = Snapshot(path, row_format)
+    try:
+        yield from snapshot
+    finally:
+        snapshot.close()
+
+
+def snapshot_average_age(path):
+    """calculate_average_age() over a snapshot; the same exact Decimal."""
+    snapshot = Snapshot(path)
+    try:
+        if not snapshot.rows:
+            return Decimal(0)
+        return Decimal(sum(snapshot.ages())) / Decimal(snapshot.rows)
+    finally:
+        snapshot.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ('dump', 'average'):
+        print(f"Usage: {sys.argv[0]} dump|average <snapshot file>")
+        sys.exit(1)
+
+    if sys.argv[1] == 'dump':
+        count = dump_snapshot(sys.argv[2])
+        if count is not None:
+            print(f"Wrote {count} rows to {sys.argv[2]}")
+    else:
+        print(f"Average age of users: {snapshot_average_age(sys.argv[2]):.2f}")
@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+"""
+Deterministic synthetic users for benchmarks.
+
+The same seed always produces the same users (ids included), so two
+databases filled to the same size hold identical tables and benchmark
+runs stay comparable. Usage:
+
+    ./synthetic.py csv <file> <size> [seed]     CSV shaped like user_data.csv
+    ./synthetic.py mysql <size> [seed]          fills database ALX_prodev_bench_<size>
+    ./synthetic.py sqlite <file> <size> [seed]  SQLite stand-in, same schema
+
+Sizes may be written as 10k, 1M, 10M or plain integers.
+"""
+import csv
+import random
+import sqlite3
+import sys
+import uuid
+
+import mysql.connector
+from mysql.connector import Error
+
+seed = __import__('seed')
+
+# Sizes the benchmark harness runs by default
+SIZES = ('10k', '1M', '10M')
+# Seed used when none is given
+DEFAULT_SEED = 0
+
+FIRST_NAMES = (
+    'Ada', 'Alan', 'Barbara', 'Claude', 'Dennis', 'Edsger', 'Frances',
+    'Grace', 'Guido', 'Hedy', 'Ken', 'Linus', 'Margaret', 'Niklaus',
+    'Radia', 'Tim',
+)
+LAST_NAMES = (
+    'Allen', 'Hopper', 'Kernighan', 'Knuth', 'Lamarr', 'Liskov',
+    'Lovelace', 'Perlman', 'Ritchie', 'Rossum', 'Shannon', 'Thompson',
+    'Torvalds', 'Turing', 'Wirth', 'Dijkstra',
+)
+DOMAINS = ('example.com', 'example.org', 'example.net')
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id CHAR(36) PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    age DECIMAL(3, 0) NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+        DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+);
+CREATE INDEX IF NOT EXISTS idx_user_data_updated_at
+    ON user_data (updated_at, user_id);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_user_data_email ON user_data (email);
+"""
+
+SQLITE_INSERT_QUERY = """
+INSERT OR IGNORE INTO user_data (user_id, name, email, age)
+VALUES (?, ?, ?, ?);
+"""
+
+
+def parse_size(text):
+    """Turns '10k', '1M' or '2500' into a row count."""
+    text = str(text).strip()
+    multiplier = {'k': 1000, 'm': 1000000}.get(text[-1:].lower())
+    if multiplier:
+        return int(float(text[:-1]) * multiplier)
+    return int(text)
+
+
+def synthetic_users(count, rng_seed=DEFAULT_SEED, start=0):
+    """
+    Yields users `start` to `count` - 1 of the sequence for `rng_seed` as
+    (user_id, name, email, age) tuples. Emails are unique; ages are
+    spread over 18-100.
+    """
+    rng = random.Random(rng_seed)
+    for i in range(count):
+        # Draw for every user, skipped or not, so user i never changes
+        bits = rng.getrandbits(128)
+        first = FIRST_NAMES[bits & 15]
+        last = LAST_NAMES[bits >> 4 & 15]
+        age = 18 + (bits >> 8) % 83
+        if i < start:
+            continue
+        yield (str(uuid.UUID(int=bits, version=4)), f"{first} {last}",
+               f"{first}.{last}.{i}@{DOMAINS[i % len(DOMAINS)]}".lower(), age)
+
+
+def write_csv(path, count, rng_seed=DEFAULT_SEED):
+    """Writes `count` users to a CSV file that seed.py can load."""
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file, quoting=csv.QUOTE_ALL)
+        writer.writerow(('name', 'email', 'age'))
+        for _, name, email, age in synthetic_users(count, rng_seed):
+            writer.writerow((name, email, age))
+    return count
+
+
+def top_up(connection, count, rng_seed=DEFAULT_SEED, insert_query=None,
+           chunk_size=seed.CHUNK_SIZE):
+    """
+    Inserts the synthetic users user_data is missing, so it holds at
+    least `count` rows. Works with MySQL and SQLite connections; pass
+    SQLITE_INSERT_QUERY for the latter. Returns the final row count.
+    """
+    if insert_query is None:
+        insert_query = seed.INSERT_QUERY
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM user_data")
+    (existing,) = cursor.fetchone()
+
+    if existing < count:
+        print(f"Seeding {count - existing} synthetic users...")
+        for _, chunk in seed.iter_chunks(
+                synthetic_users(count, rng_seed, start=existing), chunk_size):
+            cursor.executemany(insert_query, chunk)
+            connection.commit()
+            existing += len(chunk)
+
+    cursor.close()
+    return existing
+
+
+def database_name(count):
+    """The MySQL database that holds `count` synthetic users."""
+    return f"{seed.DB_NAME}_bench_{count}"
+
+
+def connect_bench(count):
+    """Opens a connection to the synthetic database for `count` users."""
+    return mysql.connector.connect(
+        host=seed.DB_HOST,
+        user=seed.DB_USER,
+        password=seed.DB_PASS,
+        database=database_name(count)
+    )
+
+
+def seed_mysql(count, rng_seed=DEFAULT_SEED):
+    """
+    Creates database_name(count) with the user_data schema from seed.py
+    and fills it with `count` synthetic users. ALX_prodev itself is left
+    alone. Returns the row count, or None on failure.
+    """
+    connection = seed.connect_db()
+    if not connection:
+        return None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database_name(count)}")
+        cursor.close()
+        connection.database = database_name(count)
+        seed.create_table(connection)
+        return top_up(connection, count, rng_seed)
+    except Error as e:
+        print(f"Error seeding {database_name(count)}: {e}")
+        return None
+    finally:
+        connection.close()
+
+
+def seed_sqlite(path, count, rng_seed=DEFAULT_SEED):
+    """
+    Creates (or tops up) a SQLite database at `path` with the same
+    user_data schema and `count` synthetic users. Returns the row count.
+    """
+    connection = sqlite3.connect(path)
+    try:
+        connection.executescript(SQLITE_SCHEMA)
+        return top_up(connection, count, rng_seed, SQLITE_INSERT_QUERY)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    usage = (f"Usage: {sys.argv[0]} csv <file> <size> [seed] | "
+             f"mysql <size> [seed] | sqlite <file> <size> [seed]")
+    args = sys.argv[1:]
+    try:
+        if args[0] == 'csv' and len(args) in (3, 4):
+            count = write_csv(args[1], parse_size(args[2]),
+                              int(args[3]) if len(args) == 4 else DEFAULT_SEED)
+            print(f"Wrote {count} users to {args[1]}")
+        elif args[0] == 'mysql' and len(args) in (2, 3):
+            count = seed_mysql(parse_size(args[1]),
+                               int(args[2]) if len(args) == 3 else DEFAULT_SEED)
+            if count is not None:
+                print(f"{database_name(parse_size(args[1]))} holds {count} users")
+        elif args[0] == 'sqlite' and len(args) in (3, 4):
+            count = seed_sqlite(args[1], parse_size(args[2]),
+                                int(args[3]) if len(args) == 4 else DEFAULT_SEED)
+            print(f"{args[1]} holds {count} users")
+        else:
+            raise IndexError
+    except (IndexError, ValueError):
+        print(usage)
+        sys.exit(1)